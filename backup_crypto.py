@@ -0,0 +1,249 @@
+"""
+🔐 ШИФРУВАННЯ БЕКАПІВ
+Файли шифруються AES-256-CTR (TgCrypto) потоково, частинами по 1 МБ, тому
+пам'ять не залежить від розміру файлу. Ключ зберігається лише локально.
+
+Формат файлу на сервері:
+
+    MAGIC (8) | nonce (16) | шифротекст | HMAC-SHA256 (32)
+
+CTR дозволяє розшифрувати будь-який діапазон без читання попередніх байтів,
+тому посторінкове читання індексованих файлів працює і для зашифрованих.
+Файли без MAGIC (старі бекапи) читаються як є.
+"""
+
+import os
+import hmac
+import time
+import hashlib
+import logging
+from typing import List, Optional
+
+import tgcrypto
+
+from backup_targets import BackupTarget, PART_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TGBAK\x01\x00\x00"
+NONCE_SIZE = 16
+HEADER_SIZE = len(MAGIC) + NONCE_SIZE
+TAG_SIZE = 32
+KEY_SIZE = 32
+CRYPTO_CHUNK_SIZE = 1024 * 1024
+
+
+class BackupIntegrityError(Exception):
+    """Зашифрований файл пошкоджено або ключ не підходить"""
+
+
+def load_key(hex_key: Optional[str] = None, key_file: Optional[str] = None) -> Optional[bytes]:
+    """Ключ шифрування з оточення (hex) або з файлу (створюється, якщо його немає)"""
+    if hex_key:
+        key = bytes.fromhex(hex_key.strip())
+        if len(key) != KEY_SIZE:
+            raise ValueError(f"ключ шифрування має бути {KEY_SIZE} байти ({KEY_SIZE * 2} hex символів)")
+        return key
+    if not key_file:
+        return None
+
+    if not os.path.exists(key_file):
+        with open(key_file, 'w') as f:
+            f.write(os.urandom(KEY_SIZE).hex())
+        os.chmod(key_file, 0o600)
+        logger.warning(f"🔐 Створено новий ключ шифрування бекапів {key_file} - збережіть його копію окремо від бекапів!")
+    with open(key_file, 'r') as f:
+        return load_key(f.read())
+
+
+def _subkeys(key: bytes):
+    """Окремі ключі для шифрування та HMAC"""
+    return (
+        hmac.new(key, b"backup-encryption", hashlib.sha256).digest(),
+        hmac.new(key, b"backup-authentication", hashlib.sha256).digest(),
+    )
+
+
+def _counter(nonce: bytes, offset: int):
+    """Лічильник CTR та позиція в блоці для байта offset відкритого тексту"""
+    block = (int.from_bytes(nonce, 'big') + offset // 16) % (1 << 128)
+    return bytearray(block.to_bytes(16, 'big')), bytearray([offset % 16])
+
+
+def is_encrypted(head: bytes) -> bool:
+    return head[:len(MAGIC)] == MAGIC
+
+
+def encrypt_file(key: bytes, source_path: str, target_path: str):
+    """Шифрує файл потоково"""
+    enc_key, mac_key = _subkeys(key)
+    nonce = os.urandom(NONCE_SIZE)
+    iv, state = _counter(nonce, 0)
+    mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        header = MAGIC + nonce
+        target.write(header)
+        mac.update(header)
+        for chunk in iter(lambda: source.read(CRYPTO_CHUNK_SIZE), b''):
+            # iv та state оновлюються TgCrypto на місці - наступна частина продовжує потік
+            encrypted = tgcrypto.ctr256_encrypt(chunk, enc_key, iv, state)
+            target.write(encrypted)
+            mac.update(encrypted)
+        target.write(mac.digest())
+
+
+def decrypt_file(key: bytes, source_path: str, target_path: str):
+    """Розшифровує файл потоково з перевіркою HMAC (при помилці target не створюється)"""
+    enc_key, mac_key = _subkeys(key)
+    size = os.path.getsize(source_path)
+    if size < HEADER_SIZE + TAG_SIZE:
+        raise BackupIntegrityError("файл закороткий")
+
+    mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+    part_path = target_path + PART_SUFFIX
+    try:
+        with open(source_path, 'rb') as source, open(part_path, 'wb') as target:
+            header = source.read(HEADER_SIZE)
+            mac.update(header)
+            iv, state = _counter(header[len(MAGIC):], 0)
+
+            remaining = size - HEADER_SIZE - TAG_SIZE
+            while remaining:
+                chunk = source.read(min(CRYPTO_CHUNK_SIZE, remaining))
+                remaining -= len(chunk)
+                mac.update(chunk)
+                target.write(tgcrypto.ctr256_decrypt(chunk, enc_key, iv, state))
+
+            if not hmac.compare_digest(mac.digest(), source.read(TAG_SIZE)):
+                raise BackupIntegrityError("HMAC не збігається (файл пошкоджено або інший ключ)")
+        os.replace(part_path, target_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def decrypt_range(key: bytes, nonce: bytes, offset: int, data: bytes) -> bytes:
+    """Розшифровує байти відкритого тексту, що починаються з offset (без перевірки HMAC)"""
+    enc_key, _ = _subkeys(key)
+    iv, state = _counter(nonce, offset)
+    return tgcrypto.ctr256_decrypt(data, enc_key, iv, state)
+
+
+class EncryptedTarget(BackupTarget):
+    """Обгортка цілі бекапу: шифрує при відправці, розшифровує при читанні"""
+
+    def __init__(self, inner: BackupTarget, key: bytes):
+        self.inner = inner
+        self.key = key
+        self.name = inner.name
+
+    def describe(self) -> str:
+        return f"{self.inner.describe()}\n🔐 Шифрування: AES-256-CTR + HMAC-SHA256"
+
+    def connect(self) -> bool:
+        return self.inner.connect()
+
+    def close(self):
+        self.inner.close()
+
+    def abort(self):
+        self.inner.abort()
+
+    def list_dir(self, remote_dir: str = "") -> List[str]:
+        return self.inner.list_dir(remote_dir)
+
+    def _encrypted_copy(self, local_path: str, remote_filename: str) -> str:
+        encrypted_path = os.path.join("temp", "encrypted", remote_filename)
+        # Актуальна копія перевикористовується, щоб перервану передачу можна було докачати
+        if not os.path.exists(encrypted_path) or os.path.getmtime(encrypted_path) < os.path.getmtime(local_path):
+            encrypt_file(self.key, local_path, encrypted_path)
+        return encrypted_path
+
+    def upload_file(self, local_path, remote_filename, callback=None):
+        encrypted_path = self._encrypted_copy(local_path, remote_filename)
+        uploaded = self.inner.upload_file(encrypted_path, remote_filename, callback=callback)
+        if uploaded:
+            os.remove(encrypted_path)
+        return uploaded
+
+    def upload_files(self, files, callback=None, results=None):
+        encrypted = [(self._encrypted_copy(local_path, remote), remote) for local_path, remote in files]
+        uploaded = self.inner.upload_files(encrypted, callback=callback, results=results)
+        for (encrypted_path, _), ok in zip(encrypted, uploaded):
+            if ok:
+                os.remove(encrypted_path)
+        return uploaded
+
+    def download_file(self, remote_filename, callback=None):
+        local_path = self.inner.download_file(remote_filename, callback=callback)
+        if not local_path:
+            return None
+        with open(local_path, 'rb') as f:
+            if not is_encrypted(f.read(HEADER_SIZE)):
+                return local_path
+        try:
+            decrypt_file(self.key, local_path, local_path)
+            return local_path
+        except BackupIntegrityError as e:
+            logger.error(f"❌ Не вдалося розшифрувати {remote_filename}: {e}")
+            os.remove(local_path)
+            return None
+
+    def read_range(self, remote_filename, offset, length):
+        head = self.inner.read_range(remote_filename, 0, HEADER_SIZE)
+        if head is None:
+            return None
+        if not is_encrypted(head):
+            return self.inner.read_range(remote_filename, offset, length)
+        data = self.inner.read_range(remote_filename, HEADER_SIZE + offset, length)
+        if data is None:
+            return None
+        return decrypt_range(self.key, head[len(MAGIC):], offset, data)
+
+    def stat_file(self, remote_filename):
+        return self.inner.stat_file(remote_filename)
+
+    def delete_file(self, remote_filename):
+        return self.inner.delete_file(remote_filename)
+
+
+def benchmark_encryption(size_mb: int = 64) -> dict:
+    """Швидкість шифрування/розшифрування файлу size_mb МБ"""
+    key = os.urandom(KEY_SIZE)
+    os.makedirs("temp", exist_ok=True)
+    source_path = os.path.join("temp", "crypto_bench.bin")
+    encrypted_path = source_path + ".enc"
+    decrypted_path = source_path + ".dec"
+    try:
+        with open(source_path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        start = time.perf_counter()
+        encrypt_file(key, source_path, encrypted_path)
+        encrypt_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decrypt_file(key, encrypted_path, decrypted_path)
+        decrypt_seconds = time.perf_counter() - start
+
+        return {
+            'size_mb': size_mb,
+            'encrypt_mb_per_second': size_mb / encrypt_seconds,
+            'decrypt_mb_per_second': size_mb / decrypt_seconds,
+        }
+    finally:
+        for path in (source_path, encrypted_path, decrypted_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    for size in (8, 64, 256):
+        result = benchmark_encryption(size)
+        print(
+            f"{result['size_mb']:>4} МБ | шифрування {result['encrypt_mb_per_second']:.0f} МБ/с | "
+            f"розшифрування {result['decrypt_mb_per_second']:.0f} МБ/с"
+        )
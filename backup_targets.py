@@ -0,0 +1,352 @@
+"""
+🎯 ЦІЛІ БЕКАПУ
+Спільний інтерфейс сховища бекапів (список/відправка/скачування/діапазон/
+розмір/видалення) та реалізації для локальної папки і S3-сумісного сховища.
+SFTP (Hetzner Storage Box) реалізовано в storage_box.py.
+
+Всі методи синхронні - асинхронну обгортку з таймаутами та скасуванням
+дає AsyncStorageBox. callback(transferred, total) викликається під час
+передачі і може перервати її винятком TransferCancelled.
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Передачі частинами (callback між частинами перевіряє скасування)
+CHUNK_SIZE = 256 * 1024
+PART_SUFFIX = ".part"
+
+TransferCallback = Optional[Callable[[int, int], None]]
+
+
+class TransferCancelled(Exception):
+    """Передачу перервано (скасування або таймаут)"""
+
+
+def copy_with_progress(source, target, total: int, offset: int = 0, callback: TransferCallback = None):
+    """Копіює відкритий файл частинами, повідомляючи прогрес"""
+    transferred = offset
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        target.write(chunk)
+        transferred += len(chunk)
+        if callback:
+            callback(transferred, total)
+    return transferred
+
+
+def local_download_path(remote_filename: str) -> str:
+    """Тимчасовий локальний шлях для скачаного файлу (ім'я може містити підпапки)"""
+    local_path = os.path.join("temp", remote_filename)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    return local_path
+
+
+class BackupTarget(ABC):
+    """Сховище бекапів
+
+    Імена файлів - відносні шляхи з '/' (saved_messages_2025-10-08.json,
+    logs/bot_2025-10-08.log, segments/2025-10-08/seg_00001.json).
+    """
+
+    name = "base"
+
+    def connect(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def abort(self):
+        """Примусово розриває з'єднання, якщо передача зависла"""
+
+    @abstractmethod
+    def describe(self) -> str:
+        """Короткий опис цілі для повідомлень бота"""
+
+    @abstractmethod
+    def list_dir(self, remote_dir: str = "") -> List[str]:
+        """Імена в папці (порожній список, якщо папки немає)"""
+
+    @abstractmethod
+    def upload_file(self, local_path: str, remote_filename: str, callback: TransferCallback = None) -> bool:
+        """Відправляє файл (атомарно: файл з'являється лише повністю записаним)"""
+
+    @abstractmethod
+    def download_file(self, remote_filename: str, callback: TransferCallback = None) -> Optional[str]:
+        """Скачує файл у temp/ та повертає локальний шлях (None, якщо файлу немає)"""
+
+    @abstractmethod
+    def read_range(self, remote_filename: str, offset: int, length: int) -> Optional[bytes]:
+        """Читає діапазон байтів без скачування всього файлу"""
+
+    @abstractmethod
+    def stat_file(self, remote_filename: str) -> Optional[Tuple[int, float]]:
+        """(розмір, час зміни) або None, якщо файлу немає"""
+
+    @abstractmethod
+    def delete_file(self, remote_filename: str) -> bool:
+        """Видаляє файл (True, якщо його більше немає)"""
+
+    def file_exists(self, remote_filename: str) -> bool:
+        return self.stat_file(remote_filename) is not None
+
+    def upload_files(self, files, callback: TransferCallback = None,
+                     results: Optional[List[bool]] = None) -> List[bool]:
+        """Відправляє кілька файлів [(local_path, remote_filename)]
+
+        results (якщо задано) заповнюється по мірі відправки, тому після
+        таймауту видно, які файли встигли відправитись.
+        """
+        results = [False] * len(files) if results is None else results
+        for i, (local_path, remote) in enumerate(files):
+            results[i] = self.upload_file(local_path, remote, callback=callback)
+        return results
+
+    def list_files(self) -> List[str]:
+        """Дні з повідомленнями (імена файлів дня, нові першими)"""
+        from partitions import date_from_filename, is_day_file, is_manifest_file, day_file_name
+        from segment_shipper import SEGMENTS_DIR
+
+        try:
+            files = self.list_dir()
+            # День може складатися лише з частин
+            day_dates = {date_from_filename(f) for f in files if is_day_file(f) or is_manifest_file(f)}
+            # День до нічного бекапу може існувати лише у вигляді сегментів
+            if SEGMENTS_DIR in files:
+                day_dates.update(self.list_dir(SEGMENTS_DIR))
+            message_files = [day_file_name(d) for d in day_dates]
+            logger.info(f"📁 Знайдено файлів: {len(message_files)}")
+            return sorted(message_files, reverse=True)
+        except Exception as e:
+            logger.error(f"❌ Помилка отримання списку файлів: {e}")
+            return []
+
+
+class LocalDirectoryTarget(BackupTarget):
+    """Бекап у локальну папку (другий диск, змонтований NAS, офлайн-тести)"""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, remote_filename: str) -> str:
+        return os.path.join(self.root, *remote_filename.split('/'))
+
+    def describe(self) -> str:
+        return f"📂 Локальна папка: {os.path.abspath(self.root)}"
+
+    def connect(self) -> bool:
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            return True
+        except OSError as e:
+            logger.error(f"❌ Папка бекапу {self.root} недоступна: {e}")
+            return False
+
+    def list_dir(self, remote_dir: str = "") -> List[str]:
+        try:
+            return os.listdir(self._path(remote_dir) if remote_dir else self.root)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+    def upload_file(self, local_path, remote_filename, callback=None):
+        target_path = self._path(remote_filename)
+        part_path = target_path + PART_SUFFIX
+        try:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(local_path, 'rb') as source, open(part_path, 'wb') as target:
+                copy_with_progress(source, target, os.path.getsize(local_path), callback=callback)
+            os.replace(part_path, target_path)
+            logger.info(f"✅ Файл {local_path} збережено в бекап як {remote_filename}")
+            return True
+        except TransferCancelled:
+            logger.warning(f"⏹️ Збереження {remote_filename} перервано")
+        except Exception as e:
+            logger.error(f"❌ Помилка збереження файлу {remote_filename}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return False
+
+    def download_file(self, remote_filename, callback=None):
+        source_path = self._path(remote_filename)
+        local_path = local_download_path(remote_filename)
+        try:
+            with open(source_path, 'rb') as source, open(local_path, 'wb') as target:
+                copy_with_progress(source, target, os.path.getsize(source_path), callback=callback)
+            return local_path
+        except FileNotFoundError:
+            logger.error(f"Файл {remote_filename} не знайдено в бекапі")
+        except TransferCancelled:
+            logger.warning(f"⏹️ Скачування {remote_filename} перервано")
+        except Exception as e:
+            logger.error(f"Помилка скачування файлу {remote_filename}: {e}")
+        return None
+
+    def read_range(self, remote_filename, offset, length):
+        try:
+            with open(self._path(remote_filename), 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+        except FileNotFoundError:
+            return None
+
+    def stat_file(self, remote_filename):
+        try:
+            stat = os.stat(self._path(remote_filename))
+            return stat.st_size, int(stat.st_mtime)
+        except OSError:
+            return None
+
+    def delete_file(self, remote_filename):
+        try:
+            os.remove(self._path(remote_filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Помилка видалення {remote_filename}: {e}")
+            return False
+        return True
+
+
+class S3Target(BackupTarget):
+    """S3-сумісне сховище (AWS, MinIO, Backblaze, локальний MinIO для тестів)
+
+    Потрібен boto3 (pip install boto3) - імпортується лише при виборі цієї цілі.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 region: Optional[str] = None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ""
+        self.endpoint_url = endpoint_url
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.client = None
+
+    def _key(self, remote_filename: str) -> str:
+        return self.prefix + remote_filename
+
+    def _missing(self, error) -> bool:
+        code = str(getattr(error, 'response', {}).get('Error', {}).get('Code', ''))
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def describe(self) -> str:
+        endpoint = self.endpoint_url or "AWS"
+        return f"🪣 S3: {endpoint} / {self.bucket}/{self.prefix}"
+
+    def connect(self) -> bool:
+        if self.client is not None:
+            return True
+        try:
+            import boto3
+        except ImportError:
+            logger.error("❌ Для BACKUP_TARGET=s3 потрібен пакет boto3 (pip install boto3)")
+            return False
+        try:
+            self.client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                region_name=self.region
+            )
+            self.client.head_bucket(Bucket=self.bucket)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Помилка підключення до S3 ({self.bucket}): {e}")
+            self.client = None
+            return False
+
+    def close(self):
+        # Клієнт boto3 тримає пул HTTP з'єднань - перевикористовуємо його між операціями
+        pass
+
+    def list_dir(self, remote_dir: str = "") -> List[str]:
+        prefix = self._key(remote_dir.strip('/') + '/' if remote_dir else "")
+        names = set()
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            names.update(entry['Key'][len(prefix):] for entry in page.get('Contents', []))
+            names.update(entry['Prefix'][len(prefix):].rstrip('/') for entry in page.get('CommonPrefixes', []))
+        return [name for name in names if name]
+
+    def upload_file(self, local_path, remote_filename, callback=None):
+        total = os.path.getsize(local_path)
+        transferred = [0]
+
+        def on_chunk(amount):
+            transferred[0] += amount
+            if callback:
+                callback(transferred[0], total)
+
+        try:
+            # Об'єкт з'являється в S3 лише після завершення відправки (multipart для великих файлів)
+            self.client.upload_file(local_path, self.bucket, self._key(remote_filename), Callback=on_chunk)
+            logger.info(f"✅ Файл {local_path} завантажено в S3 як {remote_filename}")
+            return True
+        except TransferCancelled:
+            logger.warning(f"⏹️ Завантаження {remote_filename} перервано")
+        except Exception as e:
+            logger.error(f"❌ Помилка завантаження файлу {remote_filename} в S3: {e}")
+        return False
+
+    def download_file(self, remote_filename, callback=None):
+        local_path = local_download_path(remote_filename)
+        part_path = local_path + PART_SUFFIX
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(remote_filename))
+            with open(part_path, 'wb') as target:
+                copy_with_progress(response['Body'], target, response['ContentLength'], callback=callback)
+            os.replace(part_path, local_path)
+            return local_path
+        except TransferCancelled:
+            logger.warning(f"⏹️ Скачування {remote_filename} перервано")
+        except Exception as e:
+            if self._missing(e):
+                logger.error(f"Файл {remote_filename} не знайдено в S3")
+            else:
+                logger.error(f"Помилка скачування файлу {remote_filename} з S3: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return None
+
+    def read_range(self, remote_filename, offset, length):
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self._key(remote_filename),
+                Range=f"bytes={offset}-{offset + length - 1}"
+            )
+            return response['Body'].read()
+        except Exception as e:
+            if not self._missing(e):
+                logger.error(f"Помилка читання {remote_filename} [{offset}:{offset + length}] з S3: {e}")
+            return None
+
+    def stat_file(self, remote_filename):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(remote_filename))
+            return response['ContentLength'], int(response['LastModified'].timestamp())
+        except Exception as e:
+            if not self._missing(e):
+                logger.error(f"Помилка перевірки файлу {remote_filename} в S3: {e}")
+            return None
+
+    def delete_file(self, remote_filename):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(remote_filename))
+            return True
+        except Exception as e:
+            logger.error(f"Помилка видалення {remote_filename} з S3: {e}")
+            return False
@@ -0,0 +1,179 @@
+"""
+🚰 ОБМЕЖЕННЯ ШВИДКОСТІ ВІДПРАВКИ
+Token bucket для відправки бекапів: швидкість обмежена лімітом байт/с, а
+при зростанні затримки отримання повідомлень ліміт автоматично знижується
+(і поступово відновлюється, коли затримка спадає). Під час передач
+зберігаються вибірки швидкість/ліміт/затримка для звіту про вікно бекапу.
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Затримка доставки нових повідомлень (час отримання мінус час відправки)"""
+
+    def __init__(self, alpha: float = 0.2, max_lag: float = 3600.0, stale_after: float = 120.0):
+        self.alpha = alpha
+        self.max_lag = max_lag
+        self.stale_after = stale_after
+        self.ema: Optional[float] = None
+        self.updated_at = 0.0
+
+    def record(self, sent_timestamp: float):
+        lag = max(0.0, time.time() - sent_timestamp)
+        if lag > self.max_lag:
+            # Старі повідомлення (догрузка історії) - не показник поточної затримки
+            return
+        self.ema = lag if self.ema is None else self.ema * (1 - self.alpha) + lag * self.alpha
+        self.updated_at = time.time()
+
+    def value(self) -> Optional[float]:
+        """Поточна затримка в секундах (None - давно не було нових повідомлень)"""
+        if self.ema is None or time.time() - self.updated_at > self.stale_after:
+            return None
+        return self.ema
+
+
+class BandwidthShaper:
+    """Token bucket з автоматичним зниженням ліміту при зростанні затримки
+
+    throttle() викликається з потоків передачі після кожної частини і
+    блокує потік, поки в "відрі" не накопичиться достатньо токенів.
+    rate_limit 0 - без ліміту (але зниження при затримці все одно діє).
+    """
+
+    def __init__(self, rate_limit: int = 0,
+                 latency_probe: Optional[Callable[[], Optional[float]]] = None,
+                 latency_threshold: float = 5.0,
+                 min_rate: int = 32 * 1024,
+                 adjust_interval: float = 2.0,
+                 max_samples: int = 3600):
+        self.rate_limit = rate_limit
+        self.latency_probe = latency_probe
+        self.latency_threshold = latency_threshold
+        self.min_rate = min_rate
+        self.adjust_interval = adjust_interval
+
+        # Поточний ліміт після зниження (0 - без ліміту)
+        self.effective_rate = rate_limit
+        self._recover_to = 0.0
+        self.tokens = 0.0
+        self.refilled_at = time.monotonic()
+        self.adjusted_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Фактична швидкість за останній інтервал
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self.observed_rate = 0.0
+
+        self.samples: deque = deque(maxlen=max_samples)
+        self.stats = {'throttled_seconds': 0.0, 'backoffs': 0, 'recoveries': 0, 'bytes': 0}
+
+    def configure(self, rate_limit: Optional[int] = None,
+                  latency_threshold: Optional[float] = None,
+                  latency_probe: Optional[Callable[[], Optional[float]]] = None):
+        with self._lock:
+            if rate_limit is not None:
+                self.rate_limit = rate_limit
+                self.effective_rate = rate_limit
+                self.tokens = 0.0
+            if latency_threshold is not None:
+                self.latency_threshold = latency_threshold
+            if latency_probe is not None:
+                self.latency_probe = latency_probe
+
+    def _adjust(self, now: float):
+        """Знижує ліміт удвічі при великій затримці, відновлює на 25% при нормальній"""
+        elapsed = now - self._window_start
+        self._window_start = now
+        window_bytes, self._window_bytes = self._window_bytes, 0
+        if elapsed > self.adjust_interval * 5:
+            # Перша передача після простою - вікно не показує реальної швидкості
+            return
+        self.observed_rate = window_bytes / elapsed
+
+        latency = self.latency_probe() if self.latency_probe else None
+        if latency is not None and latency > self.latency_threshold:
+            if not self.effective_rate:
+                # Без ліміту: запам'ятовуємо швидкість, до якої повертатись
+                self._recover_to = self.observed_rate
+            current = min(filter(None, (self.effective_rate, self.observed_rate)), default=self.min_rate * 2)
+            reduced = max(self.min_rate, int(current / 2))
+            if reduced != self.effective_rate:
+                self.effective_rate = reduced
+                self.stats['backoffs'] += 1
+                logger.info(f"🚰 Затримка повідомлень {latency:.1f}с - ліміт відправки {reduced / 1024:.0f} КБ/с")
+        elif self.effective_rate != self.rate_limit and (latency is None or latency < self.latency_threshold / 2):
+            increased = int(self.effective_rate * 1.25)
+            target = self.rate_limit or self._recover_to
+            if increased >= target:
+                increased = self.rate_limit
+                self.stats['recoveries'] += 1
+                logger.info("🚰 Затримка повідомлень нормалізувалась - ліміт відправки відновлено")
+            self.effective_rate = increased
+
+        self.samples.append({
+            'time': time.time(),
+            'rate': self.observed_rate,
+            'limit': self.effective_rate,
+            'latency': latency,
+        })
+
+    def throttle(self, nbytes: int):
+        """Чекає, поки можна передати ще nbytes"""
+        with self._lock:
+            now = time.monotonic()
+            self._window_bytes += nbytes
+            self.stats['bytes'] += nbytes
+            if now - self.adjusted_at >= self.adjust_interval:
+                self.adjusted_at = now
+                self._adjust(now)
+
+            rate = self.effective_rate
+            if not rate:
+                self.refilled_at = now
+                return
+            # Відро вміщає одну секунду трафіку
+            self.tokens = min(float(rate), self.tokens + (now - self.refilled_at) * rate)
+            self.refilled_at = now
+            self.tokens -= nbytes
+            wait = -self.tokens / rate if self.tokens < 0 else 0.0
+            self.stats['throttled_seconds'] += wait
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def report(self, since: Optional[float] = None) -> List[Dict[str, float]]:
+        """Похвилинні середні: швидкість, ліміт та затримка"""
+        minutes: Dict[int, List[dict]] = {}
+        for sample in self.samples:
+            if since is None or sample['time'] >= since:
+                minutes.setdefault(int(sample['time'] // 60), []).append(sample)
+
+        rows = []
+        for minute, samples in sorted(minutes.items()):
+            latencies = [s['latency'] for s in samples if s['latency'] is not None]
+            limits = [s['limit'] for s in samples]
+            rows.append({
+                'minute': minute * 60,
+                'rate': sum(s['rate'] for s in samples) / len(samples),
+                'limit': min(limits) if all(limits) else 0,
+                'latency': max(latencies) if latencies else None,
+            })
+        return rows
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'rate_limit': self.rate_limit,
+            'effective_rate': self.effective_rate,
+            'observed_rate': self.observed_rate,
+            'latency': self.latency_probe() if self.latency_probe else None,
+        }
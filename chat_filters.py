@@ -0,0 +1,206 @@
+"""
+🧹 ФІЛЬТР ЧАТІВ
+Правила allow/deny за ID чату, типом чату, відправником та ключовими словами.
+Правила компілюються один раз при зміні налаштувань, далі кожне повідомлення
+перевіряється пошуками в множинах замість порівняння рядків
+"""
+
+import os
+import re
+import json
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Точні типи чатів (ChatType Pyrogram + Збережені повідомлення)
+CHAT_KINDS = ('SAVED_MESSAGES', 'PRIVATE', 'BOT', 'GROUP', 'SUPERGROUP', 'CHANNEL')
+
+# Яке налаштування вмикає кожен тип чату. Боти, як і раніше, не входять до
+# приватних чатів - їх можна увімкнути правилом allow_chat_types BOT
+SETTING_BY_KIND = {
+    'SAVED_MESSAGES': 'save_saved_messages',
+    'PRIVATE': 'save_private_chats',
+    'GROUP': 'save_groups',
+    'SUPERGROUP': 'save_groups',
+    'CHANNEL': 'save_channels',
+}
+
+# Списки правил
+RULE_LISTS = (
+    'allow_chat_ids', 'deny_chat_ids',
+    'allow_chat_types', 'deny_chat_types',
+    'allow_sender_ids', 'deny_sender_ids',
+    'allow_keywords', 'deny_keywords',
+)
+
+_kind_cache: Dict[Any, str] = {}
+
+
+def chat_kind(chat_type) -> str:
+    """Точний тип чату з ChatType Pyrogram або рядка ('ChatType.GROUP', 'GROUP')"""
+    kind = _kind_cache.get(chat_type)
+    if kind is None:
+        name = getattr(chat_type, 'name', None) or str(chat_type).rsplit('.', 1)[-1]
+        kind = name.upper() if name.upper() in CHAT_KINDS else 'OTHER'
+        _kind_cache[chat_type] = kind
+    return kind
+
+
+class ChatFilterEngine:
+    """Скомпільовані правила фільтрації чатів
+
+    Порядок перевірки: deny (чат, відправник, ключове слово) -> allow (чат,
+    відправник, ключове слово) -> тип чату, увімкнений в налаштуваннях.
+    Allow-правила дозволяють вибірково зберігати окремі групи, не вмикаючи
+    всі групи.
+    """
+
+    def __init__(self, rules_file: str = "chat_filters.json"):
+        self.rules_file = rules_file
+        self.rules = self.load_rules()
+        self.hits: Dict[str, int] = {}
+        self.version = 0
+
+        self._enabled_kinds = frozenset()
+        self._allow_chats = frozenset()
+        self._deny_chats = frozenset()
+        self._allow_senders = frozenset()
+        self._deny_senders = frozenset()
+        self._allow_keywords: Optional[re.Pattern] = None
+        self._deny_keywords: Optional[re.Pattern] = None
+
+    def load_rules(self) -> Dict[str, list]:
+        """Завантажує правила з файлу"""
+        rules = {name: [] for name in RULE_LISTS}
+        if os.path.exists(self.rules_file):
+            try:
+                with open(self.rules_file, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                for name in RULE_LISTS:
+                    rules[name] = self._valid_values(name, loaded.get(name, []))
+            except Exception as e:
+                logger.error(f"Помилка завантаження правил фільтра: {e}")
+        return rules
+
+    @staticmethod
+    def _valid_values(name: str, values) -> list:
+        """Значення списку правил з файлу (некоректні відкидаються з помилкою в лозі)"""
+        if not isinstance(values, list):
+            logger.error(f"❌ Правило {name} у файлі фільтра не є списком - пропускаю")
+            return []
+        valid = []
+        for value in values:
+            if name.endswith('_ids'):
+                try:
+                    valid.append(int(value))
+                except (TypeError, ValueError):
+                    logger.error(f"❌ Некоректний ID у правилі {name}: {value!r} - пропускаю")
+            elif isinstance(value, str):
+                valid.append(value)
+            else:
+                logger.error(f"❌ Некоректне значення у правилі {name}: {value!r} - пропускаю")
+        return valid
+
+    def save_rules(self):
+        """Зберігає правила у файл"""
+        try:
+            with open(self.rules_file, 'w', encoding='utf-8') as f:
+                json.dump(self.rules, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Помилка збереження правил фільтра: {e}")
+
+    @staticmethod
+    def _compile_keywords(keywords) -> Optional[re.Pattern]:
+        if not keywords:
+            return None
+        # Довші слова першими, щоб альтернатива не зупинялась на префіксі
+        ordered = sorted({k.lower() for k in keywords if k}, key=len, reverse=True)
+        return re.compile('|'.join(re.escape(k) for k in ordered), re.IGNORECASE)
+
+    def compile(self, settings: Dict[str, Any]):
+        """Компілює правила та налаштування в множини (викликати при зміні)"""
+        enabled = {kind for kind, key in SETTING_BY_KIND.items() if settings.get(key)}
+        enabled -= {k.upper() for k in self.rules['deny_chat_types']}
+        enabled |= {k.upper() for k in self.rules['allow_chat_types']}
+        self._enabled_kinds = frozenset(enabled)
+
+        self._allow_chats = frozenset(int(c) for c in self.rules['allow_chat_ids'])
+        self._deny_chats = frozenset(int(c) for c in self.rules['deny_chat_ids'])
+        self._allow_senders = frozenset(int(u) for u in self.rules['allow_sender_ids'])
+        self._deny_senders = frozenset(int(u) for u in self.rules['deny_sender_ids'])
+        self._allow_keywords = self._compile_keywords(self.rules['allow_keywords'])
+        self._deny_keywords = self._compile_keywords(self.rules['deny_keywords'])
+
+        self.version += 1
+        logger.info(
+            f"🧹 Фільтр чатів скомпільовано (v{self.version}): "
+            f"типи {sorted(self._enabled_kinds)}, "
+            f"allow чатів {len(self._allow_chats)}, deny чатів {len(self._deny_chats)}"
+        )
+
+    def _hit(self, rule: str):
+        self.hits[rule] = self.hits.get(rule, 0) + 1
+
+    def has_dialog_rules(self) -> bool:
+        """Чи є що сканувати в діалогах (крім Збережених)"""
+        return bool(
+            (self._enabled_kinds - {'SAVED_MESSAGES'})
+            or self._allow_chats or self._allow_senders or self._allow_keywords
+        )
+
+    def should_check_chat(self, chat_id: int, kind: str) -> bool:
+        """Рішення на рівні чату для опитувачів (без відправника та тексту)"""
+        if chat_id in self._deny_chats:
+            return False
+        if chat_id in self._allow_chats or kind in self._enabled_kinds:
+            return True
+        # Allow-правила за відправником чи словом можуть спрацювати в будь-якому чаті
+        return bool(self._allow_senders or self._allow_keywords)
+
+    def evaluate(self, chat_id: int, kind: str, sender_id: Optional[int] = None,
+                 text: Optional[str] = None) -> bool:
+        """Чи потрібно зберігати повідомлення"""
+        if chat_id in self._deny_chats:
+            self._hit('deny_chat_ids')
+            return False
+        if sender_id is not None and sender_id in self._deny_senders:
+            self._hit('deny_sender_ids')
+            return False
+        if text and self._deny_keywords and self._deny_keywords.search(text):
+            self._hit('deny_keywords')
+            return False
+
+        if chat_id in self._allow_chats:
+            self._hit('allow_chat_ids')
+            return True
+        if sender_id is not None and sender_id in self._allow_senders:
+            self._hit('allow_sender_ids')
+            return True
+        if text and self._allow_keywords and self._allow_keywords.search(text):
+            self._hit('allow_keywords')
+            return True
+
+        if kind in self._enabled_kinds:
+            self._hit(f"type:{kind}")
+            return True
+
+        self._hit('no_match')
+        return False
+
+    def add_rule(self, rule_list: str, value) -> bool:
+        """Додає значення до списку правил"""
+        if rule_list not in RULE_LISTS:
+            return False
+        if value not in self.rules[rule_list]:
+            self.rules[rule_list].append(value)
+            self.save_rules()
+        return True
+
+    def remove_rule(self, rule_list: str, value) -> bool:
+        """Видаляє значення зі списку правил"""
+        if rule_list not in RULE_LISTS or value not in self.rules[rule_list]:
+            return False
+        self.rules[rule_list].remove(value)
+        self.save_rules()
+        return True
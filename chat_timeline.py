@@ -0,0 +1,168 @@
+"""
+💬 ІНДЕКС РОЗМОВ ПО ЧАТАХ
+Для кожного чату окремий файл chat_index/<chat_id>.idx з записами
+фіксованої ширини, які дописуються під час збереження повідомлень:
+
+    день (YYYYMMDD) | позиція у файлі дня | message_id | вид файлу | година
+
+Вид файлу та година відновлюють ім'я файлу (основний файл дня або частина),
+тому сторінка розмови - це одне читання N записів з кінця файлу індексу,
+незалежно від того, за скільки днів накопичилась історія чату.
+"""
+
+import os
+import json
+import time
+import struct
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from partitions import date_from_filename, day_file_name, partition_file_name, partition_key_of
+
+logger = logging.getLogger(__name__)
+
+# <день, позиція, message_id, вид, година> + 2 байти вирівнювання = 20 байт
+RECORD = struct.Struct('<IIqBBxx')
+
+KIND_DAY, KIND_HOUR, KIND_CHAT, KIND_CHAT_HOUR = range(4)
+
+
+def encode_location(key: Optional[str]):
+    """(вид файлу, година) для ключа частини"""
+    if key is None:
+        return KIND_DAY, 0
+    hour = 0
+    for part in key.split('.'):
+        if part.startswith('h'):
+            hour = int(part[1:])
+    if key.startswith('h'):
+        return KIND_HOUR, hour
+    return (KIND_CHAT_HOUR, hour) if '.h' in key else (KIND_CHAT, 0)
+
+
+def location_file_name(chat_id: int, date: str, kind: int, hour: int) -> str:
+    if kind == KIND_DAY:
+        return day_file_name(date)
+    chat = str(chat_id).replace('-', 'm')
+    if kind == KIND_HOUR:
+        return partition_file_name(date, f"h{hour:02d}")
+    if kind == KIND_CHAT:
+        return partition_file_name(date, f"c{chat}")
+    return partition_file_name(date, f"c{chat}.h{hour:02d}")
+
+
+class ChatTimeline:
+    """Індекс повідомлень по чатах з записами фіксованої ширини"""
+
+    def __init__(self, directory: str = "chat_index", save_interval: float = 30.0):
+        self.directory = directory
+        self.directory_file = os.path.join(directory, "chats.json")
+        self.save_interval = save_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        self._dirty = False
+        # chat_id (str) -> {"title", "count", "last"}
+        self.chats: Dict[str, Dict[str, Any]] = self.load_directory()
+        self.stats = {'appended': 0, 'pages': 0, 'errors': 0}
+
+    def load_directory(self) -> Dict[str, Dict[str, Any]]:
+        chats = {}
+        if os.path.exists(self.directory_file):
+            try:
+                with open(self.directory_file, 'r', encoding='utf-8') as f:
+                    chats = json.load(f)
+            except Exception as e:
+                logger.error(f"Помилка читання списку чатів індексу: {e}")
+        # Чати, дописані після останнього збереження списку (наприклад, перед збоєм)
+        for name in os.listdir(self.directory):
+            if name.endswith('.idx') and name[:-len('.idx')] not in chats:
+                chat_id = name[:-len('.idx')]
+                chats[chat_id] = {'title': chat_id, 'count': self.count(int(chat_id)), 'last': ''}
+        return chats
+
+    def save_directory(self):
+        try:
+            with open(self.directory_file, 'w', encoding='utf-8') as f:
+                json.dump(self.chats, f, ensure_ascii=False, indent=2)
+            self._saved_at = time.time()
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Помилка збереження списку чатів індексу: {e}")
+
+    def _index_path(self, chat_id: int) -> str:
+        return os.path.join(self.directory, f"{chat_id}.idx")
+
+    def append(self, message_data: Dict[str, Any], data_file: str, position: int):
+        """Дописує повідомлення, збережене в data_file на позиції position"""
+        chat_id = int(message_data.get('chat_id') or 0)
+        date = date_from_filename(os.path.basename(data_file))
+        if date is None:
+            return
+        kind, hour = encode_location(partition_key_of(data_file))
+        record = RECORD.pack(int(date.replace('-', '')), position,
+                             int(message_data.get('message_id') or 0), kind, hour)
+
+        with self._lock:
+            try:
+                with open(self._index_path(chat_id), 'ab') as f:
+                    f.write(record)
+            except OSError as e:
+                self.stats['errors'] += 1
+                logger.error(f"❌ Не вдалося дописати індекс чату {chat_id}: {e}")
+                return
+
+            entry = self.chats.setdefault(str(chat_id), {'title': str(chat_id), 'count': 0, 'last': ''})
+            is_new = entry['count'] == 0
+            entry['title'] = message_data.get('chat_title') or entry['title']
+            entry['count'] += 1
+            entry['last'] = message_data.get('date') or entry['last']
+            self.stats['appended'] += 1
+            self._dirty = True
+            if is_new or time.time() - self._saved_at >= self.save_interval:
+                self.save_directory()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self.save_directory()
+
+    def count(self, chat_id: int) -> int:
+        path = self._index_path(chat_id)
+        return os.path.getsize(path) // RECORD.size if os.path.exists(path) else 0
+
+    def read_page(self, chat_id: int, page: int, per_page: int) -> List[Dict[str, Any]]:
+        """Сторінка page розмови, рахуючи від найновіших (записи від нових до старих)"""
+        total = self.count(chat_id)
+        end = total - page * per_page
+        if end <= 0:
+            return []
+        start = max(0, end - per_page)
+        with open(self._index_path(chat_id), 'rb') as f:
+            f.seek(start * RECORD.size)
+            raw = f.read((end - start) * RECORD.size)
+        self.stats['pages'] += 1
+
+        locations = []
+        for day, position, message_id, kind, hour in RECORD.iter_unpack(raw[:len(raw) - len(raw) % RECORD.size]):
+            date = f"{day // 10000:04d}-{day // 100 % 100:02d}-{day % 100:02d}"
+            locations.append({
+                'file': location_file_name(chat_id, date, kind, hour),
+                'date': date,
+                'position': position,
+                'message_id': message_id,
+            })
+        locations.reverse()
+        return locations
+
+    def recent_chats(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Чати за часом останнього повідомлення"""
+        with self._lock:
+            ranked = sorted(self.chats.items(), key=lambda item: item[1].get('last') or '', reverse=True)
+        return [{'chat_id': int(chat_id), **entry} for chat_id, entry in ranked[:limit]]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            records = sum(entry['count'] for entry in self.chats.values())
+        return {**self.stats, 'chats': len(self.chats), 'records': records, 'bytes': records * RECORD.size}
@@ -0,0 +1,147 @@
+"""
+💽 ЛОКАЛЬНИЙ КЕШ ФАЙЛІВ STORAGE BOX
+Скачані файли зберігаються в temp/cache з обмеженням розміру (LRU).
+Ключ - ім'я на сервері разом з розміром і часом зміни, тому змінений на
+сервері файл автоматично скачується заново. Час доступу при попаданні
+зберігається в індекс не частіше save_interval (або при зміні кешу)
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DiskLRUCache:
+    """Кеш файлів на диску з витісненням найдавніше використаних"""
+
+    def __init__(self, directory: str = os.path.join("temp", "cache"),
+                 max_bytes: int = 200 * 1024 * 1024, save_interval: float = 60.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.save_interval = save_interval
+        self.index_file = os.path.join(directory, "index.json")
+        self._saved_at = 0.0
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+        self.index: Dict[str, Dict[str, Any]] = self.load_index()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+
+    def load_index(self) -> Dict[str, Dict[str, Any]]:
+        """Індекс кешу (записи без файлу на диску відкидаються)"""
+        index = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            except Exception as e:
+                logger.error(f"Помилка читання індексу кешу файлів: {e}")
+        return {name: entry for name, entry in index.items() if os.path.exists(entry['path'])}
+
+    def save_index(self):
+        try:
+            with open(self.index_file, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2)
+            self._saved_at = time.time()
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Помилка збереження індексу кешу файлів: {e}")
+
+    def _cache_path(self, remote_name: str) -> str:
+        digest = hashlib.sha1(remote_name.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.directory, f"{digest}_{os.path.basename(remote_name)}")
+
+    def total_bytes(self) -> int:
+        return sum(entry['bytes'] for entry in self.index.values())
+
+    def get(self, remote_name: str, size: int, mtime: int) -> Optional[str]:
+        """Шлях до закешованої копії, якщо вона відповідає версії на сервері"""
+        entry = self.index.get(remote_name)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        if entry['size'] != size or entry['mtime'] != mtime or not os.path.exists(entry['path']):
+            self.stats['stale'] += 1
+            self.invalidate(remote_name)
+            return None
+
+        self.stats['hits'] += 1
+        entry['last_access'] = time.time()
+        # Втрачений після збою час доступу лише трохи змінить порядок витіснення
+        self._dirty = True
+        if time.time() - self._saved_at >= self.save_interval:
+            self.save_index()
+        return entry['path']
+
+    def flush(self):
+        if self._dirty:
+            self.save_index()
+
+    def put(self, remote_name: str, size: int, mtime: int, source_path: str) -> str:
+        """Переносить скачаний файл у кеш і повертає новий шлях"""
+        path = self._cache_path(remote_name)
+        shutil.move(source_path, path)
+        self.index[remote_name] = {
+            'path': path,
+            'size': size,
+            'mtime': mtime,
+            'bytes': os.path.getsize(path),
+            'last_access': time.time(),
+        }
+        self._evict(keep=remote_name)
+        self.save_index()
+        return path
+
+    def invalidate(self, remote_name: str):
+        entry = self.index.pop(remote_name, None)
+        if entry and os.path.exists(entry['path']):
+            os.remove(entry['path'])
+        self.save_index()
+
+    def _evict(self, keep: Optional[str] = None):
+        total = self.total_bytes()
+        for remote_name, entry in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if remote_name == keep:
+                continue
+            total -= entry['bytes']
+            self.index.pop(remote_name)
+            if os.path.exists(entry['path']):
+                os.remove(entry['path'])
+            self.stats['evictions'] += 1
+            logger.debug(f"💽 Витіснено з кешу: {remote_name}")
+
+    async def fetch(self, storage_box, remote_name: str,
+                    on_progress: Optional[Callable[[int], Awaitable[Any]]] = None) -> Optional[str]:
+        """Файл з кешу або зі Storage Box (через підключений AsyncStorageBox)
+
+        Повертає шлях у кеші (файл не можна видаляти) або None, якщо файлу немає.
+        """
+        remote_stat = await storage_box.stat_file(remote_name)
+        if remote_stat is None:
+            return None
+        size, mtime = remote_stat
+
+        cached = self.get(remote_name, size, mtime)
+        if cached:
+            return cached
+
+        local_path = await storage_box.download_file(remote_name, on_progress=on_progress)
+        if not local_path:
+            return None
+        return self.put(remote_name, size, mtime, local_path)
+
+    def get_stats(self) -> dict:
+        requests = self.stats['hits'] + self.stats['misses'] + self.stats['stale']
+        return {
+            **self.stats,
+            'files': len(self.index),
+            'bytes': self.total_bytes(),
+            'hit_rate': self.stats['hits'] / requests if requests else 0.0,
+        }
@@ -2,7 +2,6 @@ import logging
 import sys
 import json
 import os
-import paramiko
 import uuid
 import signal
 import traceback
@@ -14,15 +13,43 @@ from pyrogram.types import Message
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, Message as TelegramMessage
 from telegram.ext import Application, CommandHandler, MessageHandler, filters as tg_filters, CallbackQueryHandler, CallbackContext
 import asyncio
+import itertools
 from apscheduler.schedulers.background import BackgroundScheduler
 from typing import Dict, List, Any
 from openai import AsyncOpenAI
 from anthropic import AsyncAnthropic
 from dotenv import load_dotenv
+from media_capture import MediaCapture, extract_media_info
+from chat_filters import ChatFilterEngine, chat_kind, RULE_LISTS
+from keyword_alerts import KeywordAlerter
+from ingest_queue import PriorityIngestQueue
+from segment_shipper import SegmentShipper, segment_manifest_name, merge_segments
+from upload_manifest import UploadManifest
+from file_cache import DiskLRUCache
+from viewer_cache import ByteBudgetCache, DataVersion, RenderCache, approx_size
+from viewer_prefetch import ViewerPrefetcher
+from view_filters import FilterIndex, describe_filter, filter_key
+from chat_timeline import ChatTimeline
+from merge_engine import merge_files
+from month_pack import consolidate_closed_months
+from indexed_json import convert_file, iter_messages, parse_header, parse_index, record_range, slice_records, HEADER_SIZE
+from partitions import (
+    PartitionManifest, PARTITION_MODES, partition_key, partition_file_name,
+    partition_key_of, manifest_file_name, is_day_file, is_manifest_file, date_from_filename, day_file_name,
+    group_by_month
+)
 
 # Завантажуємо змінні з .env файлу
 load_dotenv()
 
+# Storage Box читає конфігурацію з оточення, тому імпортується після load_dotenv()
+from storage_box import (
+    AsyncStorageBox, create_backup_target, storage_pool, listing_cache, upload_shaper, shaped_callback,
+    BACKUP_TARGET, BACKUP_ENCRYPTION_KEY
+)
+from bandwidth import LatencyTracker
+from backup_crypto import benchmark_encryption
+
 # Type alias для контексту (для сумісності з різними версіями IDE)
 ContextType = CallbackContext[Any, Any, Any, Any]
 
@@ -68,12 +95,6 @@ SESSION_NAME = "telegram_client"
 # Конфігурація Bot API
 BOT_TOKEN = os.getenv("BOT_TOKEN")  # Отримайте у @BotFather
 
-# Конфігурація Storage Box
-STORAGE_BOX_HOST = os.getenv("STORAGE_BOX_HOST")
-STORAGE_BOX_USERNAME = os.getenv("STORAGE_BOX_USERNAME")
-STORAGE_BOX_PASSWORD = os.getenv("STORAGE_BOX_PASSWORD")
-STORAGE_BOX_PATH = os.getenv("STORAGE_BOX_PATH")
-
 # Конфігурація AI (додайте свої ключі)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # Або вставте ключ тут
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")  # Або вставте ключ тут
@@ -161,26 +182,51 @@ settings = {
     'dialogs_check_interval': 5,   # Інтервал перевірки діалогів (секунди)
     'dialogs_limit': 20,            # Кількість діалогів для перевірки
     'messages_per_dialog': 5,       # Кількість повідомлень з кожного діалогу
+    'save_media': False,            # Зберігати медіа (фото, голосові, документи)
+    'media_max_size_mb': 20,        # Максимальний розмір медіа-файлу (МБ)
+    'media_workers': 2,             # Кількість паралельних завантажень медіа
+    'partition_mode': 'hour',       # Партиціювання груп/каналів: none, hour, chat, chat_hour
+    'ingest_depth_threshold': 200,  # Глибина черги збереження, після якої групи/канали скидаються
+    'ingest_latency_threshold': 0.5, # Затримка запису (сек), після якої групи/канали скидаються
+    'shed_policy': 'defer',         # Що робити з групами/каналами при перевантаженні: defer, sample
+    'shed_sample_rate': 5,          # При 'sample' одразу зберігається кожне N-те, решта - після спаду навантаження
+    'continuous_backup': False,     # Відправляти сегменти протягом дня (а не лише о 23:59)
+    'segment_interval_minutes': 10, # Запечатувати сегмент кожні N хвилин
+    'segment_max_messages': 200,    # ...або кожні M повідомлень
+    'upload_rate_limit_kb': 0,      # Ліміт швидкості відправки бекапів (КБ/с, 0 - без ліміту)
+    'upload_latency_threshold': 5,  # Затримка отримання повідомлень (сек), при якій відправка сповільнюється
 }
 
+# Фільтр чатів (перекомпільовується при кожній зміні налаштувань)
+chat_filter = ChatFilterEngine()
+chat_filter.compile(settings)
+
 # Глобальна змінна для поточної дати
 CURRENT_DATE = datetime.now().strftime("%Y-%m-%d")
 
 
 
+# Маніфест відправлених файлів (пропуск незмінених та безпечне очищення)
+upload_manifest = UploadManifest()
+
+# Кеш скачаних зі Storage Box файлів (temp/cache)
+file_cache = DiskLRUCache()
+
 # Функція для очищення старих локальних файлів
 def cleanup_old_local_files():
     """Видаляє старі локальні файли з повідомленнями (не поточного дня)"""
     try:
         current_date = datetime.now().strftime("%Y-%m-%d")
-        current_file = f"saved_messages_{current_date}.json"
 
-        # Знаходимо всі файли з повідомленнями
+        # Знаходимо всі файли з повідомленнями (основні, частини та маніфести)
         message_files = [f for f in os.listdir('.') if f.startswith('saved_messages_') and f.endswith('.json')]
 
         deleted_count = 0
         for file in message_files:
-            if file != current_file:
+            if date_from_filename(file) != current_date:
+                if not upload_manifest.confirmed(file, file):
+                    logger.warning(f"⚠️ {file} не підтверджено на сервері - залишаю локально")
+                    continue
                 try:
                     os.remove(file)
                     logger.info(f"🗑️ Видалено старий локальний файл: {file}")
@@ -193,113 +239,31 @@ def cleanup_old_local_files():
         else:
             logger.debug("📁 Немає старих локальних файлів для видалення")
 
+        # Забуваємо відправлені сегменти минулих днів
+        segment_shipper.prune(current_date)
+
     except Exception as cleanup_exc:
         logger.error(f"❌ Помилка при очищенні старих файлів: {cleanup_exc}")
 
 # Глобальні змінні
-user_viewing_state: Dict[str, Dict[str, Any]] = {}  # Ключ - str (user_id_filename)
-files_cache: Dict[str, List[str]] = {}  # Ключ - str (user_id)
+# Відкриті в переглядачі файли (ключ - user_id_filename) з бюджетом пам'яті та TTL
+user_viewing_state = ByteBudgetCache(max_bytes=64 * 1024 * 1024, ttl=1800)
+# Фонове завантаження наступної сторінки та сусідніх днів
+viewer_prefetcher = ViewerPrefetcher(max_concurrent=2)
+# Файл, який користувач зараз переглядає (для коротких callback фільтрів)
+viewer_current_file: Dict[int, str] = {}
+# Готові екрани переглядача та налаштувань; data_version збільшується при записі повідомлень
+# (загальна версія та версія записаного файлу)
+render_cache = RenderCache()
+data_version = DataVersion()
+# Номер завантаженого стану файлу (перезавантажений з сервера стан має нові ключі рендеру)
+view_state_generation = itertools.count(1)
 
 # Функція для перевірки доступу до бота
 def check_access(user_id):
     user_uuid = str(uuid.uuid5(uuid.NAMESPACE_OID, str(user_id)))
     return user_uuid == ALLOWED_UUID or str(user_id) == ALLOWED_UUID
 
-class StorageBoxManager:
-    def __init__(self):
-        self.ssh = paramiko.SSHClient()
-        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-    def connect(self):
-        try:
-            self.ssh.connect(
-                STORAGE_BOX_HOST,
-                username=STORAGE_BOX_USERNAME,
-                password=STORAGE_BOX_PASSWORD
-            )
-            return True
-        except Exception as conn_exc:
-            logger.error(f"Помилка підключення до Storage Box: {conn_exc}")
-            return False
-            
-    def upload_file(self, local_path, remote_filename):
-        try:
-            sftp = self.ssh.open_sftp()
-
-            # Визначаємо повний шлях (може містити підпапки, наприклад logs/bot_2025-10-08.log)
-            full_remote_path = STORAGE_BOX_PATH + remote_filename
-
-            # Витягуємо всі папки з шляху
-            remote_dir = os.path.dirname(full_remote_path)
-            path_parts = remote_dir.strip('/').split('/')
-            current_path = ''
-
-            # Створюємо всю структуру папок
-            for part in path_parts:
-                if not part:  # Пропускаємо порожні частини
-                    continue
-                current_path += '/' + part
-                try:
-                    sftp.chdir(current_path)
-                    logger.debug(f"✅ Папка існує: {current_path}")
-                except (IOError, OSError):
-                    try:
-                        sftp.mkdir(current_path)
-                        logger.info(f"✅ Створено папку: {current_path}")
-                    except Exception as mkdir_error:
-                        logger.warning(f"⚠️ Не вдалося створити папку {current_path}: {mkdir_error}")
-
-            # Завантажуємо файл
-            sftp.put(local_path, full_remote_path)
-            sftp.close()
-            logger.info(f"✅ Файл {local_path} успішно завантажено на Storage Box як {remote_filename}")
-            return True
-        except Exception as e:
-            logger.error(f"❌ Помилка завантаження файлу: {e}")
-            return False
-            
-    def list_files(self):
-        try:
-            sftp = self.ssh.open_sftp()
-            try:
-                sftp.chdir(STORAGE_BOX_PATH)
-            except (IOError, OSError):
-                logger.warning(f"⚠️ Папка {STORAGE_BOX_PATH} не існує - повертаю порожній список")
-                sftp.close()
-                return []
-
-            files = sftp.listdir()
-            sftp.close()
-
-            # Фільтруємо тільки файли з повідомленнями
-            message_files = [f for f in files if f.startswith('saved_messages_') and f.endswith('.json')]
-            logger.info(f"📁 Знайдено файлів: {len(message_files)}")
-            return sorted(message_files, reverse=True)
-        except Exception as e:
-            logger.error(f"❌ Помилка отримання списку файлів: {e}")
-            return []
-            
-    def download_file(self, remote_filename):
-        try:
-            sftp = self.ssh.open_sftp()
-            remote_path = os.path.join(STORAGE_BOX_PATH, remote_filename)
-            
-            # Створюємо тимчасову директорію
-            if not os.path.exists("temp"):
-                os.makedirs("temp")
-                
-            local_path = os.path.join("temp", remote_filename)
-            sftp.get(remote_path, local_path)
-            sftp.close()
-            
-            return local_path
-        except Exception as e:
-            logger.error(f"Помилка скачування файлу {remote_filename}: {e}")
-            return None
-            
-    def close(self):
-        self.ssh.close()
-
 # AI Асистент для аналізу помилок
 class AIAssistant:
     def __init__(self):
@@ -601,56 +565,228 @@ def get_current_data_file():
     current_date = datetime.now().strftime("%Y-%m-%d")
     return f"saved_messages_{current_date}.json"
 
-def load_messages():
-    data_file = get_current_data_file()
+# Маніфест частин дня (групи та канали)
+partition_manifest = PartitionManifest()
+
+# Індекс розмов по чатах (дописується при збереженні повідомлень)
+chat_timeline = ChatTimeline()
+
+# Сповіщення за ключовими словами (відправка пакетами в main)
+keyword_alerter = KeywordAlerter()
+
+# Безперервний бекап сегментами (цикл відправки запускається в main)
+segment_shipper = SegmentShipper(
+    AsyncStorageBox,
+    interval_minutes=settings['segment_interval_minutes'],
+    max_messages=settings['segment_max_messages']
+)
+
+# Затримка доставки нових повідомлень - відправка бекапів сповільнюється, коли вона росте
+capture_latency = LatencyTracker()
+upload_shaper.configure(
+    rate_limit=settings['upload_rate_limit_kb'] * 1024,
+    latency_threshold=settings['upload_latency_threshold'],
+    latency_probe=capture_latency.value
+)
+
+def get_target_data_file(message_data):
+    """Повертає файл дня або частини дня, куди потрапить повідомлення"""
+    key = partition_key(message_data, settings['partition_mode'])
+    if key is None:
+        return get_current_data_file()
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    return partition_file_name(current_date, key)
+
+def load_messages(data_file=None):
+    data_file = data_file or get_current_data_file()
     if os.path.exists(data_file):
         with open(data_file, 'r', encoding='utf-8') as f:
             return json.load(f)
     return {"messages": []}
 
-def save_message(message_data):
-    data = load_messages()
-    data["messages"].append(message_data)
+def load_current_message_ids():
+    """ID повідомлень поточного дня з основного файлу та всіх частин"""
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    existing_ids = set(msg['message_id'] for msg in load_messages()['messages'])
+    for partition_file in partition_manifest.partition_files(current_date):
+        existing_ids.update(msg['message_id'] for msg in load_messages(partition_file)['messages'])
+    return existing_ids
 
-    data_file = get_current_data_file()
-    with open(data_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+def load_day_messages():
+    """Всі повідомлення поточного дня (основний файл та частини)"""
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    messages = []
+    for data_file in [get_current_data_file()] + partition_manifest.partition_files(current_date):
+        messages.extend(load_messages(data_file)["messages"])
+    return messages
+
+def save_messages(batch):
+    """Зберігає пачку повідомлень: кожен файл дня переписується один раз на пачку"""
+    by_file = {}
+    for message_data in batch:
+        by_file.setdefault(get_target_data_file(message_data), []).append(message_data)
+
+    for data_file, file_messages in by_file.items():
+        data = load_messages(data_file)
+        first_position = len(data["messages"])
+        data["messages"].extend(file_messages)
+
+        with open(data_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        data_version.bump(data_file)
+
+        for offset, message_data in enumerate(file_messages):
+            # Позиція в файлі дня для перегляду розмови по чату
+            chat_timeline.append(message_data, data_file, first_position + offset)
+            after_save(message_data)
+
+def after_save(message_data):
+    """Дії після запису повідомлення у файл дня"""
+    # Реєструємо частину дня в маніфесті
+    key = partition_key(message_data, settings['partition_mode'])
+    if key is not None:
+        partition_manifest.register(datetime.now().strftime("%Y-%m-%d"), key, message_data)
+
+    # Перевіряємо ключові слова (збіги відправляються адміну пакетами)
+    keyword_alerter.check(message_data)
+
+    # Додаємо у відкритий сегмент безперервного бекапу
+    if settings['continuous_backup']:
+        segment_shipper.record(message_data)
 
     # Компактний вивід в консоль
     chat_name = message_data.get('chat_title', 'Збережені')
     msg_time = datetime.fromisoformat(message_data['date']).strftime('%H:%M:%S')
-    msg_text = message_data.get('text', '[медіа]')[:50]  # Перші 50 символів
+    msg_text = (message_data.get('text') or '[медіа]')[:50]  # Перші 50 символів
 
     print(f"💾 {chat_name} | {msg_time} | {msg_text}")
 
     logger.info(f"Збережено повідомлення: {message_data['message_id']}")
 
-# Функція для відправки файлу на Storage Box
-async def upload_to_storage_box():
-    # Отримуємо файл поточного дня
-    data_file = get_current_data_file()
+# Черга збереження з пріоритетними смугами (цикл запису запускається в main)
+ingest_queue = PriorityIngestQueue(
+    save_messages,
+    depth_threshold=settings['ingest_depth_threshold'],
+    latency_threshold=settings['ingest_latency_threshold'],
+    shed_policy=settings['shed_policy'],
+    sample_rate=settings['shed_sample_rate']
+)
 
-    if not os.path.exists(data_file):
-        logger.info("Немає файлу для відправки сьогодні")
-        return
+def indexed_upload_copy(local_path, remote_name):
+    """Копія файлу дня у форматі indexed-v1 для відправки (маніфести відправляються як є)"""
+    if is_manifest_file(os.path.basename(local_path)):
+        return local_path
+    target_path = os.path.join("temp", "indexed", remote_name)
+    # Не перезаписуємо актуальну копію, щоб незавершена передача могла докачатись
+    if not os.path.exists(target_path) or os.path.getmtime(target_path) < os.path.getmtime(local_path):
+        convert_file(local_path, target_path)
+    return target_path
+
+async def reconcile_day_files(storage_box, files, force=False):
+    """Доповнює локальні файли дня повідомленнями, які є лише в копії на сервері
+
+    Копія на сервері могла бути записана іншим хостом або до перезапуску.
+    Об'єднання потрібне лише якщо на сервері не та версія, яку відправили ми
+    (force - об'єднати в будь-якому разі). Повертає кількість доданих повідомлень.
+    """
+    added = 0
+    for local_path, remote_name in files:
+        remote_stat = await storage_box.stat_file(remote_name)
+        if remote_stat is None or (not force and upload_manifest.remote_matches(remote_name, remote_stat)):
+            continue
+
+        remote_path = await file_cache.fetch(storage_box, remote_name)
+        if not remote_path:
+            continue
+
+        if is_manifest_file(os.path.basename(local_path)):
+            with open(remote_path, 'r', encoding='utf-8') as f:
+                added_parts = partition_manifest.merge_remote(date_from_filename(local_path), json.load(f))
+            if added_parts:
+                logger.info(f"🔀 Додано {added_parts} частин дня з маніфесту на сервері")
+            continue
+
+        merged_path = os.path.join("temp", "merge", remote_name)
+        os.makedirs(os.path.dirname(merged_path), exist_ok=True)
+        for _ in range(3):
+            local_stat = os.stat(local_path)
+            stats = await asyncio.to_thread(merge_files, local_path, remote_path, merged_path)
+            # Під час об'єднання могли зберегтись нові повідомлення - тоді об'єднуємо заново
+            current_stat = os.stat(local_path)
+            if (current_stat.st_size, current_stat.st_mtime) == (local_stat.st_size, local_stat.st_mtime):
+                os.replace(merged_path, local_path)
+                added += stats['remote_only']
+                data_version.bump(local_path)
+                # Локальні позиції не змінились - в індекс розмов додаються лише дописані з сервера
+                if stats['remote_only']:
+                    remote_messages = itertools.islice(iter_messages(local_path), stats['local'], None)
+                    for position, message_data in enumerate(remote_messages, start=stats['local']):
+                        chat_timeline.append(message_data, local_path, position)
+                # Лічильники частини в маніфесті мають враховувати додані з сервера повідомлення
+                key = partition_key_of(local_path)
+                if key is not None:
+                    partition_manifest.refresh(date_from_filename(local_path), key, iter_messages(local_path))
+                break
+        else:
+            logger.warning(f"⚠️ {local_path} постійно змінюється - об'єднання відкладено до наступного бекапу")
+    return added
+
+async def upload_day_files(storage_box, files, on_progress=None, push_manifest=True, force_merge=False):
+    """Об'єднує файли дня з копіями на сервері та відправляє змінені
+
+    Результат upload_manifest.upload доповнено кількістю доданих з сервера повідомлень ("merged").
+    """
+    # Маніфест частин зберігається з затримкою - на сервер має піти актуальний
+    partition_manifest.flush()
+    merged = await reconcile_day_files(storage_box, files, force=force_merge)
+    # Файли дня відправляються з індексом, щоб переглядач читав лише потрібну сторінку
+    result = await upload_manifest.upload(
+        storage_box, files,
+        on_progress=on_progress, transform=indexed_upload_copy, push_manifest=push_manifest
+    )
+    result['merged'] = merged
+    if not result['failed']:
+        # День на сервері повністю - ключі сегментів цих днів у пам'яті більше не потрібні
+        for date in {date_from_filename(os.path.basename(local_path)) for local_path, _ in files}:
+            if date:
+                segment_shipper.forget_shipped(date)
+    return result
 
-    # Створюємо унікальну назву файлу з датою
+# Функція для відправки файлу на Storage Box
+async def upload_to_storage_box(on_progress=None):
+    """Відправляє файли поточного дня; on_progress(filename, percent) - прогрес передачі"""
+    # Отримуємо файли поточного дня (основний файл, частини та маніфест)
     file_date = datetime.now().strftime("%Y-%m-%d")
-    remote_filename = f"saved_messages_{file_date}.json"
+    day_files = [get_current_data_file()] + partition_manifest.partition_files(file_date) + [manifest_file_name(file_date)]
+    day_files = [f for f in day_files if os.path.exists(f)]
 
-    # Завантажуємо файл на Storage Box
-    storage_box = StorageBoxManager()
-    if storage_box.connect():
-        success = storage_box.upload_file(data_file, remote_filename)
-        storage_box.close()
+    if not day_files:
+        logger.info("Немає файлу для відправки сьогодні")
+        return False
 
-        if success:
+    data_file = get_current_data_file()
+
+    # Завантажуємо файли на Storage Box (імена на сервері збігаються з локальними)
+    storage_box = AsyncStorageBox()
+    if await storage_box.connect():
+        try:
+            result = await upload_day_files(storage_box, [(f, f) for f in day_files], on_progress=on_progress)
+            success = not result['failed']
+        finally:
+            await storage_box.close()
+
+        if success and not result['uploaded']:
+            logger.info("🧾 Файли дня не змінились з останнього бекапу - нічого не відправлено")
+        elif success:
             logger.info(f"✅ Файл {data_file} успішно відправлено на сервер")
             logger.info(f"📁 Локальний файл збережено до автоматичного очищення о 01:00")
         else:
             logger.error("Не вдалося завантажити файл на Storage Box - локальний файл збережено")
-    else:
-        logger.error("Не вдалося підключитися до Storage Box - локальний файл збережено")
+        return success
+
+    await storage_box.close()
+    logger.error("Не вдалося підключитися до Storage Box - локальний файл збережено")
+    return False
 
 # Функція для відправки логів на Storage Box
 async def upload_logs_to_storage_box():
@@ -663,34 +799,125 @@ async def upload_logs_to_storage_box():
             logger.info("Немає лог-файлів для відправки")
             return
 
-        storage_box = StorageBoxManager()
-        if not storage_box.connect():
+        storage_box = AsyncStorageBox()
+        if not await storage_box.connect():
+            await storage_box.close()
             logger.error("Не вдалося підключитися до Storage Box для відправки логів")
             return
 
-        uploaded_count = 0
-        for log_file in log_files:
-            # Не відправляємо поточний лог-файл
-            if log_file == get_log_filename():
-                continue
-
-            # Відправляємо на сервер
-            remote_filename = f"logs/{log_file}"
-            if storage_box.upload_file(log_file, remote_filename):
-                uploaded_count += 1
-                logger.info(f"✅ Лог {log_file} відправлено на сервер")
-            else:
-                logger.error(f"❌ Помилка відправки логу {log_file}")
+        # Не відправляємо поточний лог-файл
+        log_files = [f for f in log_files if f != get_log_filename()]
 
-        storage_box.close()
-        logger.info(f"📤 Відправлено {uploaded_count} лог-файлів на Storage Box")
+        try:
+            # Вже відправлені логи пропускаються за маніфестом
+            result = await upload_manifest.upload(storage_box, [(f, f"logs/{f}") for f in log_files])
+            for remote_name in result['uploaded']:
+                logger.info(f"✅ Лог {remote_name} відправлено на сервер")
+            for remote_name in result['failed']:
+                logger.error(f"❌ Помилка відправки логу {remote_name}")
+        finally:
+            # Сесія повертається в пул навіть при помилці
+            await storage_box.close()
+        logger.info(
+            f"📤 Відправлено {len(result['uploaded'])} лог-файлів на Storage Box "
+            f"(пропущено {len(result['skipped'])} вже відправлених)"
+        )
 
     except Exception as e:
         logger.error(f"Помилка при відправці логів: {e}")
 
+# Одночасно працює лише одна догрузка (старт, розклад, ручне очищення)
+catch_up_lock = asyncio.Lock()
+
+async def catch_up_uploads():
+    """Відправляє всі закриті дні та логи, які ще не підтверджені на сервері
+
+    Потрібно після простою: якщо бот не працював о 23:58/23:59, файли дня
+    відправляються тут, до будь-якого очищення. Дні відправляються
+    паралельно (не більше, ніж сесій у пулі).
+    """
+    async with catch_up_lock:
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        current_log = get_log_filename()
+
+        # День (або "logs") -> [(local_path, remote_name)], які ще не відправлені
+        batches: Dict[str, List[tuple]] = {}
+        for file in os.listdir('.'):
+            if file.startswith('saved_messages_') and file.endswith('.json'):
+                file_date = date_from_filename(file)
+                if file_date and file_date != current_date and not upload_manifest.is_uploaded(file, file):
+                    batches.setdefault(file_date, []).append((file, file))
+            elif file.startswith('bot_') and file.endswith('.log') and file != current_log:
+                if not upload_manifest.is_uploaded(file, f"logs/{file}"):
+                    batches.setdefault('logs', []).append((file, f"logs/{file}"))
+
+        if not batches:
+            logger.debug("🧾 Невідправлених закритих днів та логів немає")
+            return {'uploaded': 0, 'failed': 0}
+
+        logger.info(f"⏪ Догрузка після простою: {len(batches)} днів/груп файлів")
+        semaphore = asyncio.Semaphore(storage_pool.max_sessions)
+
+        async def upload_batch(name, files):
+            async with semaphore:
+                storage_box = AsyncStorageBox()
+                if not await storage_box.connect():
+                    await storage_box.close()
+                    return {'uploaded': [], 'failed': [remote for _, remote in files]}
+                try:
+                    if name == 'logs':
+                        return await upload_manifest.upload(storage_box, files, push_manifest=False)
+                    return await upload_day_files(storage_box, files, push_manifest=False)
+                finally:
+                    await storage_box.close()
+
+        results = await asyncio.gather(*(upload_batch(name, files) for name, files in sorted(batches.items())))
+        uploaded = sum(len(result['uploaded']) for result in results)
+        failed = sum(len(result['failed']) for result in results)
+
+        if uploaded:
+            # Копія маніфесту відправляється один раз, після всіх паралельних відправок
+            storage_box = AsyncStorageBox()
+            try:
+                if await storage_box.connect():
+                    await upload_manifest.push(storage_box)
+            finally:
+                await storage_box.close()
+
+        logger.info(f"⏪ Догрузка завершена: відправлено {uploaded}, помилок {failed}")
+        return {'uploaded': uploaded, 'failed': failed}
+
+async def catch_up_and_cleanup():
+    """Догрузка невідправленого, потім очищення (видаляється лише підтверджене)"""
+    try:
+        await catch_up_uploads()
+    except Exception as e:
+        logger.error(f"❌ Помилка догрузки невідправлених файлів: {e}")
+    cleanup_old_logs()
+    cleanup_old_local_files()
+
+async def consolidate_months():
+    """Пакує закриті місяці на сервері в архіви зі змістом"""
+    storage_box = AsyncStorageBox()
+    if not await storage_box.connect():
+        await storage_box.close()
+        logger.error("Не вдалося підключитися до Storage Box для пакування місяців")
+        return
+    try:
+        packed = await consolidate_closed_months(storage_box, datetime.now().strftime("%Y-%m"))
+    except Exception as e:
+        logger.error(f"❌ Помилка пакування місяців: {e}")
+        return
+    finally:
+        await storage_box.close()
+
+    if any(packed.values()):
+        # Файли дня переїхали в архів - список на сервері треба перечитати
+        listing_cache.invalidate()
+
 # Функція для очищення старих логів
 def cleanup_old_logs():
-    """Видаляє ВСІ старі лог-файли (крім поточного)"""
+    """Видаляє старі лог-файли (крім поточного), які вже відправлені на сервер"""
     try:
         current_log = get_log_filename()
         deleted_count = 0
@@ -703,6 +930,10 @@ def cleanup_old_logs():
             if log_file == current_log:
                 continue
 
+            if not upload_manifest.confirmed(log_file, f"logs/{log_file}"):
+                logger.warning(f"⚠️ Лог {log_file} не підтверджено на сервері - залишаю локально")
+                continue
+
             try:
                 os.remove(log_file)
                 deleted_count += 1
@@ -735,6 +966,26 @@ def upload_logs_sync():
     else:
         logger.warning("Event loop не доступний для відправки логів")
 
+# Функція-обгортка для догрузки та очищення
+def catch_up_and_cleanup_sync():
+    if main_loop is not None and main_loop.is_running():
+        asyncio.run_coroutine_threadsafe(catch_up_and_cleanup(), main_loop)
+    else:
+        logger.warning("Event loop не доступний для догрузки та очищення")
+
+def catch_up_uploads_sync():
+    if main_loop is not None and main_loop.is_running():
+        asyncio.run_coroutine_threadsafe(catch_up_uploads(), main_loop)
+    else:
+        logger.warning("Event loop не доступний для догрузки")
+
+# Функція-обгортка для пакування місяців
+def consolidate_months_sync():
+    if main_loop is not None and main_loop.is_running():
+        asyncio.run_coroutine_threadsafe(consolidate_months(), main_loop)
+    else:
+        logger.warning("Event loop не доступний для пакування місяців")
+
 # Функція-обгортка для автоматичного сканування
 def auto_scan_sync():
     if main_loop is not None and main_loop.is_running():
@@ -744,7 +995,9 @@ def auto_scan_sync():
 
 # Планувальник для щоденного завантаження
 def setup_scheduler():
-    scheduler = BackgroundScheduler()
+    # Запізнілі запуски (завислий процес, сон VPS) виконуються один раз, а не пропускаються;
+    # повністю пропущені через простій дні відправляє догрузка
+    scheduler = BackgroundScheduler(job_defaults={'coalesce': True, 'misfire_grace_time': 3600})
 
     # Запускаємо о 23:59 кожного дня
     scheduler.add_job(upload_to_storage_box_sync, 'cron', hour=23, minute=59)
@@ -752,15 +1005,24 @@ def setup_scheduler():
     # Відправляємо логи о 23:58 (перед бекапом повідомлень)
     scheduler.add_job(upload_logs_sync, 'cron', hour=23, minute=58)
 
-    # Очищаємо старі логи та файли о 01:00 (після бекапу)
-    scheduler.add_job(cleanup_old_logs, 'cron', hour=1, minute=0)
-    scheduler.add_job(cleanup_old_local_files, 'cron', hour=1, minute=0)
+    # О 01:00 догружаємо невідправлене і лише потім очищаємо старі логи та файли
+    scheduler.add_job(catch_up_and_cleanup_sync, 'cron', hour=1, minute=0)
+
+    # Повторна догрузка днів, які не вдалося відправити раніше (наприклад, сервер був недоступний)
+    scheduler.add_job(catch_up_uploads_sync, 'interval', hours=1)
+
+    # О 02:00 пакуємо закриті місяці на сервері в архіви (після догрузки о 01:00)
+    scheduler.add_job(consolidate_months_sync, 'cron', hour=2, minute=0)
+
+    # Закриваємо SFTP сесії, які довго простоюють
+    scheduler.add_job(storage_pool.prune_idle, 'interval', minutes=5)
 
     scheduler.start()
     logger.info("Планувальник запущено:")
     logger.info("- Щоденне резервне копіювання о 23:59")
     logger.info("- Відправка логів на сервер о 23:58")
-    logger.info("- Очищення старих логів та файлів о 01:00")
+    logger.info("- Догрузка невідправлених днів щогодини та очищення старих логів і файлів о 01:00")
+    logger.info("- Пакування закритих місяців на сервері о 02:00")
     logger.info("- Швидка перевірка повідомлень кожні 0.5 секунди")
     return scheduler
 
@@ -775,6 +1037,31 @@ client_app = Client(
     workers=1  # Один воркер для простоти
 )
 
+# Функція-завантажувач медіа на Storage Box (виконується в окремому потоці)
+def upload_media_file_sync(local_path, remote_filename):
+    storage_box = create_backup_target()
+    if not storage_box.connect():
+        return False
+    try:
+        # Медіа йдуть тим самим обмеженням швидкості, що й бекапи
+        return storage_box.upload_file(local_path, remote_filename, callback=shaped_callback(upload_shaper))
+    finally:
+        storage_box.close()
+
+# Захоплення медіа (воркери запускаються в main)
+media_capture = MediaCapture(
+    client_app,
+    upload_media_file_sync,
+    workers=settings['media_workers'],
+    max_file_size=settings['media_max_size_mb'] * 1024 * 1024
+)
+
+def get_media_info(message):
+    """Метадані медіа повідомлення, якщо захоплення медіа увімкнено"""
+    if not settings['save_media']:
+        return None
+    return extract_media_info(message)
+
 # Глобальний лічільник для тестування
 message_counter = 0
 
@@ -806,8 +1093,9 @@ async def quick_message_check():
         # Але зупиняємося коли знаходимо старе повідомлення
         if settings['save_saved_messages']:
             async for message in client_app.get_chat_history("me"):
-                # Пропускаємо повідомлення без тексту
-                if not message.text:
+                # Пропускаємо повідомлення без тексту (і без медіа, якщо медіа увімкнено)
+                media_info = get_media_info(message)
+                if not message.text and not media_info:
                     continue
 
                 # Зупиняємося коли дійшли до останнього збереженого повідомлення
@@ -816,7 +1104,8 @@ async def quick_message_check():
 
                 # Перевіряємо чи не збережено вже (для надійності)
                 if message.id not in existing_ids:
-                    logger.info(f"⚡ ШВИДКЕ ЗБЕРЕЖЕННЯ (Saved): {message.id} - {message.text[:50]}...")
+                    message_text = message.text or message.caption or ""
+                    logger.info(f"⚡ ШВИДКЕ ЗБЕРЕЖЕННЯ (Saved): {message.id} - {message_text[:50]}...")
 
                     message_data = {
                         "message_id": message.id,
@@ -827,13 +1116,16 @@ async def quick_message_check():
                         "from_user_id": message.from_user.id if message.from_user else ALLOWED_USER_ID,
                         "from_username": message.from_user.username if message.from_user else None,
                         "from_first_name": message.from_user.first_name if message.from_user else "Me",
-                        "text": message.text,
+                        "text": message_text,
                         "date": message.date.isoformat(),
                         "is_outgoing": (message.from_user.id == ALLOWED_USER_ID) if message.from_user else True,
-                        "is_edited": False
+                        "is_edited": False,
+                        "media": media_info
                     }
 
-                    save_message(message_data)
+                    ingest_queue.submit(message_data)
+                    if media_info:
+                        media_capture.enqueue(message, media_info)
                     new_messages_count += 1
 
                     # Додаємо до існуючих ID щоб уникнути дублікатів в цій же ітерації
@@ -861,8 +1153,8 @@ async def check_private_chats():
     global last_dialogs_check
 
     try:
-        # Перевіряємо тільки якщо увімкнено збереження приватних чатів
-        if not settings['save_private_chats'] and not settings['save_groups'] and not settings['save_channels']:
+        # Перевіряємо тільки якщо є що зберігати в діалогах
+        if not chat_filter.has_dialog_rules():
             return
 
         current_time = asyncio.get_event_loop().time()
@@ -873,9 +1165,8 @@ async def check_private_chats():
 
         last_dialogs_check = current_time
 
-        # Завантажуємо існуючі повідомлення
-        data = load_messages()
-        existing_ids = set(msg['message_id'] for msg in data['messages'])
+        # Завантажуємо існуючі повідомлення (основний файл та частини дня)
+        existing_ids = load_current_message_ids()
         new_messages_count = 0
 
         # Перевіряємо останні діалоги з налаштованою кількістю
@@ -888,19 +1179,9 @@ async def check_private_chats():
             if chat.id == ALLOWED_USER_ID:
                 continue
 
-            # Перевіряємо тип чату
-            chat_type_str = str(chat.type).upper()
-
-            # Визначаємо чи потрібно перевіряти цей чат
-            should_check = False
-            if 'PRIVATE' in chat_type_str and settings['save_private_chats']:
-                should_check = True
-            elif ('GROUP' in chat_type_str or 'SUPERGROUP' in chat_type_str) and settings['save_groups']:
-                should_check = True
-            elif 'CHANNEL' in chat_type_str and settings['save_channels']:
-                should_check = True
-
-            if not should_check:
+            # Визначаємо чи потрібно перевіряти цей чат (скомпільовані правила)
+            kind = chat_kind(chat.type)
+            if not chat_filter.should_check_chat(chat.id, kind):
                 continue
 
             # Перевіряємо останні повідомлення з цього чату (з налаштуванням)
@@ -909,22 +1190,30 @@ async def check_private_chats():
                 async for message in client_app.get_chat_history(chat.id, limit=settings['messages_per_dialog']):
                     message_count += 1
 
-                    # Пропускаємо повідомлення без тексту
-                    if not message.text:
+                    # Пропускаємо повідомлення без тексту (і без медіа, якщо медіа увімкнено)
+                    media_info = get_media_info(message)
+                    if not message.text and not media_info:
                         continue
 
                     # Перевіряємо чи не збережено вже
                     if message.id in existing_ids:
                         continue
 
-                    logger.info(f"⚡ ШВИДКЕ ЗБЕРЕЖЕННЯ (Private): {message.id} від {chat.id} - {message.text[:50]}...")
+                    message_text = message.text or message.caption or ""
+
+                    # Правила за відправником та ключовими словами
+                    sender_id = message.from_user.id if message.from_user else None
+                    if not chat_filter.evaluate(chat.id, kind, sender_id, message_text):
+                        continue
+
+                    logger.info(f"⚡ ШВИДКЕ ЗБЕРЕЖЕННЯ (Private): {message.id} від {chat.id} - {message_text[:50]}...")
 
                     # Визначаємо тип чату та назву
                     chat_type = str(chat.type)
                     chat_title = getattr(chat, 'title', None)
 
                     # Для приватних чатів додаємо ім'я
-                    if 'PRIVATE' in chat_type.upper():
+                    if kind == 'PRIVATE':
                         if hasattr(chat, 'first_name'):
                             chat_title = chat.first_name
                             if hasattr(chat, 'last_name') and chat.last_name:
@@ -939,13 +1228,16 @@ async def check_private_chats():
                         "from_user_id": message.from_user.id if message.from_user else ALLOWED_USER_ID,
                         "from_username": message.from_user.username if message.from_user else None,
                         "from_first_name": message.from_user.first_name if message.from_user else "Unknown",
-                        "text": message.text,
+                        "text": message_text,
                         "date": message.date.isoformat(),
                         "is_outgoing": (message.from_user.id == ALLOWED_USER_ID) if message.from_user else False,
-                        "is_edited": False
+                        "is_edited": False,
+                        "media": media_info
                     }
 
-                    save_message(message_data)
+                    ingest_queue.submit(message_data)
+                    if media_info:
+                        media_capture.enqueue(message, media_info)
                     new_messages_count += 1
                     existing_ids.add(message.id)
 
@@ -1102,8 +1394,10 @@ async def handle_raw_update(_client: Client, update, users, _chats):
                         "is_outgoing": from_user_id == ALLOWED_USER_ID or getattr(message_to_process, 'out', False),
                         "is_edited": False
                     }
-                    save_message(message_data)
-                    logger.info(f"✅ МИТТЄВО збережено в {get_current_data_file()}")
+                    if msg_date:
+                        capture_latency.record(msg_date)
+                    ingest_queue.submit(message_data)
+                    logger.info(f"✅ МИТТЄВО поставлено в чергу збереження ({get_target_data_file(message_data)})")
                 else:
                     logger.info("⚠️ Не знайдено інформацію про користувача")
             else:
@@ -1124,22 +1418,13 @@ def should_save_message(message: Message) -> bool:
     if message.chat.id == ALLOWED_USER_ID:
         return settings['save_saved_messages']
 
-    # Перевіряємо тип чату
-    chat_type = str(message.chat.type)
-
-    # Приватні чати (не секретні)
-    if 'PRIVATE' in chat_type.upper():
-        return settings['save_private_chats']
-
-    # Групи
-    if 'GROUP' in chat_type.upper() or 'SUPERGROUP' in chat_type.upper():
-        return settings['save_groups']
-
-    # Канали
-    if 'CHANNEL' in chat_type.upper():
-        return settings['save_channels']
-
-    return False
+    sender_id = message.from_user.id if message.from_user else None
+    return chat_filter.evaluate(
+        message.chat.id,
+        chat_kind(message.chat.type),
+        sender_id,
+        message.text or message.caption
+    )
 
 # Резервний обробник для звичайних повідомлень
 @client_app.on_message()
@@ -1160,16 +1445,9 @@ async def handle_regular_messages(_client: Client, message: Message):
             logger.info(f"⏭️ Пропускаємо чат {message.chat.id} ({message.chat.type}) - вимкнено в налаштуваннях")
             return
 
-        # Перевіряємо чи це повідомлення вже збережено (уникаємо дублікатів)
-        data = load_messages()
-        existing_ids = [msg['message_id'] for msg in data['messages']]
-
-        if message.id in existing_ids:
-            logger.info(f"⚠️ Повідомлення {message.id} вже збережено, пропускаємо")
-            return
-
-        # Зберігаємо якщо є текст
-        if message.text:
+        # Зберігаємо якщо є текст (або медіа, якщо медіа увімкнено)
+        media_info = get_media_info(message)
+        if message.text or media_info:
             logger.info("💾 РЕЗЕРВНЕ ЗБЕРЕЖЕННЯ!")
 
             # Визначаємо тип чату
@@ -1177,7 +1455,7 @@ async def handle_regular_messages(_client: Client, message: Message):
             chat_title = "Збережені повідомлення" if message.chat.id == ALLOWED_USER_ID else getattr(message.chat, 'title', None)
 
             # Для приватних чатів додаємо ім'я співрозмовника
-            if 'PRIVATE' in chat_type.upper() and message.chat.id != ALLOWED_USER_ID:
+            if chat_kind(message.chat.type) == 'PRIVATE' and message.chat.id != ALLOWED_USER_ID:
                 if message.from_user and message.from_user.id != ALLOWED_USER_ID:
                     chat_title = f"{message.from_user.first_name}"
                     if message.from_user.last_name:
@@ -1196,13 +1474,26 @@ async def handle_regular_messages(_client: Client, message: Message):
                 "from_user_id": message.from_user.id if message.from_user else ALLOWED_USER_ID,
                 "from_username": message.from_user.username if message.from_user else None,
                 "from_first_name": message.from_user.first_name if message.from_user else "Me",
-                "text": message.text,
+                "text": message.text or message.caption or "",
                 "date": message.date.isoformat(),
                 "is_outgoing": (message.from_user.id == ALLOWED_USER_ID) if message.from_user else True,
-                "is_edited": False
+                "is_edited": False,
+                "media": media_info
             }
-            save_message(message_data)
-            logger.info(f"✅ РЕЗЕРВНО збережено в {get_current_data_file()}")
+
+            # Перевіряємо чи це повідомлення вже збережено (тільки у файлі, куди воно потрапить)
+            data = load_messages(get_target_data_file(message_data))
+            existing_ids = [msg['message_id'] for msg in data['messages']]
+
+            if message.id in existing_ids:
+                logger.info(f"⚠️ Повідомлення {message.id} вже збережено, пропускаємо")
+                return
+
+            capture_latency.record(message.date.timestamp())
+            ingest_queue.submit(message_data)
+            if media_info:
+                media_capture.enqueue(message, media_info)
+            logger.info(f"✅ РЕЗЕРВНО збережено в {get_target_data_file(message_data)}")
         else:
             logger.info("⚠️ Пропускаємо (немає тексту)")
 
@@ -1242,8 +1533,81 @@ async def status(update: Update, _context: ContextType) -> None:
 
     data = load_messages()
     message_count = len(data["messages"])
+    status_text = f"📊 Статус: збережено {message_count} повідомлень за сьогодні ({CURRENT_DATE})"
+
+    ingest_stats = ingest_queue.get_stats()
+    status_text += (
+        f"\n🚦 Черга збереження: затримка {ingest_stats['latency_ms']:.0f}мс"
+        f"{' (перевантаження)' if ingest_stats['overloaded'] else ''}, "
+        f"відкладено {ingest_stats['deferred_pending']}"
+    )
+    for lane, lane_stats in ingest_stats['lanes'].items():
+        if lane_stats['submitted']:
+            status_text += (
+                f"\n  • {lane}: записано {lane_stats['persisted']}, в черзі {lane_stats['queued']}, "
+                f"відкладено {lane_stats['deferred']}, догнано {lane_stats['caught_up']}, "
+                f"проріджено {lane_stats['sampled_out']}"
+            )
+
+    if settings['save_media']:
+        media_stats = media_capture.get_stats()
+        status_text += (
+            f"\n📎 Медіа: відправлено {media_stats['uploaded']}, "
+            f"дублікатів {media_stats['deduplicated']}, "
+            f"в черзі {media_stats['queue_size']}, "
+            f"пропущено {media_stats['skipped_too_large'] + media_stats['dropped_queue_full']}, "
+            f"помилок {media_stats['failed']}"
+        )
+
+    cache_stats = file_cache.get_stats()
+    status_text += (
+        f"\n💽 Кеш файлів: {cache_stats['files']} файлів, {cache_stats['bytes'] / 1024 / 1024:.1f} МБ, "
+        f"влучань {cache_stats['hit_rate']:.0%}, витіснено {cache_stats['evictions']}"
+    )
+
+    viewer_stats = user_viewing_state.get_stats()
+    listing_stats = listing_cache.get_stats()
+    status_text += (
+        f"\n🧠 Кеш переглядача: {viewer_stats['entries']} файлів, "
+        f"{viewer_stats['bytes'] / 1024 / 1024:.1f} з {viewer_stats['max_bytes'] / 1024 / 1024:.0f} МБ, "
+        f"влучань {viewer_stats['hit_rate']:.0%}, витіснено {viewer_stats['evictions']}, "
+        f"застаріло {viewer_stats['expired']}"
+        f"\n📂 Кеш списку файлів: {listing_stats['days']} днів, влучань {listing_stats['hits']}, "
+        f"промахів {listing_stats['misses']}"
+    )
+
+    timeline_stats = chat_timeline.get_stats()
+    status_text += (
+        f"\n💬 Індекс розмов: {timeline_stats['chats']} чатів, {timeline_stats['records']} записів "
+        f"({timeline_stats['bytes'] / 1024:.0f} КБ)"
+    )
+
+    render_stats = render_cache.get_stats()
+    status_text += (
+        f"\n🖼️ Кеш екранів: {render_stats['entries']} екранів, влучань {render_stats['hit_rate']:.0%}, "
+        f"витіснено {render_stats['evictions']}, версія даних {data_version.value}"
+    )
+
+    prefetch_stats = viewer_prefetcher.get_stats()
+    if prefetch_stats['scheduled']:
+        status_text += (
+            f"\n🔮 Попереднє завантаження: {prefetch_stats['completed']} з {prefetch_stats['scheduled']}, "
+            f"використано {prefetch_stats['joined']}, скасовано {prefetch_stats['cancelled']}, "
+            f"активних {prefetch_stats['active']}"
+        )
+
+    if settings['continuous_backup']:
+        segment_stats = segment_shipper.get_stats()
+        last_shipped = segment_stats['last_shipped'][11:19] if segment_stats['last_shipped'] else '-'
+        status_text += (
+            f"\n📦 Сегменти: відправлено {segment_stats['shipped']} "
+            f"({segment_stats['shipped_messages']} повід., {segment_stats['shipped_bytes'] / 1024:.0f} КБ), "
+            f"відкритий {segment_stats['open_messages']} повід., "
+            f"в черзі {segment_stats['pending_segments']}, останній о {last_shipped}"
+        )
+
     if update.message:
-        await update.message.reply_text(f"📊 Статус: збережено {message_count} повідомлень за сьогодні ({CURRENT_DATE})")
+        await update.message.reply_text(status_text)
 
 async def backup_now(update: Update, _context: ContextType) -> None:
     user_id = update.effective_user.id
@@ -1253,9 +1617,18 @@ async def backup_now(update: Update, _context: ContextType) -> None:
         return
 
     if update.message:
-        await update.message.reply_text("🔄 Початок миттєвого резервного копіювання...")
-        await upload_to_storage_box()
-        await update.message.reply_text("✅ Резервне копіювання завершено!")
+        progress_message = await update.message.reply_text("🔄 Початок миттєвого резервного копіювання...")
+
+        async def report_progress(filename, percent):
+            try:
+                await progress_message.edit_text(f"📤 Завантаження {filename}… {percent}%")
+            except Exception as e:
+                logger.debug(f"Не вдалося оновити прогрес: {e}")
+
+        if await upload_to_storage_box(on_progress=report_progress):
+            await progress_message.edit_text("✅ Резервне копіювання завершено!")
+        else:
+            await progress_message.edit_text("❌ Резервне копіювання не вдалося - файли збережено локально")
 
 async def clientstatus(update: Update, _context: ContextType) -> None:
     user_id = update.effective_user.id
@@ -1285,31 +1658,74 @@ async def view_history(update: Update, context: ContextType) -> None:
 
     await list_files(update, context, 0)
 
-async def list_files(update: Update, context: ContextType, page: int = 0) -> None:
-    user_id = update.effective_user.id
+async def get_remote_listing(refresh=False):
+    """Список днів на сервері (зі спільного кешу, поки не минув TTL)"""
+    files = None if refresh else listing_cache.get()
+    if files is not None:
+        return files
 
-    # Отримуємо список файлів з Storage Box
-    storage_box = StorageBoxManager()
-    if not storage_box.connect():
+    storage_box = AsyncStorageBox()
+    if not await storage_box.connect():
+        await storage_box.close()
+        return None
+    try:
+        return await storage_box.list_files()
+    finally:
+        await storage_box.close()
+
+async def list_files(update: Update, context: ContextType, page: int = 0) -> None:
+    # Отримуємо список файлів з Storage Box (або з кешу)
+    files = await get_remote_listing()
+    if files is None:
         if update.message:
             await update.message.reply_text("❌ Не вдалося підключитися до Storage Box")
         return
 
-    files = storage_box.list_files()
-    storage_box.close()
-
     if not files:
         if update.message:
             await update.message.reply_text("📁 Файлів не знайдено.")
         return
 
-    # Зберігаємо файли в кеш для цього користувача
-    files_cache[str(user_id)] = files
+    months = group_by_month(files)
+    if len(months) == 1:
+        # Лише один місяць - одразу показуємо дні
+        month = next(iter(months))
+        await show_files_page(update, context, page, months[month], month)
+    else:
+        await show_months(update, context, months)
+
+async def show_months(update: Update, _context: ContextType, months: Dict[str, List[str]]) -> None:
+    """Показує місяці з кількістю днів (групування за роками)"""
+    keyboard = []
+    row = []
+    current_year = None
+    for month, month_files in months.items():
+        year = month[:4]
+        if year != current_year:
+            if row:
+                keyboard.append(row)
+                row = []
+            keyboard.append([InlineKeyboardButton(f"🗓️ {year}", callback_data='dummy')])
+            current_year = year
+        row.append(InlineKeyboardButton(f"{month[5:]} ({len(month_files)})", callback_data=f"month_{month}"))
+        if len(row) == 4:
+            keyboard.append(row)
+            row = []
+    if row:
+        keyboard.append(row)
+    keyboard.append([InlineKeyboardButton("💬 Розмови по чатах", callback_data="tl")])
+    keyboard.append([InlineKeyboardButton("🔄 Оновити", callback_data="refresh_files")])
 
-    # Відображаємо файли з пагінацією
-    await show_files_page(update, context, page, files)
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    total = sum(len(month_files) for month_files in months.values())
+    text = f"📁 **Файли з повідомленнями** за місяцями:\n\n📊 Всього днів: {total}"
 
-async def show_files_page(update: Update, _context: ContextType, page: int, files: List[str]) -> None:
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    elif update.message:
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def show_files_page(update: Update, _context: ContextType, page: int, files: List[str], month: str) -> None:
     # Розраховуємо пагінацію
     items_per_page = 10
     total_pages = (len(files) + items_per_page - 1) // items_per_page
@@ -1331,26 +1747,54 @@ async def show_files_page(update: Update, _context: ContextType, page: int, file
     # Додаємо кнопки навігації
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Попередня", callback_data=f"page_{page-1}"))
+        nav_buttons.append(InlineKeyboardButton("⬅️ Попередня", callback_data=f"page_{month}_{page-1}"))
     if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("Наступна ➡️", callback_data=f"page_{page+1}"))
+        nav_buttons.append(InlineKeyboardButton("Наступна ➡️", callback_data=f"page_{month}_{page+1}"))
 
     if nav_buttons:
         keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton("🗓️ Всі місяці", callback_data="months")])
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    text = f"📁 **Файли з повідомленнями** (сторінка {page+1} з {total_pages}):\n\n📊 Всього файлів: {len(files)}"
+    text = f"📁 **Файли за {month}** (сторінка {page+1} з {total_pages}):\n\n📊 Всього файлів: {len(files)}"
 
     if update.callback_query:
         await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     elif update.message:
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
+async def show_month_files(update: Update, context: ContextType, month: str, page: int = 0, refresh: bool = False) -> None:
+    """Показує дні місяця (список береться зі спільного кешу)"""
+    files = await get_remote_listing(refresh=refresh)
+    if files is None:
+        await update.callback_query.edit_message_text("❌ Не вдалося підключитися до Storage Box")
+        return
+
+    months = group_by_month(files)
+    if month in months:
+        await show_files_page(update, context, page, months[month], month)
+    elif months:
+        await show_months(update, context, months)
+    else:
+        await update.callback_query.edit_message_text("📁 Файлів не знайдено.")
+
 async def refresh_settings_message(update: Update, _context: ContextType) -> None:
     """Оновлює повідомлення з налаштуваннями"""
     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+    # Текст залежить від налаштувань та збережених повідомлень дня
+    render_key = ("settings", datetime.now().strftime("%Y-%m-%d"), data_version.value,
+                  tuple(sorted((key, repr(value)) for key, value in settings.items())))
+    rendered = render_cache.get(render_key)
+    if rendered is not None:
+        settings_text, reply_markup = rendered
+        if update.callback_query:
+            await update.callback_query.edit_message_text(settings_text, parse_mode='Markdown', reply_markup=reply_markup)
+        elif update.message:
+            await update.message.reply_text(settings_text, parse_mode='Markdown', reply_markup=reply_markup)
+        return
+
     # Завантажуємо дані для статистики
     data = load_messages()
     stats = {
@@ -1377,12 +1821,17 @@ async def refresh_settings_message(update: Update, _context: ContextType) -> Non
         else:
             stats['OTHER'] += 1
 
+    # Повідомлення груп і каналів у частинах дня
+    for bucket, count in partition_manifest.type_counts(datetime.now().strftime("%Y-%m-%d")).items():
+        stats[bucket] = stats.get(bucket, 0) + count
+
     settings_text = (
         "⚙️ **Налаштування збереження повідомлень:**\n\n"
         f"📱 Збережені повідомлення: {'✅ Увімкнено' if settings['save_saved_messages'] else '❌ Вимкнено'}\n"
         f"💬 Приватні чати: {'✅ Увімкнено' if settings['save_private_chats'] else '❌ Вимкнено'}\n"
         f"👥 Групи: {'✅ Увімкнено' if settings['save_groups'] else '❌ Вимкнено'}\n"
-        f"📢 Канали: {'✅ Увімкнено' if settings['save_channels'] else '❌ Вимкнено'}\n\n"
+        f"📢 Канали: {'✅ Увімкнено' if settings['save_channels'] else '❌ Вимкнено'}\n"
+        f"📎 Медіа: {'✅ Увімкнено' if settings['save_media'] else '❌ Вимкнено'}\n\n"
         "⚙️ **Технічні налаштування:**\n"
         f"⏱️ Інтервал перевірки Збережених: {settings['check_interval']} сек\n"
         f"⏱️ Інтервал перевірки діалогів: {settings['dialogs_check_interval']} сек\n"
@@ -1418,6 +1867,12 @@ async def refresh_settings_message(update: Update, _context: ContextType) -> Non
                 callback_data='toggle_channels'
             )
         ],
+        [
+            InlineKeyboardButton(
+                f"📎 Медіа: {'✅' if settings['save_media'] else '❌'}",
+                callback_data='toggle_media'
+            )
+        ],
         [
             InlineKeyboardButton("⚙️ Технічні налаштування", callback_data='tech_settings')
         ],
@@ -1427,6 +1882,7 @@ async def refresh_settings_message(update: Update, _context: ContextType) -> Non
     ]
 
     reply_markup = InlineKeyboardMarkup(keyboard)
+    render_cache.put(render_key, settings_text, reply_markup)
 
     if update.callback_query:
         await update.callback_query.edit_message_text(settings_text, parse_mode='Markdown', reply_markup=reply_markup)
@@ -1447,6 +1903,14 @@ async def show_tech_settings(update: Update, _context: ContextType) -> None:
         "Скільки діалогів перевіряти за раз\n\n"
         f"📝 **Повідомлень з діалогу:** {settings['messages_per_dialog']}\n"
         "Скільки останніх повідомлень брати з кожного діалогу\n\n"
+        f"🗂️ **Партиціювання груп/каналів:** {settings['partition_mode']}\n"
+        "Окремі файли по годинах та/або чатах замість одного великого файлу дня\n\n"
+        f"📦 **Безперервний бекап:** {'✅' if settings['continuous_backup'] else '❌'}\n"
+        f"Сегменти на сервер кожні {settings['segment_interval_minutes']} хв "
+        f"або {settings['segment_max_messages']} повідомлень\n\n"
+        f"🚰 **Ліміт відправки бекапів:** "
+        f"{str(settings['upload_rate_limit_kb']) + ' КБ/с' if settings['upload_rate_limit_kb'] else 'без ліміту'}\n"
+        f"Сповільнюється автоматично, якщо затримка повідомлень > {settings['upload_latency_threshold']} сек\n\n"
         "💡 Натисніть на кнопку щоб змінити значення"
     )
 
@@ -1479,6 +1943,22 @@ async def show_tech_settings(update: Update, _context: ContextType) -> None:
             InlineKeyboardButton("10", callback_data='set_messages_per_dialog_10'),
             InlineKeyboardButton("20", callback_data='set_messages_per_dialog_20')
         ],
+        [InlineKeyboardButton("🗂️ Партиціювання", callback_data='dummy')],
+        [
+            InlineKeyboardButton(mode, callback_data=f'set_partition_mode_{mode}')
+            for mode in PARTITION_MODES
+        ],
+        [InlineKeyboardButton(
+            f"📦 Безперервний бекап: {'✅' if settings['continuous_backup'] else '❌'}",
+            callback_data='toggle_continuous_backup'
+        )],
+        [InlineKeyboardButton("🚰 Ліміт відправки", callback_data='dummy')],
+        [
+            InlineKeyboardButton("256 КБ/с", callback_data='set_upload_rate_256'),
+            InlineKeyboardButton("1 МБ/с", callback_data='set_upload_rate_1024'),
+            InlineKeyboardButton("4 МБ/с", callback_data='set_upload_rate_4096'),
+            InlineKeyboardButton("Без ліміту", callback_data='set_upload_rate_0')
+        ],
         [InlineKeyboardButton("◀️ Назад", callback_data='back_to_settings')]
     ]
 
@@ -1506,25 +1986,34 @@ async def handle_callback_query(update: Update, context: ContextType) -> None:
     # Обробка налаштувань
     if data == 'toggle_saved':
         settings['save_saved_messages'] = not settings['save_saved_messages']
+        chat_filter.compile(settings)
         await query.answer(f"📱 Збережені повідомлення: {'✅ Увімкнено' if settings['save_saved_messages'] else '❌ Вимкнено'}")
         # Оновлюємо повідомлення
         await refresh_settings_message(update, context)
 
     elif data == 'toggle_private':
         settings['save_private_chats'] = not settings['save_private_chats']
+        chat_filter.compile(settings)
         await query.answer(f"💬 Приватні чати: {'✅ Увімкнено' if settings['save_private_chats'] else '❌ Вимкнено'}")
         await refresh_settings_message(update, context)
 
     elif data == 'toggle_groups':
         settings['save_groups'] = not settings['save_groups']
+        chat_filter.compile(settings)
         await query.answer(f"👥 Групи: {'✅ Увімкнено' if settings['save_groups'] else '❌ Вимкнено'}")
         await refresh_settings_message(update, context)
 
     elif data == 'toggle_channels':
         settings['save_channels'] = not settings['save_channels']
+        chat_filter.compile(settings)
         await query.answer(f"📢 Канали: {'✅ Увімкнено' if settings['save_channels'] else '❌ Вимкнено'}")
         await refresh_settings_message(update, context)
 
+    elif data == 'toggle_media':
+        settings['save_media'] = not settings['save_media']
+        await query.answer(f"📎 Медіа: {'✅ Увімкнено' if settings['save_media'] else '❌ Вимкнено'}")
+        await refresh_settings_message(update, context)
+
     elif data == 'tech_settings':
         await query.answer()
         await show_tech_settings(update, context)
@@ -1557,6 +2046,28 @@ async def handle_callback_query(update: Update, context: ContextType) -> None:
         await query.answer(f"📝 Повідомлень з діалогу: {value}")
         await show_tech_settings(update, context)
 
+    elif data.startswith('set_partition_mode_'):
+        mode = data[len('set_partition_mode_'):]
+        if mode in PARTITION_MODES:
+            settings['partition_mode'] = mode
+        await query.answer(f"🗂️ Партиціювання: {settings['partition_mode']}")
+        await show_tech_settings(update, context)
+
+    elif data == 'toggle_continuous_backup':
+        settings['continuous_backup'] = not settings['continuous_backup']
+        if settings['continuous_backup']:
+            # Все, що вже збережено сьогодні, піде в перший сегмент
+            segment_shipper.recover(datetime.now().strftime("%Y-%m-%d"), load_day_messages())
+        await query.answer(f"📦 Безперервний бекап: {'✅ Увімкнено' if settings['continuous_backup'] else '❌ Вимкнено'}")
+        await show_tech_settings(update, context)
+
+    elif data.startswith('set_upload_rate_'):
+        value = int(data.split('_')[-1])
+        settings['upload_rate_limit_kb'] = value
+        upload_shaper.configure(rate_limit=value * 1024)
+        await query.answer(f"🚰 Ліміт відправки: {str(value) + ' КБ/с' if value else 'без ліміту'}")
+        await show_tech_settings(update, context)
+
     elif data == 'back_to_settings':
         await query.answer()
         await refresh_settings_message(update, context)
@@ -1564,24 +2075,32 @@ async def handle_callback_query(update: Update, context: ContextType) -> None:
     elif data == 'back_to_files':
         await query.answer()
         # Очищаємо кеш перегляду файлів для цього користувача
+        viewer_prefetcher.cancel(user_id)
         user_id_str = str(user_id)
         keys_to_remove = [k for k in user_viewing_state.keys() if str(k).startswith(f"{user_id_str}_")]
+        month = None
         for key in keys_to_remove:
-            del user_viewing_state[key]
-        # Повертаємось до списку файлів
-        if user_id_str in files_cache:
-            await show_files_page(update, context, 0, files_cache[user_id_str])
-        else:
-            await query.edit_message_text("📁 Список файлів застарів. Використайте кнопку '📂 Історія' для оновлення.")
+            month = (date_from_filename(user_viewing_state.pop(key)['filename']) or '')[:7] or month
+        # Повертаємось до місяця файлу, який переглядали (або до списку місяців)
+        await show_month_files(update, context, month or '')
+
+    elif data in ('months', 'refresh_files'):
+        files = await get_remote_listing(refresh=data == 'refresh_files')
+        if files is None:
+            await query.answer("❌ Не вдалося підключитися до Storage Box", show_alert=True)
+            return
+        await query.answer("🔄 Оновлено" if data == 'refresh_files' else None)
+        await show_months(update, context, group_by_month(files))
+
+    elif data.startswith("month_"):
+        await query.answer()
+        await show_month_files(update, context, data[len("month_"):])
 
     elif data.startswith("page_"):
-        page = int(data.split("_")[1])
-        user_id_str = str(user_id)
-        if user_id_str in files_cache:
-            await query.answer()
-            await show_files_page(update, context, page, files_cache[user_id_str])
-        else:
-            await query.answer("📁 Список файлів застарів. Будь ласка, запросіть його знову.", show_alert=True)
+        # Формат: page_YYYY-MM_N
+        _, month, page = data.split("_")
+        await query.answer()
+        await show_month_files(update, context, month, int(page))
 
     elif data.startswith("view_"):
         filename = data.split("_", 1)[1]
@@ -1598,61 +2117,329 @@ async def handle_callback_query(update: Update, context: ContextType) -> None:
             await query.answer()
             await view_file(update, context, filename, msg_page)
 
+    elif data in ("vf", "vf_chats", "vf_senders"):
+        await query.answer()
+        await show_filter_menu(update, context, data[len("vf_"):])
+
+    elif data.startswith("vf_c_") or data.startswith("vf_s_"):
+        # Повторне натискання на активний чат/відправника знімає фільтр
+        field = 'chat' if data.startswith("vf_c_") else 'sender'
+        value = int(data[len("vf_c_"):])
+        await query.answer()
+        state = user_viewing_state.peek(f"{user_id}_{viewer_current_file.get(user_id)}") or {}
+        if (state.get('filter') or {}).get(field) == value:
+            value = None
+        await apply_view_filter(update, context, **{field: value})
+
+    elif data.startswith("vf_d_"):
+        direction = data[len("vf_d_"):]
+        await query.answer()
+        await apply_view_filter(update, context, direction=None if direction == 'all' else direction)
+
+    elif data == "vf_clear":
+        await query.answer("✖️ Фільтр скинуто")
+        await apply_view_filter(update, context, chat=None, sender=None, direction=None, text=None)
+
+    elif data == "vf_back":
+        await query.answer()
+        await apply_view_filter(update, context)
+
+    elif data == "tl":
+        await query.answer()
+        await show_recent_chats(update, context)
+
+    elif data.startswith("tl_"):
+        # Формат: tl_<chat_id>_<сторінка>
+        _, chat_id, timeline_page = data.split("_")
+        await query.answer()
+        await view_chat_timeline(update, context, int(chat_id), int(timeline_page))
+
+    elif data.startswith("parts_"):
+        filename = data.split("_", 1)[1]
+        await query.answer()
+        await show_partitions(update, context, filename)
+
     elif data.startswith("download_"):
         filename = data.split("_", 1)[1]
         await query.answer("📥 Завантажую файл...")
         await download_file_to_user(update, context, filename)
 
+async def download_day_segments(storage_box, date):
+    """Збирає день з сегментів безперервного бекапу"""
+    manifest_path = await file_cache.fetch(storage_box, segment_manifest_name(date))
+    if not manifest_path:
+        return []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    # Сегменти незмінні, тому після першого перегляду беруться з локального кешу
+    segments = []
+    for entry in manifest.get('segments', []):
+        segment_path = await file_cache.fetch(storage_box, entry['file'])
+        if not segment_path:
+            logger.warning(f"⚠️ Сегмент {entry['file']} недоступний")
+            continue
+        with open(segment_path, 'r', encoding='utf-8') as f:
+            segments.append(json.load(f).get('messages', []))
+
+    return merge_segments(segments)
+
+async def open_indexed_remote(storage_box, filename):
+    """Заголовок та індекс файлу indexed-v1 на сервері (None - читаємо файл повністю)"""
+    # Файл, який вже є в локальному кеші, дешевше прочитати з диска
+    remote_stat = await storage_box.stat_file(filename)
+    if remote_stat is None or file_cache.get(filename, *remote_stat):
+        return None
+
+    head = await storage_box.read_range(filename, 0, HEADER_SIZE)
+    header = parse_header(head) if head else None
+    if header is None:
+        return None
+
+    raw_index = await storage_box.read_range(filename, header['index_offset'], header['index_length'])
+    if raw_index is None:
+        return None
+    return {'count': header['count'], 'index': parse_index(raw_index), 'loaded': {}}
+
+async def get_messages_at(state, positions, cache_key=None):
+    """Повідомлення за позиціями: з пам'яті або діапазонами байтів з сервера"""
+    if state['messages'] is not None:
+        return [state['messages'][i] for i in positions]
+
+    missing = sorted(i for i in set(positions) if i not in state['loaded'])
+    if missing:
+        # Близькі позиції читаються одним діапазоном (фільтр дає розкидані позиції)
+        runs = []
+        for i in missing:
+            if runs and i - runs[-1][1] <= 8:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+
+        # Підключення всередині try: скасована попередня задача все одно поверне сесію в пул
+        storage_box = AsyncStorageBox()
+        try:
+            if not await storage_box.connect():
+                return None
+            for first, last in runs:
+                offset, length = record_range(state['index'], first, last)
+                data = await storage_box.read_range(state['filename'], offset, length)
+                if data is None:
+                    return None
+
+                records = slice_records(data, offset, state['index'], first, last)
+                for i, record in enumerate(records, start=first):
+                    state['loaded'][i] = record
+                # Дочитані сторінки збільшують розмір запису в кеші переглядача
+                if cache_key:
+                    user_viewing_state.add_bytes(cache_key, approx_size(records))
+        finally:
+            await storage_box.close()
+
+    return [state['loaded'][i] for i in positions]
+
+FILTER_INDEX_BATCH = 500
+
+async def get_filter_index(state, cache_key):
+    """Вторинні індекси файлу (будуються один раз та зберігаються в стані переглядача)"""
+    if state.get('filter_index') is not None:
+        return state['filter_index']
+
+    filter_index = FilterIndex()
+    if state['messages'] is not None:
+        for message_data in state['messages']:
+            filter_index.add(message_data)
+    else:
+        # Записи читаються пачками і не залишаються в пам'яті - лише індекси
+        storage_box = AsyncStorageBox()
+        try:
+            if not await storage_box.connect():
+                return None
+            for first in range(0, state['count'], FILTER_INDEX_BATCH):
+                last = min(first + FILTER_INDEX_BATCH, state['count']) - 1
+                offset, length = record_range(state['index'], first, last)
+                data = await storage_box.read_range(state['filename'], offset, length)
+                if data is None:
+                    return None
+                for message_data in slice_records(data, offset, state['index'], first, last):
+                    filter_index.add(message_data)
+        finally:
+            await storage_box.close()
+
+    state['filter_index'] = filter_index
+    user_viewing_state.add_bytes(cache_key, approx_size(vars(filter_index)))
+    logger.debug(f"🔍 Індекси фільтрів для {state['filename']}: {filter_index.count} повідомлень, {len(filter_index.by_chat)} чатів")
+    return filter_index
+
+async def load_view_state(storage_box, filename, metadata_only=False):
+    """Стан переглядача для файлу (через підключений AsyncStorageBox)
+
+    metadata_only - лише маніфест частин та індекс: файл без індексу не
+    скачується (повертається None). None також, якщо файлу немає.
+    """
+    # Маніфест частин дня (групи та канали можуть лежати в окремих файлах)
+    partitions = {}
+    local_path = None
+    segment_messages = []
+    if is_day_file(filename):
+        manifest_path = await file_cache.fetch(storage_box, manifest_file_name(date_from_filename(filename)))
+        if manifest_path:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                partitions = json.load(f).get('partitions', {})
+
+    # Файл з індексом читаємо діапазонами (якщо його ще немає в локальному кеші)
+    indexed = await open_indexed_remote(storage_box, filename)
+
+    if indexed is None:
+        if metadata_only:
+            return None
+        # День може складатися лише з частин - тоді основного файлу немає (fetch поверне None)
+        local_path = await file_cache.fetch(storage_box, filename)
+
+    # Поточний день до нічного бекапу є лише у вигляді сегментів
+    if not indexed and not local_path and not partitions and is_day_file(filename):
+        segment_messages = await download_day_segments(storage_box, date_from_filename(filename))
+
+    if not indexed and not local_path and not partitions and not segment_messages:
+        return None
+
+    # Завантажуємо дані з файлу
+    file_data = {"messages": segment_messages}
+    if local_path:
+        with open(local_path, 'r', encoding='utf-8') as f:
+            file_data = json.load(f)
+
+    state = {
+        'filename': filename,
+        'messages': None if indexed else file_data.get('messages', []),
+        'partitions': partitions,
+        'generation': next(view_state_generation)
+    }
+    if indexed:
+        # Повідомлення дочитуються посторінково: {'count', 'index', 'loaded'}
+        state.update(indexed)
+    return state
+
+def adjacent_days(filename):
+    """(попередній, наступний) день відносно файлу за кешованим списком з сервера"""
+    files = listing_cache.get()
+    if not files or not is_day_file(filename) or filename not in files:
+        return None, None
+    # Список відсортовано від нових днів до старих
+    position = files.index(filename)
+    older = files[position + 1] if position + 1 < len(files) else None
+    newer = files[position - 1] if position > 0 else None
+    return older, newer
+
+async def prefetch_day_metadata(user_id, filename):
+    """Маніфест та індекс сусіднього дня (файли без індексу не скачуються)"""
+    cache_key = f"{user_id}_{filename}"
+    if user_viewing_state.peek(cache_key) is not None:
+        return
+    storage_box = AsyncStorageBox()
+    try:
+        if not await storage_box.connect():
+            return
+        state = await load_view_state(storage_box, filename, metadata_only=True)
+    finally:
+        await storage_box.close()
+    if state is not None:
+        user_viewing_state.put(cache_key, state)
+
+def schedule_viewer_prefetch(user_id, filename, state, next_positions, page, total_pages):
+    """Наступна сторінка та, біля країв дня, метадані сусідніх днів"""
+    cache_key = f"{user_id}_{filename}"
+    jobs = {}
+    if state['messages'] is None and next_positions:
+        jobs[f"page:{filename}:{page + 1}"] = lambda: get_messages_at(state, next_positions, cache_key)
+
+    older, newer = adjacent_days(filename)
+    if older and page <= 1:
+        jobs[f"day:{older}"] = lambda: prefetch_day_metadata(user_id, older)
+    if newer and page >= total_pages - 2:
+        jobs[f"day:{newer}"] = lambda: prefetch_day_metadata(user_id, newer)
+
+    # Задачі попередньої позиції, які вже не потрібні, скасовуються
+    viewer_prefetcher.schedule(user_id, jobs)
+
+async def reply_or_edit(update: Update, text: str, reply_markup=None, parse_mode=None):
+    """Редагує повідомлення з кнопками або відповідає на команду"""
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    elif update.message:
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+
 async def view_file(update: Update, _context: ContextType, filename: str, page: int = 0) -> None:
     """Показує повідомлення з файлу з пагінацією"""
     user_id = update.effective_user.id
+    viewer_current_file[user_id] = filename
 
-    # Перевіряємо чи файл вже в кеші
+    # Перевіряємо чи файл вже в кеші (або його метадані саме завантажуються у фоні)
     cache_key = f"{user_id}_{filename}"
-    if cache_key not in user_viewing_state:
+    await viewer_prefetcher.join(user_id, f"day:{filename}")
+    state = user_viewing_state.get(cache_key)
+    if state is None:
+        user_viewing_state.clear_expired()
         # Скачуємо файл з Storage Box
-        storage_box = StorageBoxManager()
-        if not storage_box.connect():
+        storage_box = AsyncStorageBox()
+        try:
+            connected = await storage_box.connect()
+            if connected:
+                state = await load_view_state(storage_box, filename)
+        finally:
+            await storage_box.close()
+
+        if not connected:
             if update.callback_query and update.callback_query.message and isinstance(update.callback_query.message, TelegramMessage):
                 await update.callback_query.message.reply_text("❌ Не вдалося підключитися до Storage Box")
             return
 
-        local_path = storage_box.download_file(filename)
-        storage_box.close()
-
-        if not local_path:
+        if state is None:
             if update.callback_query and update.callback_query.message and isinstance(update.callback_query.message, TelegramMessage):
                 await update.callback_query.message.reply_text("❌ Не вдалося завантажити файл.")
             return
 
-        # Завантажуємо дані з файлу
-        with open(local_path, 'r', encoding='utf-8') as f:
-            file_data = json.load(f)
-
-        # Видаляємо тимчасовий файл
-        if os.path.exists(local_path):
-            os.remove(local_path)
-
         # Зберігаємо в кеш
-        user_viewing_state[cache_key] = {
-            'filename': filename,
-            'messages': file_data.get('messages', [])
-        }
+        user_viewing_state.put(cache_key, state)
 
-    # Отримуємо дані з кешу
-    messages = user_viewing_state[cache_key]['messages']
+    file_messages = state['count'] if state['messages'] is None else len(state['messages'])
+    partitions = state.get('partitions', {})
 
-    if not messages:
+    if not file_messages:
         text = "📁 Файл порожній."
-        keyboard = [[InlineKeyboardButton("🔙 Назад до списку", callback_data="back_to_files")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        if update.callback_query:
-            await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+        keyboard = []
+        if partitions:
+            text = f"📁 Основний файл порожній, але день має {len(partitions)} частин (групи/канали)."
+            keyboard.append([InlineKeyboardButton(f"🗂️ Частини ({len(partitions)})", callback_data=f"parts_{filename}")])
+        keyboard.append([InlineKeyboardButton("🔙 Назад до списку", callback_data="back_to_files")])
+        await reply_or_edit(update, text, InlineKeyboardMarkup(keyboard))
         return
 
+    # Фільтр за чатом, відправником, напрямком та текстом (позиції з вторинних індексів)
+    view_filter = state.get('filter') or {}
+    filter_index = None
+    positions = None
+    if view_filter:
+        filter_index = await get_filter_index(state, cache_key)
+        if filter_index is None:
+            if update.callback_query:
+                await update.callback_query.answer("❌ Не вдалося прочитати файл з Storage Box", show_alert=True)
+            return
+        positions = filter_index.select(view_filter)
+        if not positions:
+            keyboard = [
+                [InlineKeyboardButton("🔍 Фільтри", callback_data="vf"),
+                 InlineKeyboardButton("✖️ Скинути фільтр", callback_data="vf_clear")],
+                [InlineKeyboardButton("🔙 До списку", callback_data="back_to_files")],
+            ]
+            text = f"🔍 За фільтром {describe_filter(view_filter, filter_index)} нічого не знайдено."
+            await reply_or_edit(update, text, InlineKeyboardMarkup(keyboard))
+            return
+    total_messages = len(positions) if positions is not None else file_messages
+
     # Пагінація
     messages_per_page = 5
-    total_pages = (len(messages) + messages_per_page - 1) // messages_per_page
+    total_pages = (total_messages + messages_per_page - 1) // messages_per_page
 
     if page < 0:
         page = 0
@@ -1660,17 +2447,41 @@ async def view_file(update: Update, _context: ContextType, filename: str, page:
         page = total_pages - 1
 
     start_idx = page * messages_per_page
-    end_idx = min(start_idx + messages_per_page, len(messages))
+    end_idx = min(start_idx + messages_per_page, total_messages)
+
+    def page_positions(first, last):
+        return positions[first:last] if positions is not None else list(range(first, last))
+
+    # Готовий екран для цієї сторінки, фільтра, версії файлу та сусідніх днів (кнопки ⏪/⏩)
+    next_positions = page_positions(end_idx, end_idx + messages_per_page)
+    render_key = ("file", user_id, filename, state['generation'], page,
+                  filter_key(view_filter), data_version.of(filename), adjacent_days(filename))
+    rendered = render_cache.get(render_key)
+    if rendered is not None:
+        schedule_viewer_prefetch(user_id, filename, state, next_positions, page, total_pages)
+        await reply_or_edit(update, rendered[0], rendered[1], parse_mode='Markdown')
+        return
+
+    current_positions = page_positions(start_idx, end_idx)
+    await viewer_prefetcher.join(user_id, f"page:{filename}:{page}")
+    page_messages = await get_messages_at(state, current_positions, cache_key)
+    if page_messages is None:
+        if update.callback_query:
+            await update.callback_query.answer("❌ Не вдалося прочитати сторінку з Storage Box", show_alert=True)
+        return
 
     # Форматуємо текст
     file_date = filename.replace('saved_messages_', '').replace('.json', '')
     text = f"📁 **Файл:** {file_date}\n"
-    text += f"📊 **Всього повідомлень:** {len(messages)}\n"
+    if positions is not None:
+        text += f"🔍 **Фільтр:** {describe_filter(view_filter, filter_index)}\n"
+        text += f"📊 **Знайдено:** {total_messages} з {file_messages}\n"
+    else:
+        text += f"📊 **Всього повідомлень:** {total_messages}\n"
     text += f"📄 **Сторінка:** {page + 1} з {total_pages}\n\n"
 
-    # Показуємо повідомлення на поточній сторінці
-    for i in range(start_idx, end_idx):
-        msg = messages[i]
+    # Показуємо повідомлення на поточній сторінці (номер - позиція у файлі)
+    for i, msg in zip(current_positions, page_messages):
         date = datetime.fromisoformat(msg['date']).strftime("%d.%m %H:%M")
         direction = "➡️" if msg.get('is_outgoing', False) else "⬅️"
         sender = msg.get('from_first_name', 'Невідомо')
@@ -1704,6 +2515,26 @@ async def view_file(update: Update, _context: ContextType, filename: str, page:
     if quick_nav:
         keyboard.append(quick_nav)
 
+    # Фільтри
+    filter_buttons = [InlineKeyboardButton("🔍 Фільтри", callback_data="vf")]
+    if view_filter:
+        filter_buttons.append(InlineKeyboardButton("✖️ Скинути фільтр", callback_data="vf_clear"))
+    keyboard.append(filter_buttons)
+
+    # Кнопка частин дня (групи та канали)
+    if partitions:
+        keyboard.append([InlineKeyboardButton(f"🗂️ Частини ({len(partitions)})", callback_data=f"parts_{filename}")])
+
+    # Перехід до сусідніх днів
+    older, newer = adjacent_days(filename)
+    day_nav = []
+    if older:
+        day_nav.append(InlineKeyboardButton(f"⏪ {date_from_filename(older)}", callback_data=f"view_{older}"))
+    if newer:
+        day_nav.append(InlineKeyboardButton(f"{date_from_filename(newer)} ⏩", callback_data=f"view_{newer}"))
+    if day_nav:
+        keyboard.append(day_nav)
+
     # Кнопки дій
     action_buttons = [
         InlineKeyboardButton("📥 Завантажити файл", callback_data=f"download_{filename}"),
@@ -1711,21 +2542,288 @@ async def view_file(update: Update, _context: ContextType, filename: str, page:
     ]
     keyboard.append(action_buttons)
 
+    # Поки користувач читає сторінку, наступна завантажується у фоні
+    schedule_viewer_prefetch(user_id, filename, state, next_positions, page, total_pages)
+
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    render_cache.put(render_key, text, reply_markup)
+    await reply_or_edit(update, text, reply_markup, parse_mode='Markdown')
+
+async def show_filter_menu(update: Update, _context: ContextType, section: str = "") -> None:
+    """Меню фільтрів файлу, який переглядає користувач
+
+    section - "" (головне меню), "chats" або "senders"
+    """
+    user_id = update.effective_user.id
+    filename = viewer_current_file.get(user_id)
+    cache_key = f"{user_id}_{filename}"
+    state = user_viewing_state.get(cache_key) if filename else None
+    if state is None:
+        await reply_or_edit(update, "⏳ Перегляд файлу завершився - відкрийте його знову.",
+                            InlineKeyboardMarkup([[InlineKeyboardButton("🔙 До списку", callback_data="back_to_files")]]))
+        return
+
+    filter_index = await get_filter_index(state, cache_key)
+    if filter_index is None:
+        if update.callback_query:
+            await update.callback_query.answer("❌ Не вдалося прочитати файл з Storage Box", show_alert=True)
+        return
+
+    view_filter = state.get('filter') or {}
+    keyboard = []
+    if section == "chats":
+        text = "💬 **Фільтр за чатом**"
+        for chat_id, title, count in filter_index.top_chats():
+            mark = "✅ " if view_filter.get('chat') == chat_id else ""
+            keyboard.append([InlineKeyboardButton(f"{mark}{title[:40]} ({count})", callback_data=f"vf_c_{chat_id}")])
+    elif section == "senders":
+        text = "👤 **Фільтр за відправником**"
+        for sender_id, name, count in filter_index.top_senders():
+            mark = "✅ " if view_filter.get('sender') == sender_id else ""
+            keyboard.append([InlineKeyboardButton(f"{mark}{name[:40]} ({count})", callback_data=f"vf_s_{sender_id}")])
+    else:
+        text = (
+            f"🔍 **Фільтри** ({date_from_filename(filename) or filename})\n\n"
+            f"Активний: {describe_filter(view_filter, filter_index) or 'немає'}\n"
+            f"🔎 Пошук за текстом: /find <текст>"
+        )
+        direction = view_filter.get('direction')
+        keyboard.append([
+            InlineKeyboardButton(f"💬 Чат ({len(filter_index.by_chat)})", callback_data="vf_chats"),
+            InlineKeyboardButton(f"👤 Відправник ({len(filter_index.by_sender)})", callback_data="vf_senders"),
+        ])
+        keyboard.append([
+            InlineKeyboardButton(f"{'✅ ' if direction == 'in' else ''}⬅️ Вхідні", callback_data="vf_d_in"),
+            InlineKeyboardButton(f"{'✅ ' if direction == 'out' else ''}➡️ Вихідні", callback_data="vf_d_out"),
+            InlineKeyboardButton(f"{'✅ ' if not direction else ''}↔️ Всі", callback_data="vf_d_all"),
+        ])
+        if view_filter:
+            keyboard.append([InlineKeyboardButton("✖️ Скинути фільтр", callback_data="vf_clear")])
+    keyboard.append([InlineKeyboardButton("🔙 До повідомлень", callback_data="vf_back" if not section else "vf")])
+
+    await reply_or_edit(update, text, InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+async def apply_view_filter(update: Update, context: ContextType, **changes) -> None:
+    """Змінює фільтр поточного файлу та показує першу сторінку результату"""
+    user_id = update.effective_user.id
+    filename = viewer_current_file.get(user_id)
+    state = user_viewing_state.get(f"{user_id}_{filename}") if filename else None
+    if state is None:
+        await reply_or_edit(update, "⏳ Перегляд файлу завершився - відкрийте його знову.",
+                            InlineKeyboardMarkup([[InlineKeyboardButton("🔙 До списку", callback_data="back_to_files")]]))
+        return
+
+    view_filter = dict(state.get('filter') or {})
+    for field, value in changes.items():
+        if value is None or value == '':
+            view_filter.pop(field, None)
+        else:
+            view_filter[field] = value
+    state['filter'] = view_filter
+    await view_file(update, context, filename, page=0)
+
+async def find_timeline_message(state, cache_key, chat_id, message_id):
+    """Пошук повідомлення за id серед повідомлень чату у файлі (через індекси фільтрів)"""
+    filter_index = await get_filter_index(state, cache_key)
+    if filter_index is None:
+        return None
+    messages = await get_messages_at(state, filter_index.by_chat.get(chat_id, []), cache_key) or []
+    return next((msg for msg in messages if int(msg.get('message_id') or 0) == message_id), None)
+
+async def load_timeline_messages(user_id, chat_id, locations):
+    """Повідомлення сторінки розмови з локальних файлів дня або з сервера
+
+    Повертає список у порядку locations (None - повідомлення не знайдено)
+    або None, якщо сервер недоступний.
+    """
+    by_file: Dict[str, List[dict]] = {}
+    for location in locations:
+        by_file.setdefault(location['file'], []).append(location)
+
+    found = {}
+    storage_box = None
+    try:
+        for filename, file_locations in by_file.items():
+            cache_key = None
+            if os.path.exists(filename):
+                state = {'filename': filename, 'messages': load_messages(filename)['messages'], 'partitions': {}}
+            else:
+                cache_key = f"{user_id}_{filename}"
+                state = user_viewing_state.get(cache_key)
+                if state is None:
+                    if storage_box is None:
+                        # close() у finally безпечний і після невдалого підключення
+                        storage_box = AsyncStorageBox()
+                        if not await storage_box.connect():
+                            return None
+                    state = await load_view_state(storage_box, filename)
+                    if state is None:
+                        continue
+                    user_viewing_state.put(cache_key, state)
+
+            total = state['count'] if state['messages'] is None else len(state['messages'])
+            positions = [location['position'] for location in file_locations if location['position'] < total]
+            messages = await get_messages_at(state, positions, cache_key)
+            if messages is None:
+                return None
+            by_position = dict(zip(positions, messages))
+
+            for location in file_locations:
+                msg = by_position.get(location['position'])
+                if msg is None or int(msg.get('message_id') or 0) != location['message_id'] \
+                        or int(msg.get('chat_id') or 0) != chat_id:
+                    # Файл переписано (наприклад, після об'єднання з копією на сервері) - шукаємо за id
+                    msg = await find_timeline_message(state, cache_key, chat_id, location['message_id'])
+                found[(filename, location['position'])] = msg
+    finally:
+        if storage_box is not None:
+            await storage_box.close()
+
+    return [found.get((location['file'], location['position'])) for location in locations]
+
+async def show_recent_chats(update: Update, _context: ContextType) -> None:
+    """Список чатів з індексу розмов (останні активні зверху)"""
+    chats = chat_timeline.recent_chats()
+    keyboard = [
+        [InlineKeyboardButton(f"{chat['title'][:40]} ({chat['count']})", callback_data=f"tl_{chat['chat_id']}_0")]
+        for chat in chats
+    ]
+    keyboard.append([InlineKeyboardButton("🔙 До місяців", callback_data="months")])
+    text = "💬 **Розмови по чатах**\n\n"
+    text += "Оберіть чат, щоб гортати його повідомлення від нових до старих." if chats else "Індекс розмов поки порожній."
+    await reply_or_edit(update, text, InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+async def view_chat_timeline(update: Update, _context: ContextType, chat_id: int, page: int = 0) -> None:
+    """Повідомлення одного чату через межі днів (сторінка 0 - найновіші)"""
+    user_id = update.effective_user.id
+    messages_per_page = 5
+    total_messages = chat_timeline.count(chat_id)
+    if not total_messages:
+        await reply_or_edit(update, "💬 Повідомлень цього чату в індексі немає.",
+                            InlineKeyboardMarkup([[InlineKeyboardButton("🔙 До чатів", callback_data="tl")]]))
+        return
+
+    total_pages = (total_messages + messages_per_page - 1) // messages_per_page
+    page = max(0, min(page, total_pages - 1))
+
+    # Сторінка залежить від кількості повідомлень чату та версій файлів, з яких вона читається
+    locations = chat_timeline.read_page(chat_id, page, messages_per_page)
+    page_files = sorted({location['file'] for location in locations})
+    render_key = ("timeline", user_id, chat_id, page, total_messages,
+                  tuple(data_version.of(data_file) for data_file in page_files))
+    rendered = render_cache.get(render_key)
+    if rendered is not None:
+        await reply_or_edit(update, rendered[0], rendered[1], parse_mode='Markdown')
+        return
+
+    page_messages = await load_timeline_messages(user_id, chat_id, locations)
+    if page_messages is None:
+        if update.callback_query:
+            await update.callback_query.answer("❌ Не вдалося прочитати повідомлення з Storage Box", show_alert=True)
+        return
+
+    title = chat_timeline.chats.get(str(chat_id), {}).get('title', str(chat_id))
+    text = f"💬 **{title}**\n"
+    text += f"📊 **Всього повідомлень:** {total_messages}\n"
+    text += f"📄 **Сторінка:** {page + 1} з {total_pages} (від нових до старих)\n"
+
+    # На сторінці - від старішого до новішого, з заголовком при зміні дня
+    current_date = None
+    for location, msg in reversed(list(zip(locations, page_messages))):
+        if location['date'] != current_date:
+            current_date = location['date']
+            text += f"\n📅 **{current_date}**\n"
+        if msg is None:
+            text += f"⚠️ Повідомлення {location['message_id']} не знайдено\n"
+            continue
+        time_str = datetime.fromisoformat(msg['date']).strftime("%H:%M")
+        direction = "➡️" if msg.get('is_outgoing', False) else "⬅️"
+        text_preview = (msg.get('text', '') or '')[:100]
+        if len(msg.get('text', '') or '') > 100:
+            text_preview += "..."
+        text += f"{direction} {time_str} 👤 **{msg.get('from_first_name', 'Невідомо')}**\n"
+        text += f"📝 {text_preview}\n"
+
+    keyboard = []
+    nav_buttons = []
+    if page < total_pages - 1:
+        nav_buttons.append(InlineKeyboardButton("⬅️ Старіші", callback_data=f"tl_{chat_id}_{page + 1}"))
+    nav_buttons.append(InlineKeyboardButton(f"📄 {page + 1}/{total_pages}", callback_data="dummy"))
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton("Новіші ➡️", callback_data=f"tl_{chat_id}_{page - 1}"))
+    keyboard.append(nav_buttons)
+    if page > 0:
+        keyboard.append([InlineKeyboardButton("⏭️ Найновіші", callback_data=f"tl_{chat_id}_0")])
+    keyboard.append([InlineKeyboardButton("🔙 До чатів", callback_data="tl")])
+
     reply_markup = InlineKeyboardMarkup(keyboard)
+    # Повідомлення, не знайдені через недоступний файл, можуть з'явитись пізніше
+    if all(msg is not None for msg in page_messages):
+        render_cache.put(render_key, text, reply_markup)
+    await reply_or_edit(update, text, reply_markup, parse_mode='Markdown')
+
+def format_partition_label(key: str, entry: dict) -> str:
+    """Підпис кнопки частини дня"""
+    parts = []
+    for part in key.split('.'):
+        if part.startswith('h'):
+            parts.append(f"🕐 {part[1:]}:00")
+        elif part.startswith('c'):
+            parts.append(f"💬 {part[1:].replace('m', '-')}")
+    return f"{' '.join(parts) or key} ({entry.get('count', 0)})"
+
+async def show_partitions(update: Update, _context: ContextType, filename: str) -> None:
+    """Показує список частин дня з маніфесту"""
+    user_id = update.effective_user.id
+    cache_key = f"{user_id}_{filename}"
+    partitions = (user_viewing_state.get(cache_key) or {}).get('partitions', {})
+
+    if not partitions:
+        if update.callback_query:
+            await update.callback_query.edit_message_text("🗂️ Частин не знайдено.")
+        return
+
+    keyboard = [
+        [InlineKeyboardButton(format_partition_label(key, entry), callback_data=f"view_{entry['file']}")]
+        for key, entry in sorted(partitions.items())
+    ]
+    keyboard.append([InlineKeyboardButton("🔙 До дня", callback_data=f"view_{filename}")])
+
+    file_date = date_from_filename(filename)
+    text = f"🗂️ **Частини дня {file_date}**\n\n📊 Всього частин: {len(partitions)}"
     if update.callback_query:
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
 async def download_file_to_user(update: Update, _context: ContextType, filename: str) -> None:
     """Завантажує файл користувачу"""
     # Скачуємо файл з Storage Box
-    storage_box = StorageBoxManager()
-    if not storage_box.connect():
+    storage_box = AsyncStorageBox()
+    if not await storage_box.connect():
+        await storage_box.close()
         if update.callback_query and update.callback_query.message and isinstance(update.callback_query.message, TelegramMessage):
             await update.callback_query.message.reply_text("❌ Не вдалося підключитися до Storage Box")
         return
 
-    local_path = storage_box.download_file(filename)
-    storage_box.close()
+    progress_message = None
+    if update.callback_query and update.callback_query.message and isinstance(update.callback_query.message, TelegramMessage):
+        progress_message = await update.callback_query.message.reply_text(f"📥 Скачування {filename}…")
+
+    async def report_progress(percent):
+        try:
+            await progress_message.edit_text(f"📥 Скачування {filename}… {percent}%")
+        except Exception as e:
+            logger.debug(f"Не вдалося оновити прогрес: {e}")
+
+    try:
+        local_path = await file_cache.fetch(storage_box, filename, on_progress=report_progress if progress_message else None)
+    finally:
+        await storage_box.close()
+
+    if progress_message:
+        try:
+            await progress_message.delete()
+        except Exception as e:
+            logger.debug(f"Не вдалося видалити повідомлення прогресу: {e}")
 
     if not local_path:
         if update.callback_query and update.callback_query.message and isinstance(update.callback_query.message, TelegramMessage):
@@ -1744,10 +2842,6 @@ async def download_file_to_user(update: Update, _context: ContextType, filename:
     except Exception as exc:
         if update.callback_query and update.callback_query.message and isinstance(update.callback_query.message, TelegramMessage):
             await update.callback_query.message.reply_text(f"❌ Помилка відправки файлу: {exc}")
-    finally:
-        # Видаляємо тимчасовий файл
-        if os.path.exists(local_path):
-            os.remove(local_path)
 
 async def myuuid(update: Update, _context: ContextType) -> None:
     user_id = update.effective_user.id
@@ -1832,13 +2926,15 @@ async def fetch_recent_messages():
                 logger.info(f"⏹️ Досягнуто повідомлень до сьогоднішнього дня. Перевірено: {checked_messages_count}, нових: {new_messages_count}")
                 break
 
-            # Пропускаємо повідомлення без тексту
-            if not message.text:
+            # Пропускаємо повідомлення без тексту (і без медіа, якщо медіа увімкнено)
+            media_info = get_media_info(message)
+            if not message.text and not media_info:
                 continue
 
             # Перевіряємо чи це повідомлення ще не збережено
             if message.id not in existing_ids:
-                logger.info(f"💾 Зберігаємо нове повідомлення: {message.id} - {message.text[:50]}...")
+                message_text = message.text or message.caption or ""
+                logger.info(f"💾 Зберігаємо нове повідомлення: {message.id} - {message_text[:50]}...")
 
                 message_data = {
                     "message_id": message.id,
@@ -1849,13 +2945,16 @@ async def fetch_recent_messages():
                     "from_user_id": message.from_user.id if message.from_user else ALLOWED_USER_ID,
                     "from_username": message.from_user.username if message.from_user else None,
                     "from_first_name": message.from_user.first_name if message.from_user else "Me",
-                    "text": message.text,
+                    "text": message_text,
                     "date": message.date.isoformat(),
                     "is_outgoing": (message.from_user.id == ALLOWED_USER_ID) if message.from_user else True,
-                    "is_edited": False
+                    "is_edited": False,
+                    "media": media_info
                 }
 
-                save_message(message_data)
+                ingest_queue.submit(message_data)
+                if media_info:
+                    media_capture.enqueue(message, media_info)
                 existing_ids.add(message.id)
                 new_messages_count += 1
 
@@ -1876,8 +2975,9 @@ async def fetch_recent_messages():
                     continue
 
                 # Перевіряємо тільки приватні чати
+                kind = chat_kind(chat.type)
                 chat_type_str = str(chat.type).upper()
-                if 'PRIVATE' not in chat_type_str:
+                if kind != 'PRIVATE' or not chat_filter.should_check_chat(chat.id, kind):
                     continue
 
                 total_chats_scanned += 1
@@ -1894,23 +2994,31 @@ async def fetch_recent_messages():
                         if message.date < today_start:
                             break
 
-                        # Пропускаємо повідомлення без тексту
-                        if not message.text:
+                        # Пропускаємо повідомлення без тексту (і без медіа, якщо медіа увімкнено)
+                        media_info = get_media_info(message)
+                        if not message.text and not media_info:
                             continue
 
                         # Перевіряємо чи не збережено вже
                         if message.id in existing_ids:
                             continue
 
+                        message_text = message.text or message.caption or ""
+
+                        # Правила за відправником та ключовими словами
+                        sender_id = message.from_user.id if message.from_user else None
+                        if not chat_filter.evaluate(chat.id, kind, sender_id, message_text):
+                            continue
+
                         # Визначаємо назву чату
                         chat_title = getattr(chat, 'title', None)
-                        if 'PRIVATE' in chat_type_str:
+                        if kind == 'PRIVATE':
                             if hasattr(chat, 'first_name'):
                                 chat_title = chat.first_name
                                 if hasattr(chat, 'last_name') and chat.last_name:
                                     chat_title += f" {chat.last_name}"
 
-                        logger.info(f"💾 Зберігаємо з {chat_title}: {message.id} - {message.text[:50]}...")
+                        logger.info(f"💾 Зберігаємо з {chat_title}: {message.id} - {message_text[:50]}...")
 
                         message_data = {
                             "message_id": message.id,
@@ -1921,13 +3029,16 @@ async def fetch_recent_messages():
                             "from_user_id": message.from_user.id if message.from_user else None,
                             "from_username": message.from_user.username if message.from_user else None,
                             "from_first_name": message.from_user.first_name if message.from_user else None,
-                            "text": message.text,
+                            "text": message_text,
                             "date": message.date.isoformat(),
                             "is_outgoing": (message.from_user.id == ALLOWED_USER_ID) if message.from_user else False,
-                            "is_edited": False
+                            "is_edited": False,
+                            "media": media_info
                         }
 
-                        save_message(message_data)
+                        ingest_queue.submit(message_data)
+                        if media_info:
+                            media_capture.enqueue(message, media_info)
                         existing_ids.add(message.id)
                         chat_new_messages += 1
                         total_new_messages += 1
@@ -1940,6 +3051,9 @@ async def fetch_recent_messages():
 
             logger.info(f"✅ Завершено сканування приватних чатів. Чатів: {total_chats_scanned}, нових повідомлень: {total_new_messages}")
 
+        # Чекаємо поки черга збереження запише знайдене
+        await ingest_queue.drain()
+
     except Exception as e:
         logger.error(f"❌ Помилка при отриманні повідомлень: {e}")
 
@@ -2113,12 +3227,17 @@ async def settings_command(update: Update, _context: ContextType) -> None:
         else:
             stats['OTHER'] += 1
 
+    # Повідомлення груп і каналів у частинах дня
+    for bucket, count in partition_manifest.type_counts(datetime.now().strftime("%Y-%m-%d")).items():
+        stats[bucket] = stats.get(bucket, 0) + count
+
     settings_text = (
         "⚙️ **Налаштування збереження повідомлень:**\n\n"
         f"📱 Збережені повідомлення: {'✅ Увімкнено' if settings['save_saved_messages'] else '❌ Вимкнено'}\n"
         f"💬 Приватні чати: {'✅ Увімкнено' if settings['save_private_chats'] else '❌ Вимкнено'}\n"
         f"👥 Групи: {'✅ Увімкнено' if settings['save_groups'] else '❌ Вимкнено'}\n"
-        f"📢 Канали: {'✅ Увімкнено' if settings['save_channels'] else '❌ Вимкнено'}\n\n"
+        f"📢 Канали: {'✅ Увімкнено' if settings['save_channels'] else '❌ Вимкнено'}\n"
+        f"📎 Медіа: {'✅ Увімкнено' if settings['save_media'] else '❌ Вимкнено'}\n\n"
         "⚙️ **Технічні налаштування:**\n"
         f"⏱️ Інтервал перевірки Збережених: {settings['check_interval']} сек\n"
         f"⏱️ Інтервал перевірки діалогів: {settings['dialogs_check_interval']} сек\n"
@@ -2157,6 +3276,12 @@ async def settings_command(update: Update, _context: ContextType) -> None:
                 callback_data='toggle_channels'
             )
         ],
+        [
+            InlineKeyboardButton(
+                f"📎 Медіа: {'✅' if settings['save_media'] else '❌'}",
+                callback_data='toggle_media'
+            )
+        ],
         [
             InlineKeyboardButton("⚙️ Технічні налаштування", callback_data='tech_settings')
         ],
@@ -2169,6 +3294,38 @@ async def settings_command(update: Update, _context: ContextType) -> None:
     if update.message:
         await update.message.reply_text(settings_text, parse_mode='Markdown', reply_markup=reply_markup)
 
+def format_pool_stats() -> str:
+    """Метрики пулу SFTP сесій (порожньо для інших цілей бекапу)"""
+    if BACKUP_TARGET != "sftp":
+        return ""
+    stats = storage_pool.get_stats()
+    return (
+        f"🔌 Пул сесій: {stats['in_use']} активних, {stats['idle']} вільних (макс. {storage_pool.max_sessions})\n"
+        f"♻️ Повторне використання: {stats['reuses']}/{stats['acquisitions']} ({stats['reuse_rate']:.0%})\n"
+        f"🔐 Рукостискань: {stats['handshakes']} "
+        f"(сер. {stats['handshake_avg_ms']:.0f}мс, макс. {stats['handshake_max_ms']:.0f}мс)\n"
+        f"⚠️ Помилок підключення: {stats['connect_failures']}, розірваних сесій: {stats['health_failures']}\n"
+        f"📂 Перевірки папок: {stats['dir_round_trips']} запитів, {stats['dir_cache_hits']} з кешу\n"
+        f"⏯️ Докачано передач: {stats['resumed_transfers']} ({stats['resumed_bytes'] / 1024 / 1024:.1f} МБ не передано повторно), "
+        f"помилок перевірки: {stats['verify_failures']}\n"
+        f"🚚 Швидкість передачі: {stats['transfer_mb_per_second']:.1f} МБ/с"
+    )
+
+async def format_encryption_stats() -> str:
+    """Швидкість шифрування у порівнянні з передачею по SFTP"""
+    if not BACKUP_ENCRYPTION_KEY:
+        return "🔓 Шифрування бекапів вимкнено"
+    result = await asyncio.to_thread(benchmark_encryption, 16)
+    text = (
+        f"🔐 Шифрування: {result['encrypt_mb_per_second']:.0f} МБ/с, "
+        f"розшифрування: {result['decrypt_mb_per_second']:.0f} МБ/с"
+    )
+    transfer_speed = storage_pool.get_stats()['transfer_mb_per_second']
+    if BACKUP_TARGET == "sftp" and transfer_speed:
+        overhead = transfer_speed / result['encrypt_mb_per_second']
+        text += f"\n⚖️ Додатковий час на шифрування: {overhead:.1%} від часу передачі"
+    return text
+
 async def test_storage_connection(update: Update, _context: ContextType) -> None:
     user_id = update.effective_user.id
     if not check_access(user_id):
@@ -2177,27 +3334,28 @@ async def test_storage_connection(update: Update, _context: ContextType) -> None
         return
 
     if update.message:
-        await update.message.reply_text("🔄 Тестую підключення до Storage Box...")
+        await update.message.reply_text("🔄 Тестую підключення до сховища бекапів...")
 
-    storage_box = StorageBoxManager()
-    if storage_box.connect():
-        files = storage_box.list_files()
-        storage_box.close()
+    storage_box = AsyncStorageBox()
+    target_info = storage_box.manager.describe()
+    connected = await storage_box.connect()
+    files = await storage_box.list_files() if connected else []
+    await storage_box.close()
+    if connected:
 
         if update.message:
             await update.message.reply_text(
                 f"✅ Підключення успішне!\n"
                 f"📁 Знайдено файлів: {len(files)}\n"
-                f"🌐 Сервер: {STORAGE_BOX_HOST}\n"
-            f"👤 Користувач: {STORAGE_BOX_USERNAME}"
-        )
+                f"{target_info}\n\n"
+                f"{format_pool_stats()}\n\n"
+                f"{await format_encryption_stats()}"
+            )
     else:
         if update.message:
             await update.message.reply_text(
                 f"❌ Помилка підключення!\n"
-                f"🌐 Сервер: {STORAGE_BOX_HOST}\n"
-                f"👤 Користувач: {STORAGE_BOX_USERNAME}\n"
-                f"📂 Шлях: {STORAGE_BOX_PATH}"
+                f"{target_info}"
             )
 
 async def test_backup(update: Update, _context: ContextType) -> None:
@@ -2224,12 +3382,24 @@ async def test_backup(update: Update, _context: ContextType) -> None:
     with open(test_file, 'w', encoding='utf-8') as f:
         json.dump(test_data, f, ensure_ascii=False, indent=4)
 
-    await update.message.reply_text("🔄 Завантажую тестовий файл...")
+    progress_message = await update.message.reply_text("🔄 Завантажую тестовий файл...")
 
-    storage_box = StorageBoxManager()
-    if storage_box.connect():
-        success = storage_box.upload_file(test_file, f"test_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-        storage_box.close()
+    async def report_progress(percent):
+        try:
+            await progress_message.edit_text(f"📤 Завантаження… {percent}%")
+        except Exception as e:
+            logger.debug(f"Не вдалося оновити прогрес: {e}")
+
+    storage_box = AsyncStorageBox()
+    if await storage_box.connect():
+        try:
+            success = await storage_box.upload_file(
+                test_file,
+                f"test_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                on_progress=report_progress
+            )
+        finally:
+            await storage_box.close()
 
         if success:
             await update.message.reply_text("✅ Тестовий бекап успішний!")
@@ -2237,6 +3407,7 @@ async def test_backup(update: Update, _context: ContextType) -> None:
         else:
             await update.message.reply_text("❌ Помилка завантаження тестового файлу")
     else:
+        await storage_box.close()
         await update.message.reply_text("❌ Не вдалося підключитися до Storage Box")
 
 async def upload_logs_command(update: Update, _context: ContextType) -> None:
@@ -2266,6 +3437,8 @@ async def cleanup_logs_command(update: Update, _context: ContextType) -> None:
     if update.message:
         await update.message.reply_text("🗑️ Очищаю старі логи...")
 
+    # Невідправлені логи спочатку догружаються, інакше очищення їх пропустить
+    await catch_up_uploads()
     cleanup_old_logs()
 
     if update.message:
@@ -2282,6 +3455,8 @@ async def cleanup_old_files_command(update: Update, _context: ContextType) -> No
     if update.message:
         await update.message.reply_text("🗑️ Очищаю старі локальні файли з повідомленнями...")
 
+    # Невідправлені дні спочатку догружаються, інакше очищення їх пропустить
+    await catch_up_uploads()
     cleanup_old_local_files()
 
     if update.message:
@@ -2406,6 +3581,106 @@ async def analyze_code_command(update: Update, _context: ContextType) -> None:
         if update.message:
             await update.message.reply_text(f"❌ Помилка: {analyze_exc}")
 
+async def filters_command(update: Update, context: ContextType) -> None:
+    """Команда для перегляду та зміни правил фільтра чатів
+
+    /filters - показати правила та лічильники
+    /filters add <список> <значення> - додати правило
+    /filters remove <список> <значення> - видалити правило
+    """
+    user_id = update.effective_user.id
+    if not check_access(user_id):
+        if update.message:
+            await update.message.reply_text("Вибачте, у вас немає доступу до цього бота.")
+        return
+
+    if not update.message:
+        return
+
+    args = context.args or []
+    if len(args) >= 3 and args[0] in ('add', 'remove'):
+        action, rule_list, value = args[0], args[1], ' '.join(args[2:])
+        if rule_list.endswith('_ids'):
+            try:
+                value = int(value)
+            except ValueError:
+                await update.message.reply_text("❌ ID має бути числом")
+                return
+        elif rule_list.endswith('_types'):
+            value = value.upper()
+
+        if action == 'add':
+            success = chat_filter.add_rule(rule_list, value)
+        else:
+            success = chat_filter.remove_rule(rule_list, value)
+
+        if not success:
+            await update.message.reply_text(f"❌ Невідомий список або значення. Списки: {', '.join(RULE_LISTS)}")
+            return
+
+        chat_filter.compile(settings)
+        await update.message.reply_text(f"✅ Правило оновлено: {action} {rule_list} {value}")
+        return
+
+    text = f"🧹 Фільтр чатів (v{chat_filter.version})\n\n"
+    for rule_list in RULE_LISTS:
+        values = chat_filter.rules[rule_list]
+        text += f"{rule_list}: {', '.join(str(v) for v in values) if values else '—'}\n"
+
+    text += "\n📊 Спрацювання правил:\n"
+    if chat_filter.hits:
+        for rule, count in sorted(chat_filter.hits.items(), key=lambda item: -item[1]):
+            text += f"  • {rule}: {count}\n"
+    else:
+        text += "  • немає\n"
+
+    text += "\nЗміна: /filters add|remove <список> <значення>"
+    await update.message.reply_text(text)
+
+async def alerts_command(update: Update, context: ContextType) -> None:
+    """Команда для керування сповіщеннями за ключовими словами
+
+    /alerts - показати список та статистику
+    /alerts add <фраза>[, фраза ...] - додати фрази (кілька - через кому)
+    /alerts remove <фраза>[, фраза ...] - видалити фрази
+    """
+    user_id = update.effective_user.id
+    if not check_access(user_id):
+        if update.message:
+            await update.message.reply_text("Вибачте, у вас немає доступу до цього бота.")
+        return
+
+    if not update.message:
+        return
+
+    args = context.args or []
+    if len(args) >= 2 and args[0] in ('add', 'remove'):
+        # Пробіли - частина фрази, окремі фрази розділяються комою
+        phrases = ' '.join(args[1:]).split(',')
+        if args[0] == 'add':
+            keyword_alerter.add_keywords(phrases)
+        else:
+            keyword_alerter.remove_keywords(phrases)
+        await update.message.reply_text(f"✅ Слів у списку: {len(keyword_alerter.keywords)}")
+        return
+
+    alert_stats = keyword_alerter.get_stats()
+    preview = ', '.join(keyword_alerter.keywords[:30]) or '—'
+    if len(keyword_alerter.keywords) > 30:
+        preview += f" … (+{len(keyword_alerter.keywords) - 30})"
+
+    await update.message.reply_text(
+        f"🔔 Сповіщення за ключовими словами\n\n"
+        f"🏷️ Слів: {alert_stats['keywords']} (станів автомата: {alert_stats['states']})\n"
+        f"{preview}\n\n"
+        f"📊 Перевірено: {alert_stats['checked']}\n"
+        f"🎯 Збігів: {alert_stats['matched_messages']}\n"
+        f"📤 Відправлено: {alert_stats['alerts_sent']} ({alert_stats['batches_sent']} пакетів)\n"
+        f"⏳ В черзі: {alert_stats['pending']}\n"
+        f"🗑️ Відкинуто: {alert_stats['dropped']}\n\n"
+        f"Зміна: /alerts add|remove <фраза>, <фраза> ..."
+    )
+
 # Обробник текстових повідомлень (клавіатура)
 async def handle_keyboard(update: Update, context: ContextType) -> None:
     """Обробляє натискання кнопок клавіатури"""
@@ -2529,6 +3804,119 @@ async def handle_keyboard(update: Update, context: ContextType) -> None:
             reply_markup=get_main_keyboard()
         )
 
+async def find_command(update: Update, context: ContextType) -> None:
+    """Фільтр за текстом у файлі, який зараз відкрито в переглядачі
+
+    /find <текст> - показати повідомлення, що містять текст
+    /find - скинути пошук за текстом
+    """
+    user_id = update.effective_user.id
+    if not check_access(user_id):
+        if update.message:
+            await update.message.reply_text("Вибачте, у вас немає доступу до цього бота.")
+        return
+
+    if not update.message:
+        return
+
+    if user_id not in viewer_current_file:
+        await update.message.reply_text("📂 Спочатку відкрийте файл в історії (/history)")
+        return
+
+    await apply_view_filter(update, context, text=" ".join(context.args or []).strip())
+
+async def merge_command(update: Update, context: ContextType) -> None:
+    """Об'єднує локальні файли дня з копією на сервері та відправляє об'єднання
+
+    /merge - поточний день
+    /merge <YYYY-MM-DD> - інший день, файли якого ще є локально
+    """
+    user_id = update.effective_user.id
+    if not check_access(user_id):
+        if update.message:
+            await update.message.reply_text("Вибачте, у вас немає доступу до цього бота.")
+        return
+
+    if not update.message:
+        return
+
+    args = context.args or []
+    file_date = args[0] if args else datetime.now().strftime("%Y-%m-%d")
+    day_files = [day_file_name(file_date)] + partition_manifest.partition_files(file_date) + [manifest_file_name(file_date)]
+    day_files = [f for f in day_files if os.path.exists(f)]
+    if not day_files:
+        await update.message.reply_text(f"❌ Локальних файлів за {file_date} немає")
+        return
+
+    await update.message.reply_text(f"🔀 Об'єдную {len(day_files)} файлів за {file_date} з копією на сервері...")
+
+    storage_box = AsyncStorageBox()
+    if not await storage_box.connect():
+        await storage_box.close()
+        await update.message.reply_text("❌ Не вдалося підключитися до Storage Box")
+        return
+    try:
+        result = await upload_day_files(storage_box, [(f, f) for f in day_files], force_merge=True)
+    finally:
+        await storage_box.close()
+
+    await update.message.reply_text(
+        f"✅ Об'єднання завершено\n"
+        f"📥 Додано з сервера: {result['merged']} повідомлень\n"
+        f"📤 Відправлено: {len(result['uploaded'])}, без змін: {len(result['skipped'])}, "
+        f"помилок: {len(result['failed'])}"
+    )
+
+async def bandwidth_command(update: Update, context: ContextType) -> None:
+    """Звіт про швидкість відправки бекапів та затримку повідомлень
+
+    /bandwidth - звіт за останню добу (похвилинно)
+    /bandwidth <КБ/с> - встановити ліміт відправки (0 - без ліміту)
+    """
+    user_id = update.effective_user.id
+    if not check_access(user_id):
+        if update.message:
+            await update.message.reply_text("Вибачте, у вас немає доступу до цього бота.")
+        return
+
+    if not update.message:
+        return
+
+    args = context.args or []
+    if args and args[0].isdigit():
+        settings['upload_rate_limit_kb'] = int(args[0])
+        upload_shaper.configure(rate_limit=settings['upload_rate_limit_kb'] * 1024)
+        limit_text = f"{args[0]} КБ/с" if settings['upload_rate_limit_kb'] else "без ліміту"
+        await update.message.reply_text(f"🚰 Ліміт відправки: {limit_text}")
+        return
+
+    shaper_stats = upload_shaper.get_stats()
+    latency = shaper_stats['latency']
+    lines = [
+        "🚰 Відправка бекапів та затримка повідомлень\n",
+        f"⚙️ Ліміт: {shaper_stats['rate_limit'] / 1024:.0f} КБ/с" if shaper_stats['rate_limit'] else "⚙️ Ліміт: без ліміту",
+        f"📉 Зараз: {shaper_stats['effective_rate'] / 1024:.0f} КБ/с" if shaper_stats['effective_rate'] else "📉 Зараз: без обмеження",
+        f"⏱️ Затримка повідомлень: {latency:.1f}с" if latency is not None else "⏱️ Затримка повідомлень: немає даних",
+        f"🔻 Знижень: {shaper_stats['backoffs']}, відновлень: {shaper_stats['recoveries']}, "
+        f"очікування: {shaper_stats['throttled_seconds']:.0f}с\n",
+    ]
+
+    rows = upload_shaper.report(since=datetime.now().timestamp() - 24 * 3600)
+    if rows:
+        lines.append("Хвилина | швидкість | ліміт | затримка")
+        for row in rows[-30:]:
+            limit = f"{row['limit'] / 1024:.0f} КБ/с" if row['limit'] else "—"
+            row_latency = f"{row['latency']:.1f}с" if row['latency'] is not None else "—"
+            lines.append(
+                f"{datetime.fromtimestamp(row['minute']).strftime('%H:%M')} | "
+                f"{row['rate'] / 1024:.0f} КБ/с | {limit} | {row_latency}"
+            )
+    else:
+        lines.append("За останню добу відправок не було")
+
+    lines.append("\nЗміна ліміту: /bandwidth <КБ/с>")
+    await update.message.reply_text("\n".join(lines))
+
 # Додавання обробників до бота
 bot_app.add_handler(CommandHandler("start", start, ))
 bot_app.add_handler(CommandHandler("status", status, ))
@@ -2548,6 +3936,11 @@ bot_app.add_handler(CommandHandler("cleanlogs", cleanup_logs_command, ))
 bot_app.add_handler(CommandHandler("cleanfiles", cleanup_old_files_command, ))
 bot_app.add_handler(CommandHandler("optstats", optimization_stats_command, ))
 bot_app.add_handler(CommandHandler("analyzecode", analyze_code_command, ))
+bot_app.add_handler(CommandHandler("filters", filters_command, ))
+bot_app.add_handler(CommandHandler("alerts", alerts_command, ))
+bot_app.add_handler(CommandHandler("bandwidth", bandwidth_command, ))
+bot_app.add_handler(CommandHandler("merge", merge_command, ))
+bot_app.add_handler(CommandHandler("find", find_command, ))
 bot_app.add_handler(MessageHandler(tg_filters.TEXT & ~tg_filters.COMMAND, handle_keyboard, ))
 bot_app.add_handler(CallbackQueryHandler(handle_callback_query, ))
 
@@ -2611,10 +4004,6 @@ async def main():
             logger.error(f"⚠️ Помилка ініціалізації оптимізації: {e}")
             optimization_enabled = False
 
-    # Очищаємо старі локальні файли при старті
-    logger.info("🧹 Перевіряю наявність старих локальних файлів...")
-    cleanup_old_local_files()
-
     # Налаштування планувальника
     scheduler = setup_scheduler()
 
@@ -2643,13 +4032,44 @@ async def main():
     print(f"💬 Приватні чати: {'✅' if settings['save_private_chats'] else '❌'}")
     print(f"👥 Групи: {'✅' if settings['save_groups'] else '❌'}")
     print(f"📢 Канали: {'✅' if settings['save_channels'] else '❌'}")
+    print(f"📎 Медіа: {'✅' if settings['save_media'] else '❌'}")
     print(f"⏱️  Інтервал перевірки: {settings['check_interval']} сек")
     print("="*60)
     print("💾 Збережені повідомлення:\n")
 
+    # Запускаємо воркери захоплення медіа (працюють незалежно від тексту)
+    media_capture.start()
+
+    # Запускаємо цикл запису черги збереження
+    ingest_task = asyncio.create_task(ingest_queue.run())
+
     # Запускаємо швидкий цикл перевірки повідомлень
     message_checker_task = asyncio.create_task(message_checker_loop())
 
+    # Запускаємо відправку сповіщень за ключовими словами
+    async def send_alert(text):
+        await bot_app.bot.send_message(chat_id=ALLOWED_USER_ID, text=text)
+
+    alerts_task = asyncio.create_task(keyword_alerter.run(send_alert))
+
+    # На новому хості підтягуємо маніфест відправлених файлів з сервера
+    if not upload_manifest.entries:
+        storage_box = AsyncStorageBox()
+        try:
+            if await storage_box.connect():
+                await upload_manifest.pull(storage_box)
+        finally:
+            await storage_box.close()
+
+    # Догружаємо дні, пропущені під час простою, і лише потім очищаємо старі файли
+    logger.info("🧹 Перевіряю невідправлені та старі локальні файли...")
+    catch_up_task = asyncio.create_task(catch_up_and_cleanup())
+
+    # Запускаємо безперервний бекап сегментами
+    if settings['continuous_backup']:
+        segment_shipper.recover(datetime.now().strftime("%Y-%m-%d"), load_day_messages())
+    segments_task = asyncio.create_task(segment_shipper.run(lambda: settings['continuous_backup']))
+
     # Запускаємо цикл самооптимізації якщо увімкнено
     optimization_task = None
     if optimization_enabled and optimizer:
@@ -2699,6 +4119,14 @@ async def main():
             except asyncio.CancelledError:
                 pass
 
+        # Скасовуємо задачу сповіщень
+        if not alerts_task.done():
+            alerts_task.cancel()
+            try:
+                await alerts_task
+            except asyncio.CancelledError:
+                pass
+
         # Скасовуємо задачу перевірки повідомлень
         if not message_checker_task.done():
             message_checker_task.cancel()
@@ -2707,9 +4135,44 @@ async def main():
             except asyncio.CancelledError:
                 pass
 
+        # Зупиняємо чергу збереження (записує все, що вже в смугах)
+        if not ingest_task.done():
+            ingest_task.cancel()
+            try:
+                await ingest_task
+            except asyncio.CancelledError:
+                pass
+
+        # Запечатуємо відкритий сегмент (відправиться після перезапуску)
+        if not segments_task.done():
+            segments_task.cancel()
+            try:
+                await segments_task
+            except asyncio.CancelledError:
+                pass
+
+        viewer_prefetcher.cancel_all()
+        chat_timeline.flush()
+        file_cache.flush()
+        partition_manifest.flush()
+
+        # Перервана догрузка докачається при наступному запуску
+        if not catch_up_task.done():
+            catch_up_task.cancel()
+            try:
+                await catch_up_task
+            except asyncio.CancelledError:
+                pass
+
+        # Зупиняємо воркери медіа
+        await media_capture.stop()
+
         # Зупиняємо планувальник
         scheduler.shutdown(wait=False)
 
+        # Закриваємо сесії Storage Box
+        storage_pool.close_all()
+
         # Зупиняємо Bot API
         try:
             await asyncio.wait_for(bot_app.updater.stop(), timeout=2.0)
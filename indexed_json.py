@@ -0,0 +1,137 @@
+"""
+📑 ІНДЕКСОВАНИЙ JSON (indexed-v1)
+Формат файлів дня на сервері, з якого переглядач читає лише потрібні
+повідомлення. Файл лишається звичайним JSON ({"messages": [...]}), тому
+json.load та скачування користувачем працюють як раніше:
+
+    {"indexed": {"format", "count", "index_offset", "index_length"},   <- рядок HEADER_SIZE байт
+    "messages": [
+    {...повідомлення 1...},
+    {...повідомлення 2...}
+    ],
+    "index": [[offset, length], ...]}
+
+Переглядач читає заголовок, потім блок індексу, потім діапазон байтів сторінки.
+"""
+
+import os
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FORMAT = "indexed-v1"
+HEADER_SIZE = 256
+HEADER_PREFIX = b'{"indexed": '
+
+
+def write_indexed(messages: Iterable[Dict[str, Any]], path: str) -> int:
+    """Записує повідомлення у форматі indexed-v1 (потоково, в пам'яті лише індекс)
+
+    Повертає кількість записаних повідомлень.
+    """
+    index: List[Tuple[int, int]] = []
+    with open(path, 'wb') as f:
+        # Заголовок фіксованого розміру дописується в кінці, коли відомі кількість та зсув індексу
+        f.write(b' ' * HEADER_SIZE)
+        f.write(b'"messages": [\n')
+        position = f.tell()
+        for message in messages:
+            if index:
+                f.write(b',\n')
+                position += 2
+            record = json.dumps(message, ensure_ascii=False).encode('utf-8')
+            index.append((position, len(record)))
+            f.write(record)
+            position += len(record)
+        f.write(b'\n],\n"index": ')
+
+        index_offset = f.tell()
+        index_bytes = json.dumps(index, separators=(',', ':')).encode('utf-8')
+        f.write(index_bytes)
+        f.write(b'}\n')
+
+        header = {
+            "format": FORMAT,
+            "count": len(index),
+            "index_offset": index_offset,
+            "index_length": len(index_bytes),
+        }
+        header_line = HEADER_PREFIX + json.dumps(header).encode('utf-8') + b','
+        if len(header_line) >= HEADER_SIZE:
+            raise ValueError("заголовок indexed-v1 не вміщається в HEADER_SIZE")
+        f.seek(0)
+        f.write(header_line.ljust(HEADER_SIZE - 1) + b'\n')
+    return len(index)
+
+
+def write_plain(messages: Iterable[Dict[str, Any]], path: str) -> int:
+    """Записує повідомлення звичайним JSON {"messages": [...]} (формат локальних файлів дня)
+
+    Повертає кількість записаних повідомлень.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"messages": [\n')
+        for message in messages:
+            if count:
+                f.write(',\n')
+            f.write(json.dumps(message, ensure_ascii=False))
+            count += 1
+        f.write('\n]}\n')
+    return count
+
+
+def convert_file(source_path: str, target_path: str) -> str:
+    """Копія JSON-файлу дня у форматі indexed-v1"""
+    with open(source_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    write_indexed(data.get('messages', []), target_path)
+    return target_path
+
+
+def iter_messages(path: str) -> Iterator[Dict[str, Any]]:
+    """Повідомлення файлу дня: indexed-v1 читається рядок за рядком, звичайний JSON - повністю"""
+    with open(path, 'rb') as f:
+        header = parse_header(f.read(HEADER_SIZE))
+        if header is None:
+            f.seek(0)
+            yield from json.load(f).get('messages', [])
+            return
+
+        f.readline()  # "messages": [
+        for _ in range(header['count']):
+            yield json.loads(f.readline().rstrip(b',\n'))
+
+
+def parse_header(head: bytes) -> Optional[Dict[str, Any]]:
+    """Заголовок з перших HEADER_SIZE байт (None - файл без індексу)"""
+    if not head.startswith(HEADER_PREFIX):
+        return None
+    line = head.split(b'\n', 1)[0].rstrip()
+    try:
+        header = json.loads(line[len(HEADER_PREFIX):].rstrip(b','))
+    except ValueError:
+        return None
+    return header if header.get('format') == FORMAT else None
+
+
+def parse_index(raw: bytes) -> List[Tuple[int, int]]:
+    return [tuple(entry) for entry in json.loads(raw)]
+
+
+def record_range(index: List[Tuple[int, int]], first: int, last: int) -> Tuple[int, int]:
+    """(offset, length) одного суцільного діапазону з записами first..last включно"""
+    start = index[first][0]
+    end = index[last][0] + index[last][1]
+    return start, end - start
+
+
+def slice_records(data: bytes, base_offset: int, index: List[Tuple[int, int]],
+                  first: int, last: int) -> List[Dict[str, Any]]:
+    """Розбирає записи first..last з прочитаного діапазону"""
+    records = []
+    for position in range(first, last + 1):
+        offset, length = index[position]
+        relative = offset - base_offset
+        records.append(json.loads(data[relative:relative + length]))
+    return records
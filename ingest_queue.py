@@ -0,0 +1,280 @@
+"""
+🚦 ПРІОРИТЕТНІ СМУГИ ЗБЕРЕЖЕННЯ
+Повідомлення зберігаються в порядку Збережені > приватні > групи > канали.
+При перевантаженні (глибина черги або затримка запису) нижчі смуги
+проріджуються або відкладаються до спаду навантаження. Проріджені
+повідомлення не губляться - їх дописує догоняння після спаду.
+Записи йдуть пачками: одне переписування файлу дня на всю пачку
+"""
+
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from chat_filters import chat_kind
+
+logger = logging.getLogger(__name__)
+
+# Смуги в порядку пріоритету
+LANES = ('saved', 'private', 'groups', 'channels')
+
+# Смуги, які можна проріджувати/відкладати
+SHEDDABLE_LANES = ('groups', 'channels')
+
+# Політики при перевантаженні
+SHED_POLICIES = ('defer', 'sample')
+
+# Боти зберігаються лише за явним allow-правилом і пишуться смугою приватних
+LANE_BY_KIND = {
+    'SAVED_MESSAGES': 'saved',
+    'PRIVATE': 'private',
+    'BOT': 'private',
+    'GROUP': 'groups',
+    'SUPERGROUP': 'groups',
+    'CHANNEL': 'channels',
+}
+
+
+def message_key(message_data: Dict[str, Any]) -> tuple:
+    return message_data.get('chat_id'), message_data.get('message_id')
+
+
+def lane_for(message_data: Dict[str, Any]) -> str:
+    """Смуга для повідомлення за його типом чату"""
+    return LANE_BY_KIND.get(chat_kind(message_data.get('chat_type') or ''), 'private')
+
+
+class PriorityIngestQueue:
+    """Черга збереження з пріоритетними смугами та скиданням навантаження"""
+
+    def __init__(self, persist: Callable[[List[Dict[str, Any]]], None],
+                 depth_threshold: int = 200,
+                 latency_threshold: float = 0.5,
+                 shed_policy: str = 'defer',
+                 sample_rate: int = 5,
+                 max_deferred: int = 10000,
+                 catch_up_batch: int = 50,
+                 write_batch: int = 50):
+        # persist(messages) записує пачку повідомлень
+        self.persist = persist
+        self.write_batch = max(1, write_batch)
+        self.depth_threshold = depth_threshold
+        self.latency_threshold = latency_threshold
+        self.shed_policy = shed_policy
+        self.sample_rate = max(1, sample_rate)
+        self.catch_up_batch = catch_up_batch
+
+        self.lanes = {lane: deque() for lane in LANES}
+        self.deferred = deque(maxlen=max_deferred)
+        # Проріджені при 'sample': ключ -> повідомлення (дописуються після спаду навантаження)
+        self.skipped: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self.max_skipped = max_deferred
+        # Ключі всіх незаписаних повідомлень (у смугах, відкладених та проріджених)
+        self.pending_keys = set()
+        # Ключі повідомлень, що вже стоять у смугах або записуються
+        self.queued_keys = set()
+        self.latency_ema = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._sample_counter = {lane: 0 for lane in SHEDDABLE_LANES}
+
+        self.stats = {lane: {'submitted': 0, 'persisted': 0, 'deferred': 0, 'sampled_out': 0, 'caught_up': 0}
+                      for lane in LANES}
+        self.stats_total = {'duplicates': 0, 'deferred_dropped': 0, 'skipped_dropped': 0,
+                            'overload_events': 0, 'errors': 0, 'batches': 0}
+        self._overloaded = False
+
+    def _events(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+        return self._wakeup, self._idle
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self.lanes.values())
+
+    def is_overloaded(self) -> bool:
+        """Чи перевищено поріг глибини черги або затримки запису"""
+        overloaded = self.depth() >= self.depth_threshold or self.latency_ema >= self.latency_threshold
+        if overloaded and not self._overloaded:
+            self.stats_total['overload_events'] += 1
+            logger.warning(
+                f"🚦 Перевантаження збереження: черга {self.depth()}, "
+                f"затримка {self.latency_ema * 1000:.0f}мс - {self.shed_policy} для груп/каналів"
+            )
+        self._overloaded = overloaded
+        return overloaded
+
+    def submit(self, message_data: Dict[str, Any]) -> bool:
+        """Ставить повідомлення в смугу (False - дублікат або проріджено)"""
+        key = message_key(message_data)
+        if key in self.pending_keys:
+            self.stats_total['duplicates'] += 1
+            return False
+
+        lane = lane_for(message_data)
+        self.stats[lane]['submitted'] += 1
+
+        if lane in SHEDDABLE_LANES and self.is_overloaded():
+            if self.shed_policy == 'sample':
+                self._sample_counter[lane] += 1
+                if self._sample_counter[lane] % self.sample_rate:
+                    # Ключ лишається в pending_keys, тому повторне опитування не подасть його знову
+                    if len(self.skipped) >= self.max_skipped:
+                        dropped_key, _ = self.skipped.popitem(last=False)
+                        self.pending_keys.discard(dropped_key)
+                        self.stats_total['skipped_dropped'] += 1
+                    self.pending_keys.add(key)
+                    self.skipped[key] = message_data
+                    self.stats[lane]['sampled_out'] += 1
+                    return False
+            else:
+                if len(self.deferred) == self.deferred.maxlen:
+                    # Найстаріше відкладене витісняється - його ключ більше не очікує запису
+                    self.stats_total['deferred_dropped'] += 1
+                    self.pending_keys.discard(message_key(self.deferred[0]))
+                self.pending_keys.add(key)
+                self.deferred.append(message_data)
+                self.stats[lane]['deferred'] += 1
+                return True
+
+        self._enqueue(lane, message_data)
+        return True
+
+    def _enqueue(self, lane: str, message_data: Dict[str, Any]):
+        wakeup, idle = self._events()
+        key = message_key(message_data)
+        self.pending_keys.add(key)
+        self.queued_keys.add(key)
+        self.lanes[lane].append(message_data)
+        idle.clear()
+        wakeup.set()
+
+    def _next(self) -> Optional[tuple]:
+        for lane in LANES:
+            if self.lanes[lane]:
+                return lane, self.lanes[lane].popleft()
+        return None
+
+    def _next_batch(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """До write_batch повідомлень, починаючи з найвищої смуги"""
+        batch = []
+        while len(batch) < self.write_batch and (item := self._next()) is not None:
+            batch.append(item)
+        return batch
+
+    def _pop_shed(self) -> Optional[Dict[str, Any]]:
+        """Наступне відкладене, а після них - проріджене повідомлення"""
+        if self.deferred:
+            return self.deferred.popleft()
+        if self.skipped:
+            return self.skipped.popitem(last=False)[1]
+        return None
+
+    def _catch_up(self) -> int:
+        """Повертає відкладені повідомлення в смуги, коли навантаження спало"""
+        moved = 0
+        while moved < self.catch_up_batch and (message_data := self._pop_shed()) is not None:
+            if message_key(message_data) in self.queued_keys:
+                # Та сама пара (chat_id, message_id) вже в смузі - друга копія не потрібна
+                self.stats_total['duplicates'] += 1
+                continue
+            lane = lane_for(message_data)
+            self.stats[lane]['caught_up'] += 1
+            self._enqueue(lane, message_data)
+            moved += 1
+        if moved:
+            logger.info(
+                f"🚦 Догоняємо відкладені повідомлення: {moved} "
+                f"(залишилось {len(self.deferred) + len(self.skipped)})"
+            )
+        return moved
+
+    async def run(self):
+        """Цикл запису: пачки повідомлень, починаючи з найвищої непорожньої смуги"""
+        wakeup, idle = self._events()
+        while True:
+            try:
+                batch = self._next_batch()
+                if not batch:
+                    if (self.deferred or self.skipped) and not self.is_overloaded() and self._catch_up():
+                        continue
+                    idle.set()
+                    wakeup.clear()
+                    # Повертаємось періодично, щоб догнати відкладені
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        # Без записів затримка поступово згасає
+                        self.latency_ema *= 0.5
+                    continue
+
+                start = time.perf_counter()
+                if self._persist_batch([message_data for _, message_data in batch]):
+                    for lane, _ in batch:
+                        self.stats[lane]['persisted'] += 1
+
+                elapsed = time.perf_counter() - start
+                self.latency_ema = self.latency_ema * 0.8 + elapsed * 0.2
+
+                # Віддаємо керування event loop між записами
+                await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                # Дописуємо те, що вже в смугах, а потім відкладені та проріджені
+                remaining = []
+                written = set()
+                while (item := self._next()) is not None:
+                    written.add(message_key(item[1]))
+                    remaining.append(item[1])
+                shed = 0
+                while (message_data := self._pop_shed()) is not None:
+                    if message_key(message_data) not in written:
+                        written.add(message_key(message_data))
+                        remaining.append(message_data)
+                        shed += 1
+                failed = 0
+                for i in range(0, len(remaining), self.write_batch):
+                    chunk = remaining[i:i + self.write_batch]
+                    failed += 0 if self._persist_batch(chunk) else len(chunk)
+                if shed:
+                    logger.info(f"🚦 При зупинці записано відкладені повідомлення: {shed}")
+                if failed:
+                    logger.warning(f"⚠️ При зупинці не записано {failed} повідомлень")
+                raise
+
+    def _persist_batch(self, messages: List[Dict[str, Any]]) -> bool:
+        try:
+            self.persist(messages)
+            self.stats_total['batches'] += 1
+            return True
+        except Exception as e:
+            self.stats_total['errors'] += len(messages)
+            logger.error(f"❌ Помилка запису {len(messages)} повідомлень: {e}")
+            return False
+        finally:
+            for message_data in messages:
+                key = message_key(message_data)
+                self.pending_keys.discard(key)
+                self.queued_keys.discard(key)
+
+    async def drain(self, timeout: float = 30.0):
+        """Чекає поки всі смуги будуть записані"""
+        _, idle = self._events()
+        if self.depth():
+            idle.clear()
+        try:
+            await asyncio.wait_for(idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Черга збереження не спорожніла за {timeout}с")
+
+    def get_stats(self) -> dict:
+        return {
+            'lanes': {lane: {**self.stats[lane], 'queued': len(self.lanes[lane])} for lane in LANES},
+            'deferred_pending': len(self.deferred) + len(self.skipped),
+            'latency_ms': self.latency_ema * 1000,
+            'overloaded': self._overloaded,
+            **self.stats_total,
+        }
@@ -0,0 +1,257 @@
+"""
+🔔 СПОВІЩЕННЯ ЗА КЛЮЧОВИМИ СЛОВАМИ
+Автомат Ахо-Корасік шукає всі слова зі списку за один прохід по тексту
+(незалежно від кількості слів), збіги відправляються адміну пакетами
+"""
+
+import os
+import json
+import time
+import random
+import string
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Awaitable, Dict, Any, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасік (без урахування регістру)"""
+
+    def __init__(self, patterns: List[str], whole_words: bool = True):
+        self.patterns = [p.lower() for p in patterns if p]
+        self.whole_words = whole_words
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]
+        self._build()
+
+    def _build(self):
+        # 1. Бор з усіх слів
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = next_state
+            self.out[state].append(index)
+
+        # 2. Суфіксні посилання обходом в ширину
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                # Виходи суфіксного стану успадковуються, щоб пошук лишався лінійним
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def _is_boundary(self, text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else ' '
+        after = text[end] if end < len(text) else ' '
+        return not before.isalnum() and not after.isalnum()
+
+    def find(self, text: str) -> Set[str]:
+        """Повертає множину знайдених слів"""
+        found: Set[str] = set()
+        if not text or not self.patterns:
+            return found
+
+        lowered = text.lower()
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for position, char in enumerate(lowered):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                for index in out[state]:
+                    pattern = self.patterns[index]
+                    start = position - len(pattern) + 1
+                    if not self.whole_words or self._is_boundary(lowered, start, position + 1):
+                        found.add(pattern)
+        return found
+
+
+class KeywordAlerter:
+    """Стадія сповіщень в шляху збереження повідомлень
+
+    check() викликається для кожного збереженого повідомлення і лише додає
+    збіг у буфер. Відправка адміну йде окремим циклом пакетами, не частіше
+    ніж раз на batch_interval секунд.
+    """
+
+    def __init__(self, keywords_file: str = "alert_keywords.json",
+                 batch_interval: float = 30.0,
+                 max_batch: int = 10,
+                 max_pending: int = 200):
+        self.keywords_file = keywords_file
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.pending = deque(maxlen=max_pending)
+        self.keywords = self.load_keywords()
+        self.matcher = AhoCorasick(self.keywords)
+        self.stats = {
+            'checked': 0,
+            'matched_messages': 0,
+            'alerts_sent': 0,
+            'batches_sent': 0,
+            'dropped': 0,
+        }
+
+    def load_keywords(self) -> List[str]:
+        """Завантажує список слів для відстеження"""
+        if os.path.exists(self.keywords_file):
+            try:
+                with open(self.keywords_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Помилка завантаження ключових слів: {e}")
+        return []
+
+    def save_keywords(self):
+        """Зберігає список слів"""
+        try:
+            with open(self.keywords_file, 'w', encoding='utf-8') as f:
+                json.dump(self.keywords, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Помилка збереження ключових слів: {e}")
+
+    def compile(self):
+        """Перебудовує автомат після зміни списку"""
+        start = time.perf_counter()
+        self.matcher = AhoCorasick(self.keywords)
+        logger.info(
+            f"🔔 Автомат сповіщень: {len(self.keywords)} слів, "
+            f"{len(self.matcher.goto)} станів, {time.perf_counter() - start:.3f}s"
+        )
+
+    def add_keywords(self, words: List[str]):
+        for word in words:
+            word = ' '.join(word.split()).lower()
+            if word and word not in self.keywords:
+                self.keywords.append(word)
+        self.save_keywords()
+        self.compile()
+
+    def remove_keywords(self, words: List[str]):
+        lowered = {' '.join(w.split()).lower() for w in words}
+        self.keywords = [k for k in self.keywords if k not in lowered]
+        self.save_keywords()
+        self.compile()
+
+    def check(self, message_data: Dict[str, Any]) -> Set[str]:
+        """Перевіряє повідомлення, збіги додаються в буфер сповіщень"""
+        if not self.keywords:
+            return set()
+
+        self.stats['checked'] += 1
+        matches = self.matcher.find(message_data.get('text') or '')
+        if matches:
+            self.stats['matched_messages'] += 1
+            if len(self.pending) == self.pending.maxlen:
+                self.stats['dropped'] += 1
+            self.pending.append({
+                'keywords': sorted(matches),
+                'chat_title': message_data.get('chat_title') or message_data.get('chat_id'),
+                'from': message_data.get('from_first_name') or message_data.get('from_user_id'),
+                'date': message_data.get('date'),
+                'text': (message_data.get('text') or '')[:200],
+            })
+        return matches
+
+    def format_batch(self, batch: List[Dict[str, Any]]) -> str:
+        text = f"🔔 Знайдено ключові слова ({len(batch)}):\n\n"
+        for alert in batch:
+            text += (
+                f"🏷️ {', '.join(alert['keywords'])}\n"
+                f"💬 {alert['chat_title']} | 👤 {alert['from']} | 🕐 {(alert['date'] or '')[11:16]}\n"
+                f"📝 {alert['text']}\n\n"
+            )
+        if self.pending:
+            text += f"… і ще {len(self.pending)} в черзі"
+        return text
+
+    async def run(self, send: Callable[[str], Awaitable[Any]]):
+        """Цикл відправки пакетів сповіщень"""
+        while True:
+            try:
+                await asyncio.sleep(self.batch_interval)
+                if not self.pending:
+                    continue
+
+                batch = [self.pending.popleft() for _ in range(min(self.max_batch, len(self.pending)))]
+                await send(self.format_batch(batch))
+                self.stats['alerts_sent'] += len(batch)
+                self.stats['batches_sent'] += 1
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Помилка відправки сповіщень: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'keywords': len(self.keywords),
+            'states': len(self.matcher.goto),
+            'pending': len(self.pending),
+        }
+
+
+def benchmark_matcher(num_patterns: int = 10000, num_messages: int = 5000,
+                      message_length: int = 300, seed: int = 42) -> Dict[str, float]:
+    """Бенчмарк автомата: побудова та пропускна здатність на num_patterns словах"""
+    rng = random.Random(seed)
+    alphabet = string.ascii_lowercase + string.digits
+
+    patterns = {''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 12))) for _ in range(num_patterns)}
+    pattern_list = list(patterns)
+
+    messages = []
+    for _ in range(num_messages):
+        words = [''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 10))) for _ in range(message_length // 6)]
+        if rng.random() < 0.1:
+            words[rng.randrange(len(words))] = rng.choice(pattern_list)
+        messages.append(' '.join(words))
+
+    start = time.perf_counter()
+    matcher = AhoCorasick(pattern_list)
+    build_time = time.perf_counter() - start
+
+    total_chars = sum(len(m) for m in messages)
+    matched = 0
+    start = time.perf_counter()
+    for message in messages:
+        if matcher.find(message):
+            matched += 1
+    match_time = time.perf_counter() - start
+
+    return {
+        'patterns': len(pattern_list),
+        'states': len(matcher.goto),
+        'build_seconds': build_time,
+        'messages': num_messages,
+        'matched_messages': matched,
+        'messages_per_second': num_messages / match_time,
+        'mb_per_second': total_chars / match_time / 1024 / 1024,
+    }
+
+
+if __name__ == "__main__":
+    for count in (100, 1000, 10000):
+        result = benchmark_matcher(num_patterns=count)
+        print(
+            f"{result['patterns']:>6} слів | {result['states']:>7} станів | "
+            f"побудова {result['build_seconds']:.3f}s | "
+            f"{result['messages_per_second']:,.0f} повід./с | {result['mb_per_second']:.2f} МБ/с"
+        )
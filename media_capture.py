@@ -0,0 +1,239 @@
+"""
+📎 ЗАХОПЛЕННЯ МЕДІА
+Зберігає метадані медіа в записі повідомлення та у фоні переносить файли на Storage Box
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Callable, Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Типи медіа Pyrogram в порядку перевірки
+MEDIA_TYPES = (
+    'photo', 'video', 'animation', 'audio', 'voice',
+    'video_note', 'document', 'sticker'
+)
+
+# Розширення за замовчуванням для медіа без імені файлу
+DEFAULT_EXTENSIONS = {
+    'photo': '.jpg',
+    'video': '.mp4',
+    'animation': '.mp4',
+    'audio': '.mp3',
+    'voice': '.ogg',
+    'video_note': '.mp4',
+    'document': '.bin',
+    'sticker': '.webp',
+}
+
+
+def extract_media_info(message) -> Optional[Dict[str, Any]]:
+    """Повертає метадані медіа з повідомлення Pyrogram (або None якщо медіа немає)"""
+    for media_type in MEDIA_TYPES:
+        media = getattr(message, media_type, None)
+        if not media:
+            continue
+
+        return {
+            "type": media_type,
+            "file_unique_id": getattr(media, 'file_unique_id', None),
+            "file_name": getattr(media, 'file_name', None),
+            "mime_type": getattr(media, 'mime_type', None),
+            "file_size": getattr(media, 'file_size', None) or 0,
+            "duration": getattr(media, 'duration', None),
+            "width": getattr(media, 'width', None),
+            "height": getattr(media, 'height', None),
+        }
+    return None
+
+
+def _hash_file(path: str) -> str:
+    """SHA-256 файлу (читаємо блоками, щоб не тримати файл в пам'яті)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCapture:
+    """Обмежений пул воркерів для завантаження медіа
+
+    Завантаження йде в локальні spool-файли, потім файл відправляється на
+    Storage Box. Файли дедуплікуються за SHA-256 вмісту. Черга обмежена:
+    якщо вона заповнена, медіа пропускається, а текстовий шлях не чекає.
+    """
+
+    def __init__(self, client, uploader: Callable[[str, str], bool],
+                 spool_dir: str = "media_spool",
+                 index_file: str = "media_index.json",
+                 workers: int = 2,
+                 queue_size: int = 100,
+                 max_file_size: int = 20 * 1024 * 1024):
+        self.client = client
+        self.uploader = uploader
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.index_file = index_file
+        self.workers = workers
+        self.max_file_size = max_file_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+        self.in_flight = set()  # Хеші, які зараз відправляються
+        self.index = self.load_index()
+        self.stats = {
+            'queued': 0,
+            'uploaded': 0,
+            'deduplicated': 0,
+            'skipped_too_large': 0,
+            'dropped_queue_full': 0,
+            'failed': 0,
+            'bytes_uploaded': 0,
+        }
+
+    def load_index(self) -> Dict[str, Dict[str, Any]]:
+        """Завантажує індекс вже відправлених медіа"""
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                index.setdefault('by_hash', {})
+                index.setdefault('by_unique_id', {})
+                return index
+            except Exception as e:
+                logger.error(f"Помилка завантаження індексу медіа: {e}")
+        return {'by_hash': {}, 'by_unique_id': {}}
+
+    def save_index(self):
+        """Зберігає індекс медіа"""
+        try:
+            with open(self.index_file, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Помилка збереження індексу медіа: {e}")
+
+    def start(self):
+        """Запускає воркери (викликати з працюючого event loop)"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for worker_id in range(self.workers):
+            self.tasks.append(asyncio.create_task(self._worker(worker_id)))
+        logger.info(f"📎 Захоплення медіа запущено ({self.workers} воркерів)")
+
+    async def stop(self):
+        """Зупиняє воркери"""
+        for task in self.tasks:
+            task.cancel()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def enqueue(self, message, media_info: Dict[str, Any]) -> bool:
+        """Ставить медіа в чергу, ніколи не блокуючи виклик"""
+        if media_info.get('file_size', 0) > self.max_file_size:
+            self.stats['skipped_too_large'] += 1
+            logger.info(
+                f"📎 Медіа {media_info['type']} ({media_info['file_size']} байт) "
+                f"перевищує ліміт {self.max_file_size} байт - пропускаємо файл"
+            )
+            return False
+
+        unique_id = media_info.get('file_unique_id')
+        if unique_id and unique_id in self.index['by_unique_id']:
+            self.stats['deduplicated'] += 1
+            return False
+
+        try:
+            self.queue.put_nowait((message, media_info))
+            self.stats['queued'] += 1
+            return True
+        except asyncio.QueueFull:
+            self.stats['dropped_queue_full'] += 1
+            logger.warning(f"⚠️ Черга медіа заповнена - пропускаємо {media_info['type']}")
+            return False
+
+    async def _worker(self, worker_id: int):
+        while True:
+            message, media_info = await self.queue.get()
+            try:
+                await self._process(message, media_info)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"❌ Воркер медіа #{worker_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, message, media_info: Dict[str, Any]):
+        unique_id = media_info.get('file_unique_id') or f"{message.chat.id}_{message.id}"
+        extension = os.path.splitext(media_info.get('file_name') or '')[1] \
+            or DEFAULT_EXTENSIONS.get(media_info['type'], '.bin')
+        spool_path = os.path.join(self.spool_dir, f"{unique_id}{extension}")
+
+        local_path = await self.client.download_media(message, file_name=spool_path)
+        if not local_path or not os.path.exists(local_path):
+            self.stats['failed'] += 1
+            logger.error(f"❌ Не вдалося завантажити медіа {unique_id}")
+            return
+
+        try:
+            size = os.path.getsize(local_path)
+            if size > self.max_file_size:
+                self.stats['skipped_too_large'] += 1
+                return
+
+            file_hash = await asyncio.to_thread(_hash_file, local_path)
+
+            if file_hash in self.index['by_hash'] or file_hash in self.in_flight:
+                self.stats['deduplicated'] += 1
+                self.index['by_unique_id'][unique_id] = file_hash
+                self.save_index()
+                logger.debug(f"📎 Медіа {unique_id} вже є на сервері (дублікат)")
+                return
+
+            remote_filename = f"media/{file_hash[:2]}/{file_hash}{extension}"
+            self.in_flight.add(file_hash)
+            try:
+                success = await asyncio.to_thread(self.uploader, local_path, remote_filename)
+            finally:
+                self.in_flight.discard(file_hash)
+
+            if not success:
+                self.stats['failed'] += 1
+                logger.error(f"❌ Не вдалося відправити медіа {unique_id} на Storage Box")
+                return
+
+            self.index['by_hash'][file_hash] = {
+                'remote': remote_filename,
+                'size': size,
+                'type': media_info['type'],
+                'uploaded_at': datetime.now().isoformat(),
+            }
+            self.index['by_unique_id'][unique_id] = file_hash
+            self.save_index()
+
+            self.stats['uploaded'] += 1
+            self.stats['bytes_uploaded'] += size
+            logger.info(f"📎 Медіа {media_info['type']} відправлено: {remote_filename}")
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    def get_remote_path(self, file_unique_id: str) -> Optional[str]:
+        """Повертає шлях на сервері для медіа за file_unique_id"""
+        file_hash = self.index['by_unique_id'].get(file_unique_id)
+        if not file_hash:
+            return None
+        return self.index['by_hash'].get(file_hash, {}).get('remote')
+
+    def get_stats(self) -> dict:
+        """Статистика захоплення медіа"""
+        return {
+            **self.stats,
+            'queue_size': self.queue.qsize(),
+            'known_files': len(self.index['by_hash']),
+        }
@@ -0,0 +1,115 @@
+"""
+🔀 ОБ'ЄДНАННЯ ЛОКАЛЬНОЇ ТА СЕРВЕРНОЇ КОПІЙ ДНЯ
+Локальні записи лишаються на своїх місцях (на їх позиції посилається індекс
+розмов), повідомлення, які є лише на сервері, дописуються в кінець в порядку
+(дата, chat_id, message_id). Дублікати визначаються за (chat_id, message_id).
+Серверні записи сортуються зовнішнім сортуванням (відсортовані серії по
+run_size записів у тимчасових файлах, злиття heapq.merge), тому в пам'яті
+лише ключі повідомлень, одна серія та по запису з кожної серії.
+"""
+
+import os
+import json
+import heapq
+import shutil
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from indexed_json import iter_messages, write_plain
+
+logger = logging.getLogger(__name__)
+
+# Мітка серій серверних записів (локальні записи не пересортовуються)
+REMOTE = 1
+
+
+def identity_key(message_data: Dict[str, Any]) -> Tuple[int, int]:
+    """Ключ дедуплікації: те саме повідомлення могло бути збережене з різною датою"""
+    return int(message_data.get('chat_id') or 0), int(message_data.get('message_id') or 0)
+
+
+def record_key(message_data: Dict[str, Any]) -> Tuple[str, int, int]:
+    """Ключ сортування дописаних з сервера повідомлень"""
+    return (
+        message_data.get('date') or '',
+        int(message_data.get('chat_id') or 0),
+        int(message_data.get('message_id') or 0),
+    )
+
+
+def _spill_runs(records: Iterable[Dict[str, Any]], source: int, run_size: int, work_dir: str) -> List[str]:
+    """Ділить записи на відсортовані серії у файлах JSON Lines"""
+    runs = []
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        batch.sort(key=record_key)
+        path = os.path.join(work_dir, f"run_{source}_{len(runs):05d}.jsonl")
+        with open(path, 'w', encoding='utf-8') as f:
+            for message_data in batch:
+                f.write(json.dumps(message_data, ensure_ascii=False))
+                f.write('\n')
+        runs.append(path)
+        batch.clear()
+
+    for message_data in records:
+        batch.append(message_data)
+        if len(batch) >= run_size:
+            flush()
+    if batch:
+        flush()
+    return runs
+
+
+def _iter_run(path: str, source: int) -> Iterator[Tuple[Tuple[str, int, int], int, Dict[str, Any]]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            message_data = json.loads(line)
+            yield record_key(message_data), source, message_data
+
+
+def merge_files(local_path: str, remote_path: str, target_path: str,
+                run_size: int = 5000) -> Dict[str, int]:
+    """Записує в target_path локальну копію дня з дописаними повідомленнями лише з сервера
+
+    Результат замінює локальний файл, тому пишеться звичайним JSON
+    {"messages": [...]} - індекс додається лише до копії для відправки.
+    Перші stats["local"] записів збігаються з локальним файлом.
+
+    Повертає {"local", "remote", "merged", "remote_only"}.
+    """
+    stats = {'local': 0, 'remote': 0, 'merged': 0, 'remote_only': 0}
+    work_dir = tempfile.mkdtemp(prefix="merge_", dir=os.path.dirname(target_path) or '.')
+    seen = set()
+
+    def remote_only():
+        for message_data in iter_messages(remote_path):
+            stats['remote'] += 1
+            key = identity_key(message_data)
+            if key not in seen:
+                seen.add(key)
+                yield message_data
+
+    def union():
+        # Спочатку локальні записи в їхньому порядку
+        for message_data in iter_messages(local_path):
+            stats['local'] += 1
+            seen.add(identity_key(message_data))
+            yield message_data
+        # Потім серверні, яких немає локально, відсортовані за часом
+        runs = [_iter_run(run_path, REMOTE) for run_path in _spill_runs(remote_only(), REMOTE, run_size, work_dir)]
+        for _, _, message_data in heapq.merge(*runs, key=lambda item: item[0]):
+            stats['remote_only'] += 1
+            yield message_data
+
+    try:
+        stats['merged'] = write_plain(union(), target_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    logger.info(
+        f"🔀 Об'єднано {os.path.basename(local_path)}: локально {stats['local']}, "
+        f"на сервері {stats['remote']}, разом {stats['merged']} (лише на сервері: {stats['remote_only']})"
+    )
+    return stats
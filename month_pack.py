@@ -0,0 +1,278 @@
+"""
+🗃️ МІСЯЧНІ АРХІВИ НА СЕРВЕРІ
+Закриті місяці пакуються в один файл archive/<YYYY-MM>.pack:
+
+    {"pack": {"format", "month", "toc_offset", "toc_length"}}   <- рядок HEADER_SIZE байт
+    файл 1 | файл 2 | ...                                       <- вміст файлів як є
+    {"saved_messages_2025-10-08.json": [offset, length], ...}  <- зміст (TOC)
+
+Будь-який день читається діапазоном байтів за змістом. ArchiveAwareTarget
+робить це прозоро: файл, якого немає в корені, шукається в архіві місяця,
+тому переглядач, кеш та скачування працюють з обома розкладками.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from backup_targets import BackupTarget, CHUNK_SIZE, copy_with_progress, local_download_path
+from partitions import date_from_filename, day_file_name
+
+logger = logging.getLogger(__name__)
+
+PACK_DIR = "archive"
+PACK_FORMAT = "pack-v1"
+HEADER_SIZE = 256
+HEADER_PREFIX = b'{"pack": '
+
+LOG_FILE_RE = re.compile(r'^logs/bot_(\d{4}-\d{2})-\d{2}\.log$')
+
+
+def pack_name(month: str) -> str:
+    return f"{PACK_DIR}/{month}.pack"
+
+
+def month_of(remote_name: str) -> Optional[str]:
+    """Місяць файлу, який пакується в архів (файли дня в корені та логи)"""
+    if '/' not in remote_name:
+        date = date_from_filename(remote_name)
+        return date[:7] if date else None
+    match = LOG_FILE_RE.match(remote_name)
+    return match.group(1) if match else None
+
+
+def write_pack(members: List[Tuple[str, str]], target_path: str, month: str) -> Dict[str, List[int]]:
+    """Записує архів з файлів [(remote_name, local_path)] та повертає зміст"""
+    toc: Dict[str, List[int]] = {}
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    with open(target_path, 'wb') as pack:
+        pack.write(b' ' * HEADER_SIZE)
+        for remote_name, local_path in members:
+            offset = pack.tell()
+            with open(local_path, 'rb') as member:
+                length = copy_with_progress(member, pack, os.path.getsize(local_path))
+            toc[remote_name] = [offset, length]
+
+        toc_offset = pack.tell()
+        toc_bytes = json.dumps(toc, ensure_ascii=False).encode('utf-8')
+        pack.write(toc_bytes)
+
+        header = {"format": PACK_FORMAT, "month": month, "toc_offset": toc_offset, "toc_length": len(toc_bytes)}
+        header_line = HEADER_PREFIX + json.dumps(header).encode('utf-8') + b'}'
+        pack.seek(0)
+        pack.write(header_line.ljust(HEADER_SIZE - 1) + b'\n')
+    return toc
+
+
+def parse_pack_header(head: bytes) -> Optional[Dict[str, Any]]:
+    if not head or not head.startswith(HEADER_PREFIX):
+        return None
+    try:
+        header = json.loads(head.split(b'\n', 1)[0].rstrip())['pack']
+    except ValueError:
+        return None
+    return header if header.get('format') == PACK_FORMAT else None
+
+
+# Зміст архівів: ім'я архіву -> ((розмір, час зміни), зміст)
+_toc_cache: Dict[str, Tuple[Tuple[int, float], Dict[str, List[int]]]] = {}
+_toc_lock = threading.Lock()
+
+
+class ArchiveAwareTarget(BackupTarget):
+    """Обгортка цілі бекапу: файли запакованих місяців читаються з архіву"""
+
+    def __init__(self, inner: BackupTarget):
+        self.inner = inner
+        self.name = inner.name
+
+    def describe(self) -> str:
+        return self.inner.describe()
+
+    def connect(self) -> bool:
+        return self.inner.connect()
+
+    def close(self):
+        self.inner.close()
+
+    def abort(self):
+        self.inner.abort()
+
+    def list_dir(self, remote_dir: str = "") -> List[str]:
+        return self.inner.list_dir(remote_dir)
+
+    def upload_file(self, local_path, remote_filename, callback=None):
+        return self.inner.upload_file(local_path, remote_filename, callback=callback)
+
+    def upload_files(self, files, callback=None, results=None):
+        return self.inner.upload_files(files, callback=callback, results=results)
+
+    def delete_file(self, remote_filename):
+        return self.inner.delete_file(remote_filename)
+
+    def load_toc(self, month: str) -> Optional[Dict[str, List[int]]]:
+        """Зміст архіву місяця (None - місяць не запаковано)"""
+        name = pack_name(month)
+        pack_stat = self.inner.stat_file(name)
+        if pack_stat is None:
+            return None
+        with _toc_lock:
+            cached = _toc_cache.get(name)
+        if cached and cached[0] == tuple(pack_stat):
+            return cached[1]
+
+        header = parse_pack_header(self.inner.read_range(name, 0, HEADER_SIZE))
+        if header is None:
+            logger.error(f"❌ Пошкоджений заголовок архіву {name}")
+            return None
+        raw_toc = self.inner.read_range(name, header['toc_offset'], header['toc_length'])
+        if raw_toc is None:
+            return None
+        toc = json.loads(raw_toc)
+        with _toc_lock:
+            _toc_cache[name] = (tuple(pack_stat), toc)
+        return toc
+
+    def _locate(self, remote_filename: str) -> Optional[Tuple[str, int, int]]:
+        """(архів, зсув, довжина) файлу, якого немає в корені"""
+        month = month_of(remote_filename)
+        if month is None:
+            return None
+        toc = self.load_toc(month)
+        if not toc or remote_filename not in toc:
+            return None
+        offset, length = toc[remote_filename]
+        return pack_name(month), offset, length
+
+    def stat_file(self, remote_filename):
+        remote_stat = self.inner.stat_file(remote_filename)
+        if remote_stat is not None:
+            return remote_stat
+        location = self._locate(remote_filename)
+        if location is None:
+            return None
+        pack_stat = self.inner.stat_file(location[0])
+        return (location[2], pack_stat[1]) if pack_stat else None
+
+    def file_exists(self, remote_filename):
+        return self.stat_file(remote_filename) is not None
+
+    def read_range(self, remote_filename, offset, length):
+        data = self.inner.read_range(remote_filename, offset, length)
+        if data is not None:
+            return data
+        location = self._locate(remote_filename)
+        if location is None:
+            return None
+        name, base, member_length = location
+        if offset >= member_length:
+            return b''
+        return self.inner.read_range(name, base + offset, min(length, member_length - offset))
+
+    def download_file(self, remote_filename, callback=None):
+        if self.inner.stat_file(remote_filename) is not None:
+            return self.inner.download_file(remote_filename, callback=callback)
+        location = self._locate(remote_filename)
+        if location is None:
+            logger.error(f"Файл {remote_filename} не знайдено ні в корені, ні в архіві місяця")
+            return None
+
+        name, base, length = location
+        local_path = local_download_path(remote_filename)
+        with open(local_path, 'wb') as f:
+            transferred = 0
+            while transferred < length:
+                chunk = self.inner.read_range(name, base + transferred, min(CHUNK_SIZE, length - transferred))
+                if not chunk:
+                    os.remove(local_path)
+                    return None
+                f.write(chunk)
+                transferred += len(chunk)
+                if callback:
+                    callback(transferred, length)
+        return local_path
+
+    def list_files(self) -> List[str]:
+        """Дні з кореня та з архівів місяців"""
+        files = set(super().list_files())
+        for pack in self.list_dir(PACK_DIR):
+            if not pack.endswith('.pack'):
+                continue
+            toc = self.load_toc(pack[:-len('.pack')])
+            for remote_name in toc or {}:
+                date = date_from_filename(remote_name) if '/' not in remote_name else None
+                if date:
+                    files.add(day_file_name(date))
+        return sorted(files, reverse=True)
+
+
+async def consolidate_month(storage_box, month: str, members: List[str]) -> int:
+    """Пакує файли місяця (разом з уже запакованими) в архів та видаляє оригінали
+
+    storage_box - підключений AsyncStorageBox над ArchiveAwareTarget.
+    Повертає кількість нових файлів в архіві.
+    """
+    work_dir = os.path.join("temp", "pack", month)
+    os.makedirs(work_dir, exist_ok=True)
+    local_members: Dict[str, str] = {}
+    try:
+        # Вже запаковані файли (якщо місяць догрузився після пакування)
+        toc = await storage_box.load_toc(month) or {}
+        for remote_name in toc:
+            if remote_name not in members:
+                local_path = await storage_box.download_file(remote_name)
+                if not local_path:
+                    logger.error(f"❌ Не вдалося прочитати {remote_name} з архіву - пакування {month} відкладено")
+                    return 0
+                local_members[remote_name] = local_path
+
+        for remote_name in members:
+            local_path = await storage_box.download_file(remote_name)
+            if not local_path:
+                logger.error(f"❌ Не вдалося скачати {remote_name} - пакування {month} відкладено")
+                return 0
+            local_members[remote_name] = local_path
+
+        pack_path = os.path.join(work_dir, f"{month}.pack")
+        new_toc = write_pack(sorted(local_members.items()), pack_path, month)
+        if not await storage_box.upload_file(pack_path, pack_name(month)):
+            return 0
+
+        # Оригінали видаляються лише після перевірки змісту архіву на сервері
+        uploaded_toc = await storage_box.load_toc(month)
+        if uploaded_toc != new_toc:
+            logger.error(f"❌ Зміст архіву {month} на сервері не збігається - оригінали залишено")
+            return 0
+        for remote_name in members:
+            await storage_box.delete_file(remote_name)
+
+        logger.info(f"🗃️ Місяць {month} запаковано: {len(new_toc)} файлів ({len(members)} нових)")
+        return len(members)
+    finally:
+        for local_path in local_members.values():
+            if os.path.exists(local_path):
+                os.remove(local_path)
+        pack_path = os.path.join(work_dir, f"{month}.pack")
+        if os.path.exists(pack_path):
+            os.remove(pack_path)
+
+
+async def consolidate_closed_months(storage_box, current_month: Optional[str] = None) -> Dict[str, int]:
+    """Пакує всі закриті місяці, файли яких лежать в корені або в logs/"""
+    current_month = current_month or time.strftime("%Y-%m")
+    by_month: Dict[str, List[str]] = {}
+    root = await storage_box.list_dir()
+    logs = await storage_box.list_dir("logs")
+    for remote_name in root + [f"logs/{name}" for name in logs]:
+        month = month_of(remote_name)
+        if month and month < current_month:
+            by_month.setdefault(month, []).append(remote_name)
+
+    packed = {}
+    for month, members in sorted(by_month.items()):
+        packed[month] = await consolidate_month(storage_box, month, sorted(members))
+    return packed
@@ -0,0 +1,241 @@
+"""
+🗂️ ПАРТИЦІЮВАННЯ ДЕННИХ ФАЙЛІВ
+Розділяє повідомлення груп і каналів на окремі файли (по годинах та/або чатах)
+з маніфестом, через який читачі звертаються до потрібної частини напряму
+"""
+
+import os
+import re
+import json
+import time
+import logging
+from typing import Optional, Dict, Any, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Режими партиціювання
+PARTITION_MODES = ('none', 'hour', 'chat', 'chat_hour')
+
+# Основний денний файл: saved_messages_2025-10-08.json
+DAY_FILE_RE = re.compile(r'^saved_messages_(\d{4}-\d{2}-\d{2})\.json$')
+# Маніфест дня: saved_messages_2025-10-08.manifest.json
+MANIFEST_FILE_RE = re.compile(r'^saved_messages_(\d{4}-\d{2}-\d{2})\.manifest\.json$')
+# Будь-який файл дня (основний, частина або маніфест)
+ANY_DAY_FILE_RE = re.compile(r'^saved_messages_(\d{4}-\d{2}-\d{2})(\.[\w-]+)*\.json$')
+
+
+def day_file_name(date: str) -> str:
+    """Ім'я основного файлу дня"""
+    return f"saved_messages_{date}.json"
+
+
+def manifest_file_name(date: str) -> str:
+    """Ім'я маніфесту дня"""
+    return f"saved_messages_{date}.manifest.json"
+
+
+def partition_file_name(date: str, key: str) -> str:
+    """Ім'я файлу частини дня"""
+    return f"saved_messages_{date}.{key}.json"
+
+
+def is_day_file(filename: str) -> bool:
+    """Чи є файл основним файлом дня"""
+    return bool(DAY_FILE_RE.match(filename))
+
+
+def is_manifest_file(filename: str) -> bool:
+    """Чи є файл маніфестом дня"""
+    return bool(MANIFEST_FILE_RE.match(filename))
+
+
+def date_from_filename(filename: str) -> Optional[str]:
+    """Дата з імені будь-якого файлу дня"""
+    match = ANY_DAY_FILE_RE.match(filename)
+    return match.group(1) if match else None
+
+
+def partition_key_of(data_file: str) -> Optional[str]:
+    """Ключ частини з імені файлу (None - основний файл дня)"""
+    name = os.path.basename(data_file)[len("saved_messages_"):-len(".json")]
+    parts = name.split('.', 1)
+    return parts[1] if len(parts) == 2 else None
+
+
+def group_by_month(filenames: List[str]) -> Dict[str, List[str]]:
+    """Групує файли днів за місяцями ('2025-10' -> [...]), новіші першими"""
+    months: Dict[str, List[str]] = {}
+    for filename in sorted(filenames, reverse=True):
+        date = date_from_filename(filename)
+        if date:
+            months.setdefault(date[:7], []).append(filename)
+    return months
+
+
+def chat_bucket(chat_type: str) -> str:
+    """Грубий тип чату для статистики маніфесту"""
+    chat_type = (chat_type or '').upper()
+    if 'CHANNEL' in chat_type:
+        return 'CHANNEL'
+    if 'GROUP' in chat_type:
+        return 'GROUP'
+    if 'SAVED' in chat_type:
+        return 'SAVED_MESSAGES'
+    if 'PRIVATE' in chat_type:
+        return 'PRIVATE'
+    return 'OTHER'
+
+
+def partition_key(message_data: Dict[str, Any], mode: str) -> Optional[str]:
+    """Ключ частини для повідомлення (None - основний файл дня)
+
+    Збережені та приватні чати завжди йдуть в основний файл, партиціюються
+    тільки групи і канали.
+    """
+    if mode == 'none' or chat_bucket(message_data.get('chat_type')) not in ('GROUP', 'CHANNEL'):
+        return None
+
+    hour = (message_data.get('date') or '')[11:13] or '00'
+    chat = str(message_data.get('chat_id', 0)).replace('-', 'm')
+
+    if mode == 'hour':
+        return f"h{hour}"
+    if mode == 'chat':
+        return f"c{chat}"
+    return f"c{chat}.h{hour}"
+
+
+class PartitionManifest:
+    """Маніфест частин дня
+
+    Формат:
+        {"date": "...", "partitions": {key: {"file", "count", "first", "last",
+                                             "chat_ids", "types"}}}
+    """
+
+    def __init__(self, directory: str = '.', save_interval: float = 30.0, max_cached: int = 8):
+        self.directory = directory
+        self.save_interval = save_interval
+        self.max_cached = max_cached
+        # Дата -> маніфест (поточний день та дні, які об'єднуються з сервером)
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._dirty: set = set()
+        self._saved_at: Dict[str, float] = {}
+
+    def _path(self, date: str) -> str:
+        return os.path.join(self.directory, manifest_file_name(date))
+
+    def load(self, date: str) -> Dict[str, Any]:
+        """Завантажує маніфест дня (з пам'яті, якщо вже завантажено)"""
+        if date in self._cache:
+            return self._cache[date]
+
+        manifest = {"date": date, "partitions": {}}
+        path = self._path(date)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except Exception as e:
+                logger.error(f"Помилка читання маніфесту {path}: {e}")
+
+        self._cache[date] = manifest
+        # Найдавніше завантажені збережені маніфести витісняються з пам'яті
+        for cached_date in list(self._cache):
+            if len(self._cache) <= self.max_cached:
+                break
+            if cached_date != date and cached_date not in self._dirty:
+                del self._cache[cached_date]
+        return manifest
+
+    def save(self, date: str):
+        """Записує маніфест дня на диск"""
+        manifest = self.load(date)
+        with open(self._path(date), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        self._dirty.discard(date)
+        self._saved_at[date] = time.time()
+
+    def flush(self):
+        """Записує змінені маніфести (перед відправкою на сервер та при зупинці)"""
+        for date in list(self._dirty):
+            try:
+                self.save(date)
+            except Exception as e:
+                logger.error(f"Помилка збереження маніфесту {date}: {e}")
+
+    def register(self, date: str, key: str, message_data: Dict[str, Any]):
+        """Реєструє повідомлення в частині дня (на диск - не частіше save_interval)"""
+        manifest = self.load(date)
+        is_new = key not in manifest['partitions']
+        entry = manifest['partitions'].setdefault(key, self._new_entry(date, key))
+        self._add_message(entry, message_data)
+        self._dirty.add(date)
+        # Нова частина записується одразу, щоб її файл потрапив у список файлів дня
+        if is_new or time.time() - self._saved_at.get(date, 0.0) >= self.save_interval:
+            self.save(date)
+
+    def refresh(self, date: str, key: str, messages: Iterable[Dict[str, Any]]):
+        """Перераховує запис частини з її повідомлень (після об'єднання з сервером)"""
+        manifest = self.load(date)
+        entry = self._new_entry(date, key)
+        for message_data in messages:
+            self._add_message(entry, message_data)
+        manifest['partitions'][key] = entry
+        self.save(date)
+
+    @staticmethod
+    def _new_entry(date: str, key: str) -> Dict[str, Any]:
+        return {
+            "file": partition_file_name(date, key),
+            "count": 0,
+            "first": None,
+            "last": None,
+            "chat_ids": [],
+            "types": {},
+        }
+
+    @staticmethod
+    def _add_message(entry: Dict[str, Any], message_data: Dict[str, Any]):
+        entry['count'] += 1
+        msg_date = message_data.get('date')
+        if msg_date:
+            if not entry['first'] or msg_date < entry['first']:
+                entry['first'] = msg_date
+            if not entry['last'] or msg_date > entry['last']:
+                entry['last'] = msg_date
+
+        chat_id = message_data.get('chat_id')
+        if chat_id is not None and chat_id not in entry['chat_ids']:
+            entry['chat_ids'].append(chat_id)
+
+        bucket = chat_bucket(message_data.get('chat_type'))
+        entry['types'][bucket] = entry['types'].get(bucket, 0) + 1
+
+    def merge_remote(self, date: str, remote_manifest: Dict[str, Any]) -> int:
+        """Додає частини, які є лише в маніфесті з сервера (записані іншим хостом)"""
+        manifest = self.load(date)
+        added = 0
+        for key, entry in remote_manifest.get('partitions', {}).items():
+            local_entry = manifest['partitions'].get(key)
+            if local_entry is None:
+                manifest['partitions'][key] = entry
+                added += 1
+            else:
+                local_entry['count'] = max(local_entry['count'], entry.get('count', 0))
+                local_entry['chat_ids'] = sorted(set(local_entry['chat_ids']) | set(entry.get('chat_ids', [])))
+        self.save(date)
+        return added
+
+    def partition_files(self, date: str) -> List[str]:
+        """Список файлів частин дня"""
+        manifest = self.load(date)
+        return [entry['file'] for entry in manifest['partitions'].values()]
+
+    def type_counts(self, date: str) -> Dict[str, int]:
+        """Кількість повідомлень в частинах за типами чатів"""
+        counts: Dict[str, int] = {}
+        for entry in self.load(date)['partitions'].values():
+            for bucket, count in entry.get('types', {}).items():
+                counts[bucket] = counts.get(bucket, 0) + count
+        return counts
@@ -0,0 +1,303 @@
+"""
+📦 БЕЗПЕРЕРВНИЙ БЕКАП СЕГМЕНТАМИ
+Нові повідомлення збираються у сегменти, які запечатуються кожні N хвилин
+або M повідомлень і відправляються на Storage Box в папку дня з маніфестом.
+Передається лише нове, а при втраті сервера втрачається не більше одного
+відкритого сегмента. День збирається з сегментів при читанні.
+"""
+
+import os
+import json
+import time
+import asyncio
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS_DIR = "segments"
+
+
+def segment_dir(date: str) -> str:
+    """Папка сегментів дня (однакова локально і на сервері)"""
+    return f"{SEGMENTS_DIR}/{date}"
+
+
+def segment_file_name(date: str, seq: int) -> str:
+    """Ім'я файлу сегмента"""
+    return f"{segment_dir(date)}/seg_{seq:05d}.json"
+
+
+def segment_manifest_name(date: str) -> str:
+    """Ім'я маніфесту сегментів дня"""
+    return f"{segment_dir(date)}/manifest.json"
+
+
+def message_key(message_data: Dict[str, Any]) -> str:
+    return f"{message_data.get('chat_id')}:{message_data.get('message_id')}"
+
+
+def merge_segments(segments: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Збирає день з сегментів (без дублікатів, в порядку часу)"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for messages in segments:
+        for message_data in messages:
+            merged.setdefault(message_key(message_data), message_data)
+    return sorted(merged.values(), key=lambda m: m.get('date') or '')
+
+
+class SegmentShipper:
+    """Відправник сегментів дня
+
+    record() викликається зі збереження повідомлення і лише додає його у
+    відкритий сегмент. Запечатування та відправка йдуть окремим циклом run().
+
+    storage_factory повертає об'єкт з async connect/upload_file/close
+    (AsyncStorageBox).
+    """
+
+    def __init__(self, storage_factory: Callable[[], Any],
+                 interval_minutes: float = 10,
+                 max_messages: int = 200,
+                 state_file: str = "segments_state.json",
+                 check_interval: float = 30.0):
+        self.storage_factory = storage_factory
+        self.interval_minutes = interval_minutes
+        self.max_messages = max_messages
+        self.state_file = state_file
+        self.check_interval = check_interval
+
+        self.buffer: List[Dict[str, Any]] = []
+        self.buffer_date: Optional[str] = None
+        self.opened_at: Optional[float] = None
+        self.state = self.load_state()
+        # Ключі запечатаних повідомлень за днями (лише в пам'яті; у стані - max_ids сегментів)
+        self.shipped_keys: Dict[str, Set[str]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.stats = {
+            'sealed': 0,
+            'shipped': 0,
+            'shipped_messages': 0,
+            'shipped_bytes': 0,
+            'failures': 0,
+            'last_shipped': None,
+        }
+
+    def load_state(self) -> Dict[str, Any]:
+        """Завантажує стан сегментів ({"days": {date: {...}}})"""
+        state = {"days": {}}
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except Exception as e:
+                logger.error(f"Помилка читання стану сегментів: {e}")
+        for day in state['days'].values():
+            # Старий формат: повний список ключів дня замість max_ids сегментів
+            old_keys = day.pop('shipped_keys', None)
+            if old_keys:
+                max_ids: Dict[str, int] = {}
+                for key in old_keys:
+                    chat_id, _, message_id = key.rpartition(':')
+                    if message_id.isdigit():
+                        max_ids[chat_id] = max(max_ids.get(chat_id, 0), int(message_id))
+                day['max_ids'] = max_ids
+        return state
+
+    def save_state(self):
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Помилка збереження стану сегментів: {e}")
+
+    def _day(self, date: str) -> Dict[str, Any]:
+        return self.state['days'].setdefault(date, {"next_seq": 1, "segments": [], "max_ids": {}})
+
+    def is_shipped(self, date: str, message_data: Dict[str, Any]) -> bool:
+        """Чи повідомлення вже потрапило в запечатаний сегмент дня"""
+        if message_key(message_data) in self.shipped_keys.get(date, ()):
+            return True
+        # Після перезапуску: message_id в чаті зростають, тому все до найбільшого запечатаного вже є
+        max_id = self._day(date)['max_ids'].get(str(message_data.get('chat_id')))
+        return max_id is not None and int(message_data.get('message_id') or 0) <= max_id
+
+    def forget_shipped(self, date: str):
+        """Файл дня відправлено - ключі дня в пам'яті більше не потрібні"""
+        self.shipped_keys.pop(date, None)
+
+    def record(self, message_data: Dict[str, Any]):
+        """Додає збережене повідомлення у відкритий сегмент"""
+        date = datetime.now().strftime("%Y-%m-%d")
+        if self.buffer and self.buffer_date != date:
+            # Новий день - закриваємо сегмент попереднього
+            self.seal()
+
+        if not self.buffer:
+            self.buffer_date = date
+            self.opened_at = time.time()
+        self.buffer.append(message_data)
+
+        if len(self.buffer) >= self.max_messages and self._wakeup is not None:
+            self._wakeup.set()
+
+    def recover(self, date: str, messages: List[Dict[str, Any]]):
+        """Після перезапуску додає в сегмент повідомлення дня, які ще не відправлені"""
+        buffered = {message_key(m) for m in self.buffer}
+        missing = [m for m in messages if message_key(m) not in buffered and not self.is_shipped(date, m)]
+        if missing:
+            if not self.buffer:
+                self.buffer_date = date
+                self.opened_at = time.time()
+            self.buffer.extend(missing)
+            logger.info(f"📦 Відновлено {len(missing)} невідправлених повідомлень у сегмент")
+
+    def is_due(self) -> bool:
+        if not self.buffer:
+            return False
+        return (len(self.buffer) >= self.max_messages
+                or time.time() - self.opened_at >= self.interval_minutes * 60)
+
+    def seal(self) -> Optional[str]:
+        """Запечатує відкритий сегмент у локальний файл"""
+        if not self.buffer:
+            return None
+
+        date = self.buffer_date
+        day = self._day(date)
+        seq = day['next_seq']
+        path = segment_file_name(date, seq)
+
+        os.makedirs(segment_dir(date), exist_ok=True)
+        payload = json.dumps({"date": date, "seq": seq, "messages": self.buffer}, ensure_ascii=False)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+
+        dates = [m.get('date') for m in self.buffer if m.get('date')]
+        day['segments'].append({
+            "seq": seq,
+            "file": path,
+            "count": len(self.buffer),
+            "first": min(dates) if dates else None,
+            "last": max(dates) if dates else None,
+            "sha256": hashlib.sha256(payload.encode('utf-8')).hexdigest(),
+            "size": len(payload.encode('utf-8')),
+            "uploaded": False,
+        })
+        shipped = self.shipped_keys.setdefault(date, set())
+        max_ids = day.setdefault('max_ids', {})
+        for message_data in self.buffer:
+            shipped.add(message_key(message_data))
+            chat_id = str(message_data.get('chat_id'))
+            max_ids[chat_id] = max(max_ids.get(chat_id, 0), int(message_data.get('message_id') or 0))
+        day['next_seq'] = seq + 1
+
+        self.buffer = []
+        self.opened_at = None
+        self.stats['sealed'] += 1
+        self.save_state()
+        return path
+
+    def _write_manifest(self, date: str) -> str:
+        """Локальна копія маніфесту дня (тільки відправлені сегменти)"""
+        day = self._day(date)
+        manifest = {
+            "date": date,
+            "updated": datetime.now().isoformat(),
+            "segments": [
+                {k: v for k, v in entry.items() if k != 'uploaded'}
+                for entry in day['segments'] if entry['uploaded']
+            ],
+        }
+        path = segment_manifest_name(date)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return path
+
+    async def ship_pending(self) -> int:
+        """Відправляє запечатані сегменти та оновлює маніфест на сервері"""
+        pending = [(date, entry) for date, day in self.state['days'].items()
+                   for entry in day['segments'] if not entry['uploaded']]
+        if not pending:
+            return 0
+
+        storage_box = self.storage_factory()
+        if not await storage_box.connect():
+            await storage_box.close()
+            self.stats['failures'] += 1
+            logger.error("📦 Не вдалося підключитися до Storage Box - сегменти відправимо пізніше")
+            return 0
+
+        shipped = 0
+        try:
+            touched_dates = set()
+            for date, entry in pending:
+                if not await storage_box.upload_file(entry['file'], entry['file']):
+                    self.stats['failures'] += 1
+                    break
+                entry['uploaded'] = True
+                touched_dates.add(date)
+                shipped += 1
+                self.stats['shipped_messages'] += entry['count']
+                self.stats['shipped_bytes'] += entry['size']
+                os.remove(entry['file'])
+
+            # Маніфест відправляється після сегментів, тому він ніколи не посилається на відсутній сегмент
+            for date in touched_dates:
+                manifest_path = self._write_manifest(date)
+                await storage_box.upload_file(manifest_path, manifest_path)
+        finally:
+            await storage_box.close()
+            self.save_state()
+
+        if shipped:
+            self.stats['shipped'] += shipped
+            self.stats['last_shipped'] = datetime.now().isoformat()
+            logger.info(f"📦 Відправлено сегментів: {shipped}")
+        return shipped
+
+    def prune(self, keep_date: str):
+        """Забуває повністю відправлені минулі дні"""
+        for date in list(self.state['days']):
+            day = self.state['days'][date]
+            if date != keep_date and all(entry['uploaded'] for entry in day['segments']):
+                del self.state['days'][date]
+                self.shipped_keys.pop(date, None)
+                shutil.rmtree(segment_dir(date), ignore_errors=True)
+        self.save_state()
+
+    async def run(self, is_enabled: Callable[[], bool]):
+        """Цикл запечатування та відправки сегментів"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+                if not is_enabled():
+                    continue
+                if self.is_due():
+                    self.seal()
+                await self.ship_pending()
+            except asyncio.CancelledError:
+                # Запечатуємо відкритий сегмент, щоб відправити його після перезапуску
+                self.seal()
+                raise
+            except Exception as e:
+                logger.error(f"Помилка відправки сегментів: {e}")
+
+    def get_stats(self) -> dict:
+        pending = sum(1 for day in self.state['days'].values() for e in day['segments'] if not e['uploaded'])
+        return {
+            **self.stats,
+            'open_messages': len(self.buffer),
+            'open_age_seconds': time.time() - self.opened_at if self.opened_at else 0,
+            'pending_segments': pending,
+        }
@@ -0,0 +1,920 @@
+"""
+📦 STORAGE BOX
+Пул постійних SSH/SFTP сесій, SFTP ціль бекапу (Hetzner Storage Box) та
+асинхронний API над обраною ціллю бекапу (BACKUP_TARGET)
+"""
+
+import os
+import time
+import shlex
+import random
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import paramiko
+
+from upload_manifest import file_sha256
+from backup_targets import (
+    BackupTarget, LocalDirectoryTarget, S3Target, TransferCancelled,
+    CHUNK_SIZE, PART_SUFFIX, local_download_path
+)
+from backup_crypto import EncryptedTarget, load_key
+from bandwidth import BandwidthShaper
+from month_pack import ArchiveAwareTarget
+
+logger = logging.getLogger(__name__)
+
+# Конфігурація Storage Box
+STORAGE_BOX_HOST = os.getenv("STORAGE_BOX_HOST")
+STORAGE_BOX_USERNAME = os.getenv("STORAGE_BOX_USERNAME")
+STORAGE_BOX_PASSWORD = os.getenv("STORAGE_BOX_PASSWORD")
+STORAGE_BOX_PATH = os.getenv("STORAGE_BOX_PATH")
+
+# Ціль бекапу: sftp (Storage Box), local (папка) або s3 (S3-сумісне сховище)
+BACKUP_TARGET = os.getenv("BACKUP_TARGET", "sftp").strip().lower()
+BACKUP_LOCAL_PATH = os.getenv("BACKUP_LOCAL_PATH", "backup")
+BACKUP_S3_BUCKET = os.getenv("BACKUP_S3_BUCKET")
+BACKUP_S3_PREFIX = os.getenv("BACKUP_S3_PREFIX", "telegram_bot")
+BACKUP_S3_ENDPOINT = os.getenv("BACKUP_S3_ENDPOINT") or None  # None - AWS, інакше MinIO/інший сервер
+BACKUP_S3_ACCESS_KEY = os.getenv("BACKUP_S3_ACCESS_KEY")
+BACKUP_S3_SECRET_KEY = os.getenv("BACKUP_S3_SECRET_KEY")
+BACKUP_S3_REGION = os.getenv("BACKUP_S3_REGION") or None
+
+# Шифрування бекапів: ключ (64 hex) або файл з ключем (створюється при першому запуску)
+BACKUP_ENCRYPTION_KEY = load_key(os.getenv("BACKUP_ENCRYPTION_KEY"), os.getenv("BACKUP_ENCRYPTION_KEY_FILE"))
+
+# Таймаути асинхронних операцій (секунди)
+OPERATION_TIMEOUT = 60.0
+TRANSFER_TIMEOUT = 600.0
+
+# Запас таймауту відправки над часом передачі на найнижчому ліміті швидкості
+TRANSFER_TIMEOUT_MARGIN = 1.25
+
+# Спроби передачі з докачуванням
+TRANSFER_ATTEMPTS = 3
+
+
+class PooledSession:
+    """SSH з'єднання з відкритим SFTP каналом"""
+
+    def __init__(self, ssh: paramiko.SSHClient, sftp: paramiko.SFTPClient):
+        self.ssh = ssh
+        self.sftp = sftp
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.uses = 0
+        # Папки на сервері, які точно існують (живуть разом із сесією)
+        self.known_dirs = set()
+
+    def is_active(self) -> bool:
+        """Чи живий транспорт (без мережевого запиту)"""
+        transport = self.ssh.get_transport()
+        return bool(transport and transport.is_active())
+
+    def health_check(self) -> bool:
+        """Перевірка сесії перед повторним використанням"""
+        if not self.is_active():
+            return False
+        try:
+            self.ssh.get_transport().send_ignore()
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.sftp.close()
+        except Exception:
+            pass
+        try:
+            self.ssh.close()
+        except Exception:
+            pass
+
+
+class SFTPConnectionPool:
+    """Пул постійних SFTP сесій з keep-alive
+
+    Сесії перевикористовуються між операціями, тому SSH рукостискання з
+    парольною автентифікацією відбувається лише при першому підключенні або
+    після розриву. Кількість одночасних каналів обмежена max_sessions.
+    """
+
+    def __init__(self, host: str, username: str, password: str,
+                 max_sessions: int = 3,
+                 idle_timeout: float = 300.0,
+                 keepalive: int = 30,
+                 connect_retries: int = 3,
+                 backoff_base: float = 1.0,
+                 acquire_timeout: float = 60.0):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.connect_retries = connect_retries
+        self.backoff_base = backoff_base
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: List[PooledSession] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_sessions)
+
+        self.stats = {
+            'acquisitions': 0,
+            'reuses': 0,
+            'handshakes': 0,
+            'handshake_time_total': 0.0,
+            'handshake_time_max': 0.0,
+            'health_failures': 0,
+            'connect_failures': 0,
+            'expired': 0,
+            'in_use': 0,
+            'dir_cache_hits': 0,
+            'dir_round_trips': 0,
+            'resumed_transfers': 0,
+            'resumed_bytes': 0,
+            'verify_failures': 0,
+            'transfer_bytes': 0,
+            'transfer_seconds': 0.0,
+        }
+        # Чи підтримує сервер sha256sum через exec (None - ще не перевіряли)
+        self.remote_hash_supported: Optional[bool] = None
+        # Незавершені передачі: шлях .part -> (розмір, час зміни) джерела на момент початку.
+        # Докачуємо лише якщо джерело не змінилось, інакше префікс .part вже неправильний
+        self.partial_transfers: Dict[str, tuple] = {}
+
+    def count(self, name: str, value: float = 1):
+        """Оновлює лічильник (викликається з кількох потоків передачі)"""
+        with self._lock:
+            self.stats[name] += value
+
+    def _connect(self) -> PooledSession:
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        start = time.perf_counter()
+        ssh.connect(
+            self.host,
+            username=self.username,
+            password=self.password,
+            timeout=15,
+            banner_timeout=15,
+            auth_timeout=15
+        )
+        ssh.get_transport().set_keepalive(self.keepalive)
+        sftp = ssh.open_sftp()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.stats['handshakes'] += 1
+            self.stats['handshake_time_total'] += elapsed
+            self.stats['handshake_time_max'] = max(self.stats['handshake_time_max'], elapsed)
+        logger.info(f"🔐 Нова SFTP сесія до {self.host} ({elapsed * 1000:.0f}мс)")
+        return PooledSession(ssh, sftp)
+
+    def _connect_with_backoff(self) -> Optional[PooledSession]:
+        for attempt in range(self.connect_retries):
+            try:
+                return self._connect()
+            except Exception as conn_exc:
+                self.count('connect_failures')
+                logger.error(f"Помилка підключення до Storage Box (спроба {attempt + 1}): {conn_exc}")
+                if attempt < self.connect_retries - 1:
+                    time.sleep(self.backoff_base * (2 ** attempt) + random.uniform(0, self.backoff_base))
+        return None
+
+    def acquire(self) -> Optional[PooledSession]:
+        """Бере сесію з пулу (або створює нову)"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            logger.error(f"❌ Всі {self.max_sessions} SFTP сесій зайняті довше {self.acquire_timeout}с")
+            return None
+
+        try:
+            self.count('acquisitions')
+            while True:
+                with self._lock:
+                    session = self._idle.pop() if self._idle else None
+                if session is None:
+                    break
+
+                if time.time() - session.last_used > self.idle_timeout:
+                    self.count('expired')
+                    session.close()
+                    continue
+
+                if session.health_check():
+                    self.count('reuses')
+                    session.uses += 1
+                    self.count('in_use')
+                    return session
+
+                self.count('health_failures')
+                session.close()
+
+            session = self._connect_with_backoff()
+            if session is None:
+                self._slots.release()
+                return None
+
+            session.uses += 1
+            self.count('in_use')
+            return session
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, session: PooledSession):
+        """Повертає сесію в пул (розірвані сесії закриваються)"""
+        self.count('in_use', -1)
+        try:
+            if session.is_active():
+                try:
+                    # Скидаємо робочу папку, щоб наступний користувач почав з чистого стану
+                    session.sftp.chdir(None)
+                except Exception:
+                    pass
+                session.last_used = time.time()
+                with self._lock:
+                    self._idle.append(session)
+            else:
+                session.close()
+        finally:
+            self._slots.release()
+
+    def prune_idle(self):
+        """Закриває сесії, які простоюють довше idle_timeout"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._idle if now - s.last_used > self.idle_timeout]
+            self._idle = [s for s in self._idle if now - s.last_used <= self.idle_timeout]
+        for session in expired:
+            self.count('expired')
+            session.close()
+
+    def close_all(self):
+        """Закриває всі вільні сесії"""
+        with self._lock:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            session.close()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            idle = len(self._idle)
+        acquisitions = stats['acquisitions']
+        handshakes = stats['handshakes']
+        return {
+            **stats,
+            'idle': idle,
+            'reuse_rate': stats['reuses'] / acquisitions if acquisitions else 0.0,
+            'handshake_avg_ms': stats['handshake_time_total'] / handshakes * 1000 if handshakes else 0.0,
+            'handshake_max_ms': stats['handshake_time_max'] * 1000,
+            'transfer_mb_per_second': (stats['transfer_bytes'] / 1024 / 1024 / stats['transfer_seconds']
+                                       if stats['transfer_seconds'] else 0.0),
+        }
+
+
+# Глобальний пул сесій Storage Box
+storage_pool = SFTPConnectionPool(STORAGE_BOX_HOST, STORAGE_BOX_USERNAME, STORAGE_BOX_PASSWORD)
+
+
+class RemoteListingCache:
+    """Спільний кеш списку днів на сервері з TTL
+
+    Власні відправки файлів дня додають день у кеш одразу, тому повторне
+    читання папки потрібне лише після закінчення TTL.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self.files: Optional[List[str]] = None
+        self.loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'updates': 0}
+
+    def get(self) -> Optional[List[str]]:
+        with self._lock:
+            if self.files is None or time.time() - self.loaded_at > self.ttl:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            return list(self.files)
+
+    def set(self, files: List[str]):
+        with self._lock:
+            self.files = sorted(files, reverse=True)
+            self.loaded_at = time.time()
+
+    def invalidate(self):
+        with self._lock:
+            self.files = None
+
+    def note_upload(self, remote_filename: str):
+        """Враховує власну відправку (файл дня, частина, маніфест або сегмент)"""
+        from partitions import date_from_filename, day_file_name
+        from segment_shipper import SEGMENTS_DIR
+
+        parts = remote_filename.split('/')
+        if len(parts) == 1:
+            date = date_from_filename(parts[0])
+        elif parts[0] == SEGMENTS_DIR and len(parts) >= 2:
+            date = parts[1]
+        else:
+            return
+        if not date:
+            return
+
+        with self._lock:
+            if self.files is not None and day_file_name(date) not in self.files:
+                self.files = sorted(self.files + [day_file_name(date)], reverse=True)
+                self.stats['updates'] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'days': len(self.files or [])}
+
+
+# Глобальний кеш списку файлів
+listing_cache = RemoteListingCache()
+
+
+class StorageBoxManager(BackupTarget):
+    """SFTP ціль бекапу: операції з файлами на Storage Box через сесію з пулу"""
+
+    name = "sftp"
+
+    def __init__(self, pool: SFTPConnectionPool = None):
+        self.pool = pool or storage_pool
+        self.session: Optional[PooledSession] = None
+
+    @property
+    def sftp(self) -> paramiko.SFTPClient:
+        return self.session.sftp
+
+    def describe(self) -> str:
+        return f"🌐 Storage Box: {self.pool.username}@{self.pool.host}:{STORAGE_BOX_PATH}"
+
+    def connect(self):
+        self.session = self.pool.acquire()
+        return self.session is not None
+
+    def abort(self):
+        # Закритий транспорт - пул відкине сесію при поверненні
+        if self.session is not None:
+            self.session.close()
+
+    def _remember_dir(self, path: str):
+        """Позначає папку та всі її батьківські як існуючі"""
+        while path and path != '/':
+            self.session.known_dirs.add(path)
+            path = os.path.dirname(path)
+
+    def _ensure_dir(self, path: str):
+        path = path.rstrip('/')
+        if not path:
+            return
+        if path in self.session.known_dirs:
+            self.pool.count('dir_cache_hits')
+            return
+
+        # Якщо існує найглибша папка, існують і всі батьківські - один запит замість обходу
+        self.pool.count('dir_round_trips')
+        try:
+            self.sftp.stat(path)
+            logger.debug(f"✅ Папка існує: {path}")
+            self._remember_dir(path)
+            return
+        except (IOError, OSError):
+            pass
+
+        self._ensure_dir(os.path.dirname(path))
+        self.pool.count('dir_round_trips')
+        try:
+            self.sftp.mkdir(path)
+            logger.info(f"✅ Створено папку: {path}")
+        except Exception as mkdir_error:
+            # Не кешуємо: наступна відправка перевірить папку знову
+            logger.warning(f"⚠️ Не вдалося створити папку {path}: {mkdir_error}")
+            return
+        self._remember_dir(path)
+
+    def ensure_dirs(self, remote_dirs):
+        """Створює відсутні папки (відомі папки сесії не перевіряються повторно)"""
+        # Від коротших до довших, щоб батьківські потрапили в кеш першими
+        for remote_dir in sorted(set(remote_dirs), key=len):
+            self._ensure_dir(remote_dir)
+
+    def _reconnect(self) -> bool:
+        """Замінює розірвану сесію новою (для докачування після збою мережі)"""
+        if self.session is not None:
+            self.session.close()
+            self.pool.release(self.session)
+        self.session = self.pool.acquire()
+        return self.session is not None
+
+    def remote_sha256(self, remote_path: str) -> Optional[str]:
+        """sha256 файлу на сервері через exec (None, якщо сервер не дозволяє команди або хеш невідомий)
+
+        Підтримка exec вимикається лише коли сервер відмовив у першій перевірці.
+        Таймаут чи розірваний канал - хеш невідомий лише для цього файлу.
+        """
+        if self.pool.remote_hash_supported is False:
+            return None
+        try:
+            _, stdout, _ = self.session.ssh.exec_command(f"sha256sum {shlex.quote(remote_path)}", timeout=60)
+            output = stdout.read().decode('utf-8', 'replace').split()
+            exit_status = stdout.channel.recv_exit_status()
+        except paramiko.SSHException as e:
+            # Storage Box на порту 22 дозволяє лише SFTP - сервер закриває канал exec
+            if self.pool.remote_hash_supported is None:
+                logger.debug(f"sha256sum на сервері недоступний: {e}")
+                self.pool.remote_hash_supported = False
+            else:
+                logger.warning(f"⚠️ sha256sum для {remote_path} не виконано: {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ sha256sum для {remote_path} не виконано: {e}")
+            return None
+
+        if exit_status == 0 and output and len(output[0]) == 64:
+            self.pool.remote_hash_supported = True
+            return output[0]
+        if self.pool.remote_hash_supported is None:
+            # Команди заборонені - перевіряємо тоді тільки розмір
+            self.pool.remote_hash_supported = False
+        return None
+
+    def _put_resumable(self, local_path: str, full_remote_path: str, callback=None):
+        """Відправка в .part з докачуванням з місця зупинки"""
+        part_path = full_remote_path + PART_SUFFIX
+        local_stat = os.stat(local_path)
+        total = local_stat.st_size
+        source_version = (local_stat.st_size, local_stat.st_mtime)
+
+        offset = 0
+        if self.pool.partial_transfers.get(part_path) == source_version:
+            try:
+                offset = self.sftp.stat(part_path).st_size
+            except (IOError, OSError):
+                offset = 0
+        if offset > total:
+            offset = 0
+        self.pool.partial_transfers[part_path] = source_version
+        if offset:
+            self.pool.count('resumed_transfers')
+            self.pool.count('resumed_bytes', offset)
+            logger.info(f"⏯️ Докачування {full_remote_path} з {offset} байт")
+
+        start = time.perf_counter()
+        with open(local_path, 'rb') as local_file, \
+                self.sftp.open(part_path, 'ab' if offset else 'wb') as remote_file:
+            # Конвеєрний запис: не чекаємо підтвердження кожного блоку
+            remote_file.set_pipelined(True)
+            local_file.seek(offset)
+            transferred = offset
+            while True:
+                chunk = local_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                remote_file.write(chunk)
+                transferred += len(chunk)
+                if callback:
+                    callback(transferred, total)
+
+        self.pool.count('transfer_bytes', transferred - offset)
+        self.pool.count('transfer_seconds', time.perf_counter() - start)
+        return part_path, total
+
+    def _verify_and_rename(self, local_path: str, part_path: str, full_remote_path: str, total: int) -> bool:
+        remote_size = self.sftp.stat(part_path).st_size
+        if remote_size != total:
+            raise IOError(f"розмір не збігається: {remote_size} != {total}")
+
+        remote_hash = self.remote_sha256(part_path)
+        if remote_hash is not None:
+            valid = remote_hash == file_sha256(local_path)
+        else:
+            # Без sha256sum на сервері порівнюємо хвіст файлу (там, де закінчилось докачування)
+            valid = self._tail_matches(local_path, part_path, total)
+        if not valid:
+            self.pool.count('verify_failures')
+            # Пошкоджений .part не можна докачувати - починаємо з нуля
+            self.pool.partial_transfers.pop(part_path, None)
+            self.sftp.remove(part_path)
+            raise IOError("контрольна сума не збігається")
+
+        try:
+            self.sftp.posix_rename(part_path, full_remote_path)
+        except (IOError, OSError):
+            # Сервер без posix-rename: звичайний rename не перезаписує існуючий файл
+            try:
+                self.sftp.remove(full_remote_path)
+            except (IOError, OSError):
+                pass
+            self.sftp.rename(part_path, full_remote_path)
+        self.pool.partial_transfers.pop(part_path, None)
+        return True
+
+    def _tail_matches(self, local_path: str, part_path: str, total: int, tail: int = 64 * 1024) -> bool:
+        start = max(0, total - tail)
+        with open(local_path, 'rb') as local_file, self.sftp.open(part_path, 'rb') as remote_file:
+            local_file.seek(start)
+            remote_file.seek(start)
+            return local_file.read(tail) == remote_file.read(tail)
+
+    def upload_file(self, local_path, remote_filename, callback=None):
+        # Визначаємо повний шлях (може містити підпапки, наприклад logs/bot_2025-10-08.log)
+        full_remote_path = STORAGE_BOX_PATH + remote_filename
+
+        for attempt in range(TRANSFER_ATTEMPTS):
+            try:
+                self.ensure_dirs([os.path.dirname(full_remote_path)])
+
+                # Завантажуємо файл у тимчасове ім'я та перейменовуємо після перевірки
+                part_path, total = self._put_resumable(local_path, full_remote_path, callback)
+                self._verify_and_rename(local_path, part_path, full_remote_path, total)
+
+                logger.info(f"✅ Файл {local_path} успішно завантажено на Storage Box як {remote_filename}")
+                return True
+            except TransferCancelled:
+                logger.warning(f"⏹️ Завантаження {remote_filename} перервано (докачається при наступній спробі)")
+                return False
+            except Exception as e:
+                # Папку могли видалити на сервері - наступна спроба перевірить знову
+                self.session.known_dirs.clear()
+                logger.error(f"❌ Помилка завантаження файлу (спроба {attempt + 1}): {e}")
+                if not self.session.is_active() and not self._reconnect():
+                    return False
+        return False
+
+    def upload_files(self, files, callback=None, results=None):
+        """Завантажує кілька файлів [(local_path, remote_filename)], папки створюються одним проходом"""
+        try:
+            self.ensure_dirs(os.path.dirname(STORAGE_BOX_PATH + remote) for _, remote in files)
+        except Exception as e:
+            logger.error(f"❌ Помилка створення папок: {e}")
+        return super().upload_files(files, callback=callback, results=results)
+
+    def list_dir(self, remote_dir=""):
+        try:
+            # listdir_iter читає записи пачками по мірі надходження, без очікування всієї відповіді
+            return [attr.filename for attr in self.sftp.listdir_iter(os.path.join(STORAGE_BOX_PATH, remote_dir))]
+        except (IOError, OSError):
+            if not remote_dir:
+                logger.warning(f"⚠️ Папка {STORAGE_BOX_PATH} не існує - повертаю порожній список")
+            return []
+
+    def file_exists(self, remote_filename):
+        try:
+            self.sftp.stat(os.path.join(STORAGE_BOX_PATH, remote_filename))
+            return True
+        except (IOError, OSError):
+            return False
+        except Exception as e:
+            logger.error(f"Помилка перевірки файлу {remote_filename}: {e}")
+            return False
+
+    def stat_file(self, remote_filename):
+        """(розмір, час зміни) файлу на сервері або None, якщо файлу немає"""
+        try:
+            attrs = self.sftp.stat(os.path.join(STORAGE_BOX_PATH, remote_filename))
+            return attrs.st_size, attrs.st_mtime
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            logger.error(f"Помилка перевірки файлу {remote_filename}: {e}")
+            return None
+
+    def read_range(self, remote_filename, offset, length):
+        """Читає діапазон байтів файлу на сервері без скачування всього файлу"""
+        try:
+            with self.sftp.open(os.path.join(STORAGE_BOX_PATH, remote_filename), 'rb') as remote_file:
+                remote_file.seek(offset)
+                return remote_file.read(length)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Помилка читання {remote_filename} [{offset}:{offset + length}]: {e}")
+            return None
+
+    def delete_file(self, remote_filename):
+        try:
+            self.sftp.remove(os.path.join(STORAGE_BOX_PATH, remote_filename))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Помилка видалення {remote_filename}: {e}")
+            return False
+        return True
+
+    def _get_resumable(self, remote_path: str, part_path: str, callback=None) -> int:
+        """Скачування в .part з докачуванням з місця зупинки"""
+        remote_stat = self.sftp.stat(remote_path)
+        total = remote_stat.st_size
+        source_version = (remote_stat.st_size, remote_stat.st_mtime)
+
+        offset = 0
+        if self.pool.partial_transfers.get(part_path) == source_version and os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+        if offset > total:
+            offset = 0
+        self.pool.partial_transfers[part_path] = source_version
+        if offset:
+            self.pool.count('resumed_transfers')
+            self.pool.count('resumed_bytes', offset)
+
+        start = time.perf_counter()
+        with self.sftp.open(remote_path, 'rb') as remote_file, \
+                open(part_path, 'ab' if offset else 'wb') as local_file:
+            remote_file.seek(offset)
+            # Попереднє читання наперед: кілька запитів у польоті замість одного
+            remote_file.prefetch(total)
+            transferred = offset
+            while True:
+                chunk = remote_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                local_file.write(chunk)
+                transferred += len(chunk)
+                if callback:
+                    callback(transferred, total)
+
+        self.pool.count('transfer_bytes', transferred - offset)
+        self.pool.count('transfer_seconds', time.perf_counter() - start)
+        return total
+
+    def download_file(self, remote_filename, callback=None):
+        remote_path = os.path.join(STORAGE_BOX_PATH, remote_filename)
+
+        # Ім'я може містити підпапки, наприклад segments/...
+        local_path = local_download_path(remote_filename)
+        part_path = local_path + PART_SUFFIX
+
+        for attempt in range(TRANSFER_ATTEMPTS):
+            try:
+                total = self._get_resumable(remote_path, part_path, callback)
+
+                if os.path.getsize(part_path) != total:
+                    raise IOError(f"розмір не збігається: {os.path.getsize(part_path)} != {total}")
+                remote_hash = self.remote_sha256(remote_path)
+                if remote_hash is not None and remote_hash != file_sha256(part_path):
+                    self.pool.count('verify_failures')
+                    os.remove(part_path)
+                    raise IOError("контрольна сума не збігається")
+
+                os.replace(part_path, local_path)
+                self.pool.partial_transfers.pop(part_path, None)
+                return local_path
+            except TransferCancelled:
+                logger.warning(f"⏹️ Скачування {remote_filename} перервано")
+                return None
+            except FileNotFoundError:
+                logger.error(f"Файл {remote_filename} не знайдено на сервері")
+                return None
+            except Exception as e:
+                logger.error(f"Помилка скачування файлу {remote_filename} (спроба {attempt + 1}): {e}")
+                if not self.session.is_active() and not self._reconnect():
+                    return None
+        return None
+
+    def close(self):
+        if self.session is not None:
+            self.pool.release(self.session)
+            self.session = None
+
+
+# Обмеження швидкості відправки бекапів (налаштовується ботом)
+upload_shaper = BandwidthShaper()
+
+
+def shaped_callback(shaper: BandwidthShaper, cancel: Optional[threading.Event] = None) -> Callable[[int, int], None]:
+    """Callback передачі, що обмежує швидкість приростом переданих байт"""
+    last_transferred = [None]
+
+    def callback(transferred: int, total: int):
+        if cancel is not None and cancel.is_set():
+            raise TransferCancelled()
+        previous = last_transferred[0]
+        # Перший виклик для файлу (або наступний файл пачки) може містити докачаний зсув
+        delta = min(transferred, CHUNK_SIZE) if previous is None or transferred < previous else transferred - previous
+        last_transferred[0] = transferred
+        shaper.throttle(delta)
+
+    return callback
+
+
+def upload_timeout(local_paths: List[str], shaper: BandwidthShaper = upload_shaper) -> float:
+    """Таймаут відправки файлів з урахуванням розміру
+
+    Ліміт знижується при затримці повідомлень аж до min_rate навіть без
+    заданого ліміту, тому таймаут розрахований на передачу на min_rate.
+    """
+    total = 0
+    for local_path in local_paths:
+        try:
+            total += os.path.getsize(local_path)
+        except OSError:
+            pass
+    return max(TRANSFER_TIMEOUT, total / shaper.min_rate * TRANSFER_TIMEOUT_MARGIN)
+
+
+# Спільні екземпляри цілей без стану сесії (SFTP ціль тримає сесію, тому створюється щоразу)
+_shared_targets: Dict[str, BackupTarget] = {}
+
+
+def create_backup_target(kind: Optional[str] = None) -> BackupTarget:
+    """Ціль бекапу за BACKUP_TARGET (sftp, local або s3)
+
+    Зашифрована, якщо задано ключ; файли запакованих місяців читаються з архіву.
+    """
+    target = _plain_backup_target(kind or BACKUP_TARGET)
+    if BACKUP_ENCRYPTION_KEY:
+        target = EncryptedTarget(target, BACKUP_ENCRYPTION_KEY)
+    return ArchiveAwareTarget(target)
+
+
+def _plain_backup_target(kind: str) -> BackupTarget:
+    if kind == "sftp":
+        return StorageBoxManager()
+    if kind not in _shared_targets:
+        if kind == "local":
+            _shared_targets[kind] = LocalDirectoryTarget(BACKUP_LOCAL_PATH)
+        elif kind == "s3":
+            _shared_targets[kind] = S3Target(
+                BACKUP_S3_BUCKET, BACKUP_S3_PREFIX,
+                endpoint_url=BACKUP_S3_ENDPOINT,
+                access_key=BACKUP_S3_ACCESS_KEY,
+                secret_key=BACKUP_S3_SECRET_KEY,
+                region=BACKUP_S3_REGION
+            )
+        else:
+            logger.error(f"❌ Невідома ціль бекапу BACKUP_TARGET={kind} - використовую sftp")
+            return StorageBoxManager()
+    return _shared_targets[kind]
+
+
+# Окремий пул потоків для SFTP, щоб передачі не займали стандартний executor event loop
+storage_executor = ThreadPoolExecutor(
+    max_workers=storage_pool.max_sessions + 1,
+    thread_name_prefix="storage_box"
+)
+
+
+class AsyncStorageBox:
+    """Асинхронний API цілі бекапу (за замовчуванням - BACKUP_TARGET)
+
+    Кожна операція виконується в storage_executor, тому paramiko/boto3 не
+    блокують event loop. Операції обмежені таймаутом; при таймауті або
+    скасуванні задачі передача переривається через callback прогресу.
+    """
+
+    def __init__(self, target: Optional[BackupTarget] = None):
+        self.manager = target or create_backup_target()
+        self._cancel = threading.Event()
+        self._pending: Optional[asyncio.Future] = None
+        # Підключення перервано, а потік ще чекає на пул - сесію поверне done-callback
+        self._abandoned_connect = False
+
+    async def _call(self, func: Callable, *args, timeout: float = OPERATION_TIMEOUT, default: Any = None, **kwargs):
+        if self._pending is not None and not self._pending.done():
+            # Перервана операція ще працює з сесією - друга операція на ній зіпсувала б обидві
+            logger.error(f"❌ Операція Storage Box {func.__name__} відхилена: попередня ще не завершилась")
+            return default
+        loop = asyncio.get_running_loop()
+        self._cancel.clear()
+        self._pending = loop.run_in_executor(storage_executor, functools.partial(func, *args, **kwargs))
+        try:
+            # shield - потік все одно не зупинити, тому чекаємо його завершення в close()
+            return await asyncio.wait_for(asyncio.shield(self._pending), timeout)
+        except asyncio.TimeoutError:
+            self._cancel.set()
+            logger.error(f"⏱️ Операція Storage Box {func.__name__} перевищила таймаут {timeout}с")
+            return default
+        except asyncio.CancelledError:
+            self._cancel.set()
+            raise
+
+    def _progress(self, on_progress: Optional[Callable[[int], Awaitable[Any]]], step: int = 20,
+                  shaper: Optional[BandwidthShaper] = None):
+        """Callback передачі: перевіряє скасування, обмежує швидкість та повідомляє прогрес в event loop"""
+        loop = asyncio.get_running_loop()
+        last_reported = [0]
+        shaped = shaped_callback(shaper) if shaper is not None else None
+
+        def callback(transferred: int, total: int):
+            if self._cancel.is_set():
+                raise TransferCancelled()
+            if shaped is not None:
+                shaped(transferred, total)
+            if on_progress is None or not total:
+                return
+            percent = transferred * 100 // total
+            if percent - last_reported[0] >= step and percent < 100:
+                last_reported[0] = percent
+                asyncio.run_coroutine_threadsafe(on_progress(percent), loop)
+
+        return callback
+
+    async def connect(self) -> bool:
+        """Отримує сесію (після False або скасування сесії немає, close() безпечний)"""
+        try:
+            connected = await self._call(self.manager.connect, default=None)
+        except asyncio.CancelledError:
+            self._release_abandoned_connect()
+            raise
+        if connected is None:
+            # Таймаут: pool.acquire може чекати довше (слот + кілька спроб з'єднання)
+            self._release_abandoned_connect()
+            return False
+        return connected
+
+    def _release_abandoned_connect(self):
+        """Повертає в пул сесію, яку потік підключення отримає вже після відмови"""
+        pending = self._pending
+        if pending is None or pending.done():
+            self.manager.close()
+            return
+        self._abandoned_connect = True
+        pending.add_done_callback(lambda _: self.manager.close())
+
+    async def list_files(self) -> List[str]:
+        files = await self._call(self.manager.list_files, default=[])
+        if files:
+            listing_cache.set(files)
+        return files
+
+    async def list_dir(self, remote_dir: str = "") -> List[str]:
+        return await self._call(self.manager.list_dir, remote_dir, default=[])
+
+    async def load_toc(self, month: str) -> Optional[dict]:
+        """Зміст архіву місяця (None - місяць не запаковано)"""
+        return await self._call(self.manager.load_toc, month, default=None)
+
+    async def file_exists(self, remote_filename: str) -> bool:
+        return await self._call(self.manager.file_exists, remote_filename, default=False)
+
+    async def stat_file(self, remote_filename: str) -> Optional[tuple]:
+        return await self._call(self.manager.stat_file, remote_filename, default=None)
+
+    async def read_range(self, remote_filename: str, offset: int, length: int) -> Optional[bytes]:
+        return await self._call(self.manager.read_range, remote_filename, offset, length, default=None)
+
+    async def upload_file(self, local_path: str, remote_filename: str,
+                          on_progress: Optional[Callable[[int], Awaitable[Any]]] = None,
+                          timeout: Optional[float] = None) -> bool:
+        if timeout is None:
+            timeout = upload_timeout([local_path])
+        callback = self._progress(on_progress, shaper=upload_shaper)
+        uploaded = await self._call(self.manager.upload_file, local_path, remote_filename,
+                                    callback=callback, timeout=timeout, default=False)
+        if uploaded:
+            listing_cache.note_upload(remote_filename)
+        return uploaded
+
+    async def upload_files(self, files: List[tuple], timeout: Optional[float] = None) -> List[bool]:
+        if timeout is None:
+            timeout = upload_timeout([local_path for local_path, _ in files])
+        callback = self._progress(None, shaper=upload_shaper)
+        # Після таймауту default - ті самі results: відправлені до переривання файли позначені True
+        results = [False] * len(files)
+        uploaded = await self._call(self.manager.upload_files, files,
+                                    callback=callback, results=results, timeout=timeout, default=results)
+        for (_, remote_filename), ok in zip(files, uploaded):
+            if ok:
+                listing_cache.note_upload(remote_filename)
+        return uploaded
+
+    async def delete_file(self, remote_filename: str) -> bool:
+        return await self._call(self.manager.delete_file, remote_filename, default=False)
+
+    async def download_file(self, remote_filename: str,
+                            on_progress: Optional[Callable[[int], Awaitable[Any]]] = None,
+                            timeout: float = TRANSFER_TIMEOUT) -> Optional[str]:
+        callback = self._progress(on_progress)
+        return await self._call(self.manager.download_file, remote_filename,
+                                callback=callback, timeout=timeout, default=None)
+
+    async def close(self):
+        if self._abandoned_connect:
+            # Сесію (якщо потік її отримає) поверне done-callback підключення
+            return
+        # Сесію можна повернути в пул лише після завершення перерваної передачі
+        if self._pending is not None and not self._pending.done():
+            self._cancel.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._pending), OPERATION_TIMEOUT)
+            except asyncio.CancelledError:
+                # Закриття перервано (повторне скасування задачі) - сесію поверне done-callback
+                self._pending.add_done_callback(lambda _: self.manager.close())
+                raise
+            except Exception:
+                # Потік завис - розриваємо з'єднання (пул SFTP відкине розірвану сесію)
+                self.manager.abort()
+        self.manager.close()
@@ -0,0 +1,168 @@
+"""
+🧾 МАНІФЕСТ ВІДПРАВЛЕНИХ ФАЙЛІВ
+Ім'я файлу на сервері -> розмір, час зміни та sha256 локальної копії.
+Незмінені файли не відправляються повторно, а очищення видаляє лише ті
+локальні файли, які маніфест підтверджує як відправлені
+"""
+
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REMOTE_MANIFEST_NAME = "upload_manifest.json"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadManifest:
+    """Маніфест відправлених файлів (локальна копія + копія на сервері)"""
+
+    def __init__(self, manifest_file: str = "upload_manifest.json"):
+        self.manifest_file = manifest_file
+        self.entries: Dict[str, Dict[str, Any]] = self.load()
+        self.stats = {'uploaded': 0, 'skipped': 0, 'failed': 0, 'hashed': 0}
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Помилка читання маніфесту відправлених файлів: {e}")
+        return {}
+
+    def save(self):
+        try:
+            with open(self.manifest_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Помилка збереження маніфесту відправлених файлів: {e}")
+
+    def _fingerprint(self, local_path: str, entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Розмір, час зміни та хеш (хеш рахується лише якщо розмір або час змінились)"""
+        stat = os.stat(local_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': entry['sha256']}
+        self.stats['hashed'] += 1
+        return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': file_sha256(local_path)}
+
+    def is_uploaded(self, local_path: str, remote_name: str) -> bool:
+        """Чи збігається локальний файл з уже відправленою версією"""
+        entry = self.entries.get(remote_name)
+        if not entry or not os.path.exists(local_path):
+            return False
+        fingerprint = self._fingerprint(local_path, entry)
+        if fingerprint['sha256'] != entry['sha256']:
+            return False
+        if fingerprint['mtime'] != entry['mtime']:
+            # Вміст той самий, змінився лише час - оновлюємо, щоб не хешувати знову
+            entry['mtime'] = fingerprint['mtime']
+        return True
+
+    def mark_uploaded(self, remote_name: str, fingerprint: Dict[str, Any]):
+        self.entries[remote_name] = {**fingerprint, 'uploaded_at': datetime.now().isoformat()}
+
+    async def upload(self, storage_box, files: List[Tuple[str, str]],
+                     on_progress: Optional[Callable[[str, int], Awaitable[Any]]] = None,
+                     transform: Optional[Callable[[str, str], str]] = None,
+                     push_manifest: bool = True) -> Dict[str, List[str]]:
+        """Відправляє лише змінені файли [(local_path, remote_name)] через підключений AsyncStorageBox
+
+        transform(local_path, remote_name) повертає шлях до копії, яку треба відправити
+        замість оригіналу (маніфест все одно відстежує оригінал).
+        push_manifest=False - копію маніфесту на сервері оновить викликач (паралельні відправки).
+        Повертає {"uploaded": [...], "skipped": [...], "failed": [...]} з іменами на сервері.
+        """
+        result = {'uploaded': [], 'skipped': [], 'failed': []}
+        changed = []
+        fingerprints = []
+        for local_path, remote_name in files:
+            if self.is_uploaded(local_path, remote_name):
+                result['skipped'].append(remote_name)
+            else:
+                changed.append((local_path, remote_name))
+                # Відбиток до відправки: якщо файл зміниться під час передачі, наступний бекап його повторить
+                fingerprints.append(self._fingerprint(local_path, self.entries.get(remote_name)))
+
+        if transform:
+            changed_uploads = [(transform(local_path, remote_name), remote_name) for local_path, remote_name in changed]
+        else:
+            changed_uploads = changed
+
+        if on_progress:
+            uploaded = []
+            for local_path, remote_name in changed_uploads:
+                progress = lambda percent, name=remote_name: on_progress(name, percent)
+                uploaded.append(await storage_box.upload_file(local_path, remote_name, on_progress=progress))
+        else:
+            # Без прогресу - однією пачкою, папки перевіряються один раз
+            uploaded = await storage_box.upload_files(changed_uploads) if changed_uploads else []
+
+        for (_, remote_name), fingerprint, ok in zip(changed, fingerprints, uploaded):
+            if ok:
+                # Розмір і час зміни на сервері - щоб помітити, якщо файл перезапише інший хост
+                remote_stat = await storage_box.stat_file(remote_name)
+                self.mark_uploaded(remote_name, {**fingerprint, 'remote': list(remote_stat) if remote_stat else None})
+                result['uploaded'].append(remote_name)
+            else:
+                result['failed'].append(remote_name)
+
+        for key in result:
+            self.stats[key] += len(result[key])
+
+        self.save()
+        if result['uploaded'] and push_manifest:
+            await self.push(storage_box)
+        if result['skipped']:
+            logger.info(f"🧾 Пропущено незмінених файлів: {len(result['skipped'])}")
+        return result
+
+    async def push(self, storage_box) -> bool:
+        """Копія маніфесту на сервері - щоб після переїзду на новий хост не відправляти все заново"""
+        return await storage_box.upload_file(self.manifest_file, REMOTE_MANIFEST_NAME)
+
+    async def pull(self, storage_box) -> int:
+        """Доповнює локальний маніфест копією з сервера (підключений AsyncStorageBox)"""
+        if not await storage_box.file_exists(REMOTE_MANIFEST_NAME):
+            return 0
+        local_path = await storage_box.download_file(REMOTE_MANIFEST_NAME)
+        if not local_path:
+            return 0
+        try:
+            with open(local_path, 'r', encoding='utf-8') as f:
+                remote_entries = json.load(f)
+        finally:
+            os.remove(local_path)
+
+        added = 0
+        for remote_name, entry in remote_entries.items():
+            if remote_name not in self.entries:
+                self.entries[remote_name] = entry
+                added += 1
+        if added:
+            self.save()
+            logger.info(f"🧾 Маніфест доповнено з сервера: {added} файлів")
+        return added
+
+    def remote_matches(self, remote_name: str, remote_stat) -> bool:
+        """Чи файл на сервері - саме та версія, яку відправили ми"""
+        entry = self.entries.get(remote_name)
+        return bool(entry and entry.get('remote') and tuple(entry['remote']) == tuple(remote_stat))
+
+    def confirmed(self, local_path: str, remote_name: str) -> bool:
+        """Чи можна видалити локальний файл (відправлена саме ця версія)"""
+        return self.is_uploaded(local_path, remote_name)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'files': len(self.entries)}
@@ -0,0 +1,110 @@
+"""
+🔍 ФІЛЬТРИ ПЕРЕГЛЯДАЧА
+Вторинні індекси файлу дня: позиції повідомлень за чатом, відправником та
+напрямком, плюс нижній регістр текстів для пошуку підрядка. Індекс
+будується один раз на файл, результати фільтрів кешуються, тому перемикання
+фільтрів та гортання сторінок не перебирає весь список повідомлень.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ('in', 'out')
+FILTER_FIELDS = ('chat', 'sender', 'direction', 'text')
+
+
+def filter_key(view_filter: Dict[str, Any]) -> Tuple:
+    return tuple(view_filter.get(field) for field in FILTER_FIELDS)
+
+
+def describe_filter(view_filter: Dict[str, Any], index: Optional["FilterIndex"] = None) -> str:
+    """Підпис активного фільтра ("" - без фільтра)"""
+    parts = []
+    if view_filter.get('chat') is not None:
+        title = index.chat_titles.get(view_filter['chat']) if index else None
+        parts.append(f"💬 {title or view_filter['chat']}")
+    if view_filter.get('sender') is not None:
+        name = index.sender_names.get(view_filter['sender']) if index else None
+        parts.append(f"👤 {name or view_filter['sender']}")
+    if view_filter.get('direction') == 'in':
+        parts.append("⬅️ вхідні")
+    elif view_filter.get('direction') == 'out':
+        parts.append("➡️ вихідні")
+    if view_filter.get('text'):
+        parts.append(f"🔎 \"{view_filter['text']}\"")
+    return ", ".join(parts)
+
+
+class FilterIndex:
+    """Позиції повідомлень файлу за чатом, відправником та напрямком"""
+
+    def __init__(self, max_results: int = 32):
+        self.count = 0
+        self.by_chat: Dict[int, List[int]] = {}
+        self.by_sender: Dict[int, List[int]] = {}
+        self.by_direction: Dict[str, List[int]] = {direction: [] for direction in DIRECTIONS}
+        self.chat_titles: Dict[int, str] = {}
+        self.sender_names: Dict[int, str] = {}
+        self.texts: List[str] = []
+        self.max_results = max_results
+        self._results: "OrderedDict[Tuple, List[int]]" = OrderedDict()
+
+    def add(self, message_data: Dict[str, Any]):
+        position = self.count
+        self.count += 1
+
+        chat_id = int(message_data.get('chat_id') or 0)
+        self.by_chat.setdefault(chat_id, []).append(position)
+        self.chat_titles.setdefault(chat_id, message_data.get('chat_title') or str(chat_id))
+
+        sender_id = int(message_data.get('from_user_id') or 0)
+        self.by_sender.setdefault(sender_id, []).append(position)
+        self.sender_names.setdefault(sender_id, message_data.get('from_first_name') or str(sender_id))
+
+        self.by_direction['out' if message_data.get('is_outgoing') else 'in'].append(position)
+        self.texts.append((message_data.get('text') or '').lower())
+
+    def select(self, view_filter: Dict[str, Any]) -> List[int]:
+        """Відсортовані позиції повідомлень, що відповідають фільтру"""
+        key = filter_key(view_filter)
+        cached = self._results.get(key)
+        if cached is not None:
+            self._results.move_to_end(key)
+            return cached
+
+        candidates = []
+        if view_filter.get('chat') is not None:
+            candidates.append(self.by_chat.get(view_filter['chat'], []))
+        if view_filter.get('sender') is not None:
+            candidates.append(self.by_sender.get(view_filter['sender'], []))
+        if view_filter.get('direction') in DIRECTIONS:
+            candidates.append(self.by_direction[view_filter['direction']])
+
+        if candidates:
+            # Перетин починається з найкоротшого списку
+            candidates.sort(key=len)
+            others = [set(positions) for positions in candidates[1:]]
+            positions = [p for p in candidates[0] if all(p in other for other in others)]
+        else:
+            positions = list(range(self.count))
+
+        text = (view_filter.get('text') or '').lower()
+        if text:
+            positions = [p for p in positions if text in self.texts[p]]
+
+        self._results[key] = positions
+        if len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+        return positions
+
+    def top_chats(self, limit: int = 20) -> List[Tuple[int, str, int]]:
+        """[(chat_id, назва, кількість)] за кількістю повідомлень"""
+        ranked = sorted(self.by_chat.items(), key=lambda item: len(item[1]), reverse=True)[:limit]
+        return [(chat_id, self.chat_titles[chat_id], len(positions)) for chat_id, positions in ranked]
+
+    def top_senders(self, limit: int = 20) -> List[Tuple[int, str, int]]:
+        ranked = sorted(self.by_sender.items(), key=lambda item: len(item[1]), reverse=True)[:limit]
+        return [(sender_id, self.sender_names[sender_id], len(positions)) for sender_id, positions in ranked]
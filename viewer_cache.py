@@ -0,0 +1,167 @@
+"""
+🧠 КЕШ ПЕРЕГЛЯДАЧА В ПАМ'ЯТІ
+LRU кеш з TTL та бюджетом у байтах для відкритих у переглядачі файлів.
+Розмір записів оцінюється приблизно (рядки, словники та списки повідомлень),
+тому кеш не росте без меж навіть коли відкривають великі дні.
+Готові екрани (текст та клавіатура) кешуються окремо з версією файлу у
+ключі: запис або об'єднання файлу збільшує його версію, і старі екрани цього
+файлу більше не читаються, а екрани інших днів лишаються в кеші.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def approx_size(value: Any) -> int:
+    """Приблизний розмір об'єкта в пам'яті (байти)"""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return 33 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 56 + 8 * len(value) + sum(approx_size(item) for item in value)
+    return 28
+
+
+class ByteBudgetCache:
+    """LRU кеш з TTL та обмеженням сумарного розміру записів"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 1800.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Ключ -> {'value', 'bytes', 'expires'}; порядок - від найдавніше використаного
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'evicted_bytes': 0}
+
+    def __contains__(self, key: str) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry['expires'] > time.time()
+
+    def keys(self) -> Iterator[str]:
+        return iter(list(self.entries.keys()))
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        if entry['expires'] <= time.time():
+            self.stats['expired'] += 1
+            self.pop(key)
+            return None
+
+        self.stats['hits'] += 1
+        entry['expires'] = time.time() + self.ttl
+        self.entries.move_to_end(key)
+        return entry['value']
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Значення без оновлення порядку LRU та статистики"""
+        entry = self.entries.get(key)
+        return entry['value'] if entry and entry['expires'] > time.time() else None
+
+    def put(self, key: str, value: Any, size: Optional[int] = None):
+        self.pop(key)
+        size = approx_size(value) if size is None else size
+        self.entries[key] = {'value': value, 'bytes': size, 'expires': time.time() + self.ttl}
+        self.total_bytes += size
+        self._evict(keep=key)
+
+    def add_bytes(self, key: str, size: int):
+        """Враховує дочитані в запис дані (наприклад, нові сторінки файлу)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry['bytes'] += size
+        self.total_bytes += size
+        self._evict(keep=key)
+
+    def pop(self, key: str) -> Optional[Any]:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        self.total_bytes -= entry['bytes']
+        return entry['value']
+
+    def clear_expired(self) -> int:
+        now = time.time()
+        expired = [key for key, entry in self.entries.items() if entry['expires'] <= now]
+        for key in expired:
+            self.pop(key)
+        self.stats['expired'] += len(expired)
+        if expired:
+            logger.debug(f"🧹 Кеш переглядача: видалено {len(expired)} застарілих записів")
+        return len(expired)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Витісняє найдавніше використані записи, поки розмір перевищує бюджет"""
+        for key in list(self.entries.keys()):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                # Запис, більший за весь бюджет, залишається єдиним
+                continue
+            size = self.entries[key]['bytes']
+            self.pop(key)
+            self.stats['evictions'] += 1
+            self.stats['evicted_bytes'] += size
+            logger.debug(f"🧠 Витіснено з кешу переглядача: {key} ({size / 1024:.0f} КБ)")
+
+    def get_stats(self) -> dict:
+        requests = self.stats['hits'] + self.stats['misses'] + self.stats['expired']
+        return {
+            **self.stats,
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hit_rate': self.stats['hits'] / requests if requests else 0.0,
+        }
+
+
+class DataVersion:
+    """Лічильники змін даних: загальний та окремо для кожного файлу дня"""
+
+    def __init__(self):
+        self.value = 0
+        # Ім'я файлу -> загальна версія на момент його останньої зміни
+        self.files: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, filename: Optional[str] = None) -> int:
+        with self._lock:
+            self.value += 1
+            if filename is not None:
+                self.files[os.path.basename(filename)] = self.value
+            return self.value
+
+    def of(self, filename: str) -> int:
+        """Версія файлу (0 - файл не змінювався з запуску)"""
+        return self.files.get(os.path.basename(filename), 0)
+
+
+class RenderCache:
+    """Готові екрани переглядача: ключ (екран, ..., версія файлу) -> (текст, клавіатура)"""
+
+    # Приблизний розмір клавіатури (кнопки з підписами та callback_data)
+    MARKUP_BYTES = 1024
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, ttl: float = 600.0):
+        self.cache = ByteBudgetCache(max_bytes=max_bytes, ttl=ttl)
+
+    def get(self, key: tuple) -> Optional[Any]:
+        return self.cache.get(repr(key))
+
+    def put(self, key: tuple, text: str, reply_markup: Any):
+        self.cache.put(repr(key), (text, reply_markup), size=approx_size(text) + self.MARKUP_BYTES)
+
+    def get_stats(self) -> dict:
+        return self.cache.get_stats()
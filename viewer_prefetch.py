@@ -0,0 +1,84 @@
+"""
+🔮 ПОПЕРЕДНЄ ЗАВАНТАЖЕННЯ В ПЕРЕГЛЯДАЧІ
+Поки користувач читає сторінку, наступна сторінка та метадані сусідніх днів
+завантажуються у фоні. Кількість одночасних завантажень обмежена, а задачі,
+які вже не потрібні (користувач перейшов в інше місце), скасовуються.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+PrefetchJob = Callable[[], Awaitable[Any]]
+
+
+class ViewerPrefetcher:
+    """Фонові задачі попереднього завантаження, згруповані за користувачем"""
+
+    def __init__(self, max_concurrent: int = 2):
+        self.max_concurrent = max_concurrent
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # user_id -> {ключ задачі: asyncio.Task}
+        self.tasks: Dict[int, Dict[str, asyncio.Task]] = {}
+        self.stats = {'scheduled': 0, 'completed': 0, 'cancelled': 0, 'failed': 0, 'joined': 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Створюється в робочому циклі подій, а не під час імпорту
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def schedule(self, user_id: int, jobs: Dict[str, PrefetchJob]):
+        """Залишає лише задачі з jobs: зайві скасовуються, нові запускаються"""
+        self.cancel(user_id, keep=jobs.keys())
+        user_tasks = self.tasks.setdefault(user_id, {})
+        for key, job in jobs.items():
+            if key not in user_tasks:
+                user_tasks[key] = asyncio.create_task(self._run(user_id, key, job))
+                self.stats['scheduled'] += 1
+
+    async def _run(self, user_id: int, key: str, job: PrefetchJob):
+        try:
+            async with self._get_semaphore():
+                await job()
+            self.stats['completed'] += 1
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            logger.debug(f"🔮 Скасовано попереднє завантаження {key}")
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.debug(f"🔮 Помилка попереднього завантаження {key}: {e}")
+        finally:
+            user_tasks = self.tasks.get(user_id, {})
+            if user_tasks.get(key) is asyncio.current_task():
+                del user_tasks[key]
+                if not user_tasks:
+                    self.tasks.pop(user_id, None)
+
+    async def join(self, user_id: int, key: str):
+        """Чекає на задачу, яка вже завантажує потрібні дані (без повторного читання)"""
+        task = self.tasks.get(user_id, {}).get(key)
+        if task is None:
+            return
+        self.stats['joined'] += 1
+        # asyncio.wait не скасовує задачу, якщо скасують того, хто чекає
+        await asyncio.wait({task})
+
+    def cancel(self, user_id: int, keep: Iterable[str] = ()):
+        keep = set(keep)
+        for key, task in list(self.tasks.get(user_id, {}).items()):
+            if key not in keep:
+                task.cancel()
+
+    def cancel_all(self):
+        for user_id in list(self.tasks):
+            self.cancel(user_id)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            'active': sum(len(user_tasks) for user_tasks in self.tasks.values()),
+        }